@@ -0,0 +1,635 @@
+# benchmark
+""" The purpose of this script is to measure the scripts on large files, so that a
+change can be checked for making them faster or slower.
+
+    python benchmark.py suite --generate 1000000
+    python benchmark.py compression --bandwidth 50
+
+The suite times make_tab_delimited_tables( ) and the parse_* functions on a set of
+synthetic files (see generate_synthetic_data.py) for several shapes of criteria.
+Each case runs in a process of its own, which reports its wall time and peak
+resident memory; the rows of the source per second follow from those. The results
+are saved as JSON and compared with a stored baseline, and any case that has
+become slower or bigger by more than a tolerance is flagged (and the script exits
+with status 1). Save a baseline with --save-baseline before making a change.
+
+The compression benchmark measures what storing the tables compressed saves when
+they are read (see compressed_files.py). Each table in /covid_data/ is copied to a
+temporary directory plain, as gzip and (if the zstandard package is installed) as
+zstd, and each copy is read the way the parsing script reads it. For each format
+it reports the bytes read from storage, the time to read and parse the copy from
+the page cache, and an estimate of the time on storage that delivers a given
+bandwidth (e.g. a network share), which is where the smaller files pay off: 
+time = read time + bytes / bandwidth. 
+
+The parallel benchmark times parse_nyt_county_data_by_date( ) reading the NY Times
+text file with 1, 2, 4, ... worker processes (see tabulate_nyt_county_shards( ) in
+parse_datasets.py), checks that every count of workers gives the same table as
+one, and reports the speedup of each over one. The speedup is bounded by the cores
+of the machine (os.cpu_count( ), which is reported with the results). 
+
+    python benchmark.py parallel --data synthetic_data --workers 1 2 4 8 """
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from compressed_files import ( COMPRESSIONS, find_data_file, open_data_file,
+                                strip_compression, zstandard )
+from generate_synthetic_data import ( POSTAL_CODES, generate_synthetic_data,
+                                        synthetic_files_fields )
+from instrumentation import peak_rss_kb
+from parse_datasets import ( iterate_data_file, parse_atlantic_states_data,
+                            parse_census_county_data, parse_nyt_county_data_by_date )
+from update_covid_data import make_tab_delimited_tables
+
+# shapes of criteria the functions are timed with
+# dict { str name : dict { 'counties' : list of tuples ( str State, str County ),
+#   'states' : list of str states } }
+CRITERIA_SHAPES = { 'one county' : { 'counties' : [ ( 'Wisconsin', 'Dane' ) ],
+                                    'states' : [ 'Wisconsin' ] },
+                    'one state' : { 'counties' : [ ( 'Wisconsin', None ) ],
+                                    'states' : [ 'Wisconsin' ] },
+                    'one name in every state' : { 'counties' : [ ( None, 'Adams' ) ],
+                                                'states' : [ ] },
+                    'many counties' : { 'counties' : [ ( 'California', 'Los Angeles' ),
+                                            ( 'Illinois', 'Cook' ), ( 'Texas', 'Harris' ),
+                                            ( 'Arizona', 'Maricopa' ),
+                                            ( 'California', 'San Diego' ),
+                                            ( 'California', 'Orange' ),
+                                            ( 'Florida', 'Miami-Dade' ),
+                                            ( 'Texas', 'Dallas' ),
+                                            ( 'New York', 'Kings' ),
+                                            ( 'California', 'Riverside' ),
+                                            ( 'Washington', 'King' ),
+                                            ( 'Nevada', 'Clark' ),
+                                            ( 'Texas', 'Tarrant' ),
+                                            ( 'California', 'San Bernardino' ),
+                                            ( 'Texas', 'Bexar' ),
+                                            ( 'Florida', 'Broward' ),
+                                            ( 'Michigan', 'Wayne' ),
+                                            ( 'California', 'Santa Clara' ),
+                                            ( 'New York', 'Queens' ),
+                                            ( 'Wisconsin', 'Dane' ) ],
+                                        'states' : [ 'California', 'Illinois', 'Texas',
+                                            'Arizona', 'Florida', 'New York',
+                                            'Washington', 'Nevada', 'Michigan',
+                                            'Wisconsin' ] },
+                    'everything' : { 'counties' : [ ( None, None ) ],
+                                    'states' : sorted( POSTAL_CODES ) } }
+
+# functions of the suite and the tables they read
+# dict { str case function : list of str table names }
+SUITE_FUNCTIONS = { 'make_tab_delimited_tables' : [ 'nyt_us_counties', 'atl_historic_us',
+                                            'atl_historic_states', 'usc_counties_2019' ],
+                    'parse_nyt_county_data_by_date' : [ 'nyt_us_counties' ],
+                    'parse_nyt_county_data_by_date (cache)' : [ 'nyt_us_counties' ],
+                    'parse_census_county_data' : [ 'usc_counties_2019' ],
+                    'parse_atlantic_states_data' : [ 'atl_historic_us',
+                                                    'atl_historic_states' ] }
+
+MIN_SECONDS = 0.05  # float seconds a time must grow by to count as a regression
+
+def main( ):
+
+    parser = argparse.ArgumentParser( description = 'Measure the scripts on large '
+                                        'files.' )
+    commands = parser.add_subparsers( dest = 'command', required = True )
+
+    suite = commands.add_parser( 'suite', help = 'time the functions on synthetic '
+                                    'files and compare with a baseline' )
+    suite.add_argument( '--data', default = 'synthetic_data', metavar = 'DIR',
+                        help = 'directory of csv_data/ and covid_data/; '
+                        'DEFAULT %(default)s' )
+    suite.add_argument( '--generate', type = int, metavar = 'ROWS', help = 'first '
+                        'write synthetic files with this many NY Times lines' )
+    suite.add_argument( '--county-copies', default = 1, type = int, metavar = 'N',
+                        help = 'times each real county is repeated when generating; '
+                        'DEFAULT %(default)s' )
+    suite.add_argument( '--compression', default = '', choices = [ '', '.gz', '.zst' ],
+                        help = 'compress the generated files and the tables' )
+    suite.add_argument( '--repeats', default = 1, type = int,
+                        help = 'runs of each case (the fastest counts); '
+                        'DEFAULT %(default)s' )
+    suite.add_argument( '--results', default = 'benchmark_results.json', metavar = 'PATH',
+                        help = 'file to save the results to; DEFAULT %(default)s' )
+    suite.add_argument( '--baseline', default = 'benchmark_baseline.json',
+                        metavar = 'PATH', help = 'results to compare with; '
+                        'DEFAULT %(default)s' )
+    suite.add_argument( '--save-baseline', action = 'store_true',
+                        help = 'save the results as the baseline' )
+    suite.add_argument( '--tolerance', default = 0.2, type = float,
+                        help = 'fraction a time or memory may grow by before it is '
+                        'flagged; DEFAULT %(default)s' )
+
+    case = commands.add_parser( 'case', help = 'run one case of the suite (used by '
+                                    'suite in a process of its own)' )
+    case.add_argument( '--data', required = True, metavar = 'DIR' )
+    case.add_argument( '--function', required = True, choices = list( SUITE_FUNCTIONS ))
+    case.add_argument( '--shape', choices = list( CRITERIA_SHAPES ))
+    case.add_argument( '--compression', default = '' )
+
+    compression = commands.add_parser( 'compression', help = 'measure reading the '
+                                        'tables plain and compressed' )
+    compression.add_argument( '--tables', default = 'covid_data', metavar = 'DIR',
+                        help = 'directory of the tables; DEFAULT %(default)s' )
+    compression.add_argument( '--bandwidth', default = 100.0, type = float,
+                        metavar = 'MB/S', help = 'storage bandwidth of the estimate; '
+                        'DEFAULT %(default)s' )
+    compression.add_argument( '--repeats', default = 3, type = int,
+                        help = 'reads of each copy (the fastest counts); '
+                        'DEFAULT %(default)s' )
+
+    parallel = commands.add_parser( 'parallel', help = 'time reading the NY Times '
+                                    'text file with more worker processes' )
+    parallel.add_argument( '--data', default = 'synthetic_data', metavar = 'DIR',
+                        help = 'directory of covid_data/; DEFAULT %(default)s' )
+    parallel.add_argument( '--shape', default = 'everything', 
+                        choices = list( CRITERIA_SHAPES ), help = 'criteria shape; '
+                        'DEFAULT %(default)s' )
+    parallel.add_argument( '--workers', default = [ 1, 2, 4 ], type = int, nargs = '+',
+                        metavar = 'N', help = 'counts of workers to time; '
+                        'DEFAULT 1 2 4' )
+    parallel.add_argument( '--repeats', default = 3, type = int,
+                        help = 'runs of each count (the fastest counts); '
+                        'DEFAULT %(default)s' )
+
+    args = parser.parse_args( )
+
+    # a case only prints its measurements for the suite to read
+    if args.command == 'case':
+
+        print( json.dumps( run_case( args.data, args.function, args.shape,
+                                    args.compression )))
+
+        exit( )
+
+    if args.command == 'compression':
+
+        print( 'BENCHMARK THE COMPRESSED STORAGE' )
+
+        results = benchmark_compression( args.tables, args.bandwidth, args.repeats )
+
+        for line in format_compression_results( results, args.bandwidth ):
+            print( line )
+
+        print( ); print( )
+
+        exit( )
+
+    if args.command == 'parallel':
+
+        print( 'BENCHMARK THE PARALLEL READING' )
+
+        results = benchmark_parallel( args.data, args.shape, args.workers, args.repeats )
+
+        for line in format_parallel_results( results ):
+            print( line )
+
+        print( ); print( )
+
+        exit( 0 if all( result[ 'same' ] for result in results ) else 1 )
+
+    print( 'BENCHMARK THE SCRIPTS' )
+
+    if args.generate:
+        generate_synthetic_data( args.data, args.generate, args.county_copies,
+                                    compression = args.compression )
+
+    results = benchmark_suite( args.data, args.repeats, args.compression )
+    save_json( results, args.results )
+
+    baseline = load_json( args.baseline )
+    regressions = compare_with_baseline( results, baseline, args.tolerance )
+
+    for line in format_suite_results( results, baseline, regressions ):
+        print( line )
+
+    if args.save_baseline:
+        save_json( results, args.baseline )
+        print( f'Saved the results as the baseline {args.baseline}' )
+
+    print( ); print( )
+
+    exit( 1 if regressions else 0 )
+
+def benchmark_suite( dataPath = 'synthetic_data', repeats = 1, compression = '' ):
+    """ This function runs every case of the suite, each in a process of its own. 
+    The tables are made first, by the make_tab_delimited_tables( ) case. """
+    # ARGUMENT dataPath -> str directory of csv_data/ and covid_data/; DEFAULT
+    # ARGUMENT repeats -> int runs of each case; DEFAULT
+    # ARGUMENT compression -> str extension of the compression of the tables; 
+    #   DEFAULT none
+
+    # RETURN dict { 'created' : str, 'python' : str, 'rows' : dict { str table :
+    #   int lines }, 'cases' : dict { str case : dict { str measure : number }}}
+
+    results = { 'created' : datetime.datetime.now( ).isoformat( timespec = 'seconds' ),
+                'python' : platform.python_version( ), 'rows' : { }, 'cases' : { } }
+
+    for function, tables in SUITE_FUNCTIONS.items( ):
+
+        shapes = [ None ] if function == 'make_tab_delimited_tables' else CRITERIA_SHAPES
+
+        for shape in shapes:
+
+            name = function if shape is None else f'{function} | {shape}'
+            print( f'Running {name}...', end = ' ', flush = True )
+
+            runs = [ run_case_process( dataPath, function, shape, compression )
+                        for i in range( max( 1, repeats )) ]
+            best = min( runs, key = lambda run : run[ 'seconds' ] )
+
+            # the lines of the tables are counted once they have been made
+            for table in tables:
+                if table not in results[ 'rows' ]:
+                    results[ 'rows' ][ table ] = count_data_lines(
+                                                    f'{dataPath}/covid_data/{table}.txt' )
+
+            rows = sum( results[ 'rows' ][ table ] for table in tables )
+            best[ 'rows' ] = rows
+            best[ 'rows_per_second' ] = rows / best[ 'seconds' ] if best[ 'seconds' ] else 0
+
+            results[ 'cases' ][ name ] = best
+
+            print( 'YES' )
+
+    return results
+
+def run_case_process( dataPath, function, shape, compression = '' ):
+    """ This function runs a case in a new Python process, so that its peak memory
+    is its own. """
+    # ARGUMENT dataPath -> str directory of csv_data/ and covid_data/
+    # ARGUMENT function -> str case function (see SUITE_FUNCTIONS)
+    # ARGUMENT shape -> str criteria shape (see CRITERIA_SHAPES) or None
+    # ARGUMENT compression -> str extension of the compression of the tables; DEFAULT
+
+    # RETURN dict returned by run_case( )
+
+    command = [ sys.executable, os.path.abspath( __file__ ), 'case', '--data', dataPath,
+                '--function', function, '--compression', compression ]
+
+    if shape:
+        command += [ '--shape', shape ]
+
+    completed = subprocess.run( command, capture_output = True, text = True, 
+                                check = True )
+
+    return json.loads( completed.stdout.strip( ).split( '\n' )[ -1 ] )
+
+def run_case( dataPath, function, shape = None, compression = '' ):
+    """ This function times one function on the files with one shape of criteria. """
+    # ARGUMENT dataPath -> str directory of csv_data/ and covid_data/
+    # ARGUMENT function -> str case function (see SUITE_FUNCTIONS)
+    # ARGUMENT shape -> str criteria shape (see CRITERIA_SHAPES); DEFAULT
+    # ARGUMENT compression -> str extension of the compression of the tables; DEFAULT
+
+    # RETURN dict { 'seconds' : float, 'peak_rss_kb' : int or None, 'lines_out' : int }
+
+    tablesPath = f'{dataPath}/covid_data'
+    criteria = CRITERIA_SHAPES.get( shape, { } )
+    nytPath = f'{tablesPath}/nyt_us_counties.txt'
+    output = [ ]
+
+    if function == 'make_tab_delimited_tables':
+
+        # the tables and caches are made from scratch
+        os.makedirs( tablesPath, exist_ok = True )
+
+        for table in SUITE_FUNCTIONS[ function ]:
+            for path in glob.glob( f'{tablesPath}/{table}.*' ):
+                if os.path.isdir( path ):
+                    shutil.rmtree( path )
+                else:
+                    os.remove( path )
+
+    # the functions report their progress, which the suite doesn't show
+    with open( os.devnull, 'w' ) as quiet:
+
+        stdout = sys.stdout
+        sys.stdout = quiet
+        start = time.perf_counter( )
+
+        try:
+            if function == 'make_tab_delimited_tables':
+                make_tab_delimited_tables( synthetic_files_fields( ), tablesPath,
+                                            f'{dataPath}/csv_data', compression )
+            elif function == 'parse_nyt_county_data_by_date':
+                output = parse_nyt_county_data_by_date( criteria[ 'counties' ], nytPath,
+                                                        useCache = False )
+            elif function == 'parse_nyt_county_data_by_date (cache)':
+                output = parse_nyt_county_data_by_date( criteria[ 'counties' ], nytPath,
+                                                        useCache = True )
+            elif function == 'parse_census_county_data':
+                output = parse_census_county_data( criteria[ 'counties' ],
+                                            f'{tablesPath}/usc_counties_2019.txt' )
+            elif function == 'parse_atlantic_states_data':
+                output = parse_atlantic_states_data( criteria[ 'states' ],
+                                            f'{tablesPath}/atl_historic_us.txt',
+                                            f'{tablesPath}/atl_historic_states.txt' )
+
+        finally:
+            seconds = time.perf_counter( ) - start
+            sys.stdout = stdout
+
+    return { 'seconds' : seconds, 'peak_rss_kb' : peak_rss_kb( ), 
+                'lines_out' : len( output ) }
+
+def count_data_lines( path ):
+    """ This function counts the lines of a table after its header line. """
+    # ARGUMENT path -> str path of the table
+
+    # RETURN int lines
+
+    lines = 0
+
+    with open_data_file( path, 'rb' ) as fileIn:
+
+        chunk = fileIn.read( 1 << 20 )
+
+        while chunk:
+            lines += chunk.count( b'\n' )
+            chunk = fileIn.read( 1 << 20 )
+
+    return max( 0, lines - 1 )
+
+def compare_with_baseline( results, baseline, tolerance = 0.2 ):
+    """ This function finds the cases that have become slower or bigger than in the
+    baseline by more than the tolerance. """
+    # ARGUMENT results -> dict returned by benchmark_suite( )
+    # ARGUMENT baseline -> dict returned by benchmark_suite( ) earlier, or None
+    # ARGUMENT tolerance -> float fraction a measure may grow by; DEFAULT
+
+    # RETURN
+    regressions = { }   # dict { str case : list of str measures that regressed }
+
+    if not baseline:
+        return regressions
+
+    for name, now in results[ 'cases' ].items( ):
+
+        before = baseline.get( 'cases', { } ).get( name )
+
+        if not before:
+            continue
+
+        worse = [ ]
+
+        if ( now[ 'seconds' ] > before[ 'seconds' ] * ( 1 + tolerance ) 
+            and now[ 'seconds' ] - before[ 'seconds' ] > MIN_SECONDS ):
+            worse.append( 'seconds' )
+
+        # the peak memory isn't known without the resource module (on Windows)
+        if ( now[ 'peak_rss_kb' ] and before.get( 'peak_rss_kb' ) 
+            and now[ 'peak_rss_kb' ] > before[ 'peak_rss_kb' ] * ( 1 + tolerance )):
+            worse.append( 'peak_rss_kb' )
+
+        if worse:
+            regressions[ name ] = worse
+
+    return regressions
+
+def format_suite_results( results, baseline, regressions ):
+    """ This function formats the results of the suite as a table, with the change
+    from the baseline. """
+    # ARGUMENT results -> dict returned by benchmark_suite( )
+    # ARGUMENT baseline -> dict returned by benchmark_suite( ) earlier, or None
+    # ARGUMENT regressions -> dict returned by compare_with_baseline( )
+
+    # RETURN
+    output = [ ]    # list of str lines
+
+    def change( now, before ):
+        """ This subroutine formats the change from the baseline. """
+        
+        # RETURN str percent change, or '' without a baseline
+
+        return f'{100 * ( now - before ) / before:+.0f}%' if now and before else ''
+
+    output.append( '' )
+    output.append( f'{"case":<62}{"seconds":>9}{"":>6}{"peak MB":>9}{"":>6}'
+                    f'{"rows/s":>12}' )
+
+    for name, now in results[ 'cases' ].items( ):
+
+        before = ( baseline or { } ).get( 'cases', { } ).get( name, { } )
+        flag = ' REGRESSION' if name in regressions else ''
+
+        # an unknown peak memory is left blank
+        peak = f'{now[ "peak_rss_kb" ] / 1024:.1f}' if now[ 'peak_rss_kb' ] else ''
+        
+        output.append( f'{name:<62}{now[ "seconds" ]:>9.2f}'
+                        f'{change( now[ "seconds" ], before.get( "seconds" )):>6}'
+                        f'{peak:>9}'
+                        f'{change( now[ "peak_rss_kb" ], before.get( "peak_rss_kb" )):>6}'
+                        f'{now[ "rows_per_second" ]:>12,.0f}{flag}' )
+
+    output.append( '' )
+
+    if not baseline:
+        output.append( 'No baseline to compare with' )
+    elif regressions:
+        output.append( f'{len( regressions )} case(s) regressed by more than the '
+                        'tolerance' )
+    else:
+        output.append( 'No regressions from the baseline' )
+
+    return output
+
+def load_json( path ):
+    """ This function reads a JSON file if there is one. """
+    # ARGUMENT path -> str path of the file
+
+    # RETURN object, or None if there is no file
+
+    try:
+        with open( path ) as fileIn:
+            return json.load( fileIn )
+
+    except FileNotFoundError:
+        return None
+
+def save_json( value, path ):
+    """ This function writes a JSON file. """
+    # ARGUMENT value -> object that can be converted to JSON
+    # ARGUMENT path -> str path of the file
+
+    # RETURN nothing
+
+    with open( path, 'w' ) as fileOut:
+        json.dump( value, fileOut, indent = 2 )
+
+    return
+
+def benchmark_compression( tablesPath = 'covid_data', bandwidth = 100.0, repeats = 3 ):
+    """ This function reads a plain and a compressed copy of each table. """
+    # ARGUMENT tablesPath -> str path of the tables; DEFAULT
+    # ARGUMENT bandwidth -> float MB per second of the storage estimate; DEFAULT
+    # ARGUMENT repeats -> int reads of each copy; DEFAULT
+
+    # RETURN
+    results = [ ]   # list of dicts { str : value }, one per table and format
+
+    formats = [ '' ] + [ extension for extension in COMPRESSIONS
+                            if extension != '.zst' or zstandard ]
+
+    # the tables by their plain names, however they are stored
+    tables = sorted( { strip_compression( name ) for name in os.listdir( tablesPath )
+                        if strip_compression( name ).endswith( '.txt' ) } )
+
+    with tempfile.TemporaryDirectory( ) as tempPath:
+
+        for table in tables:
+
+            source = find_data_file( f'{tablesPath}/{table}' )
+            plainSeconds = None
+
+            for extension in formats:
+
+                print( f'Reading {table}{extension}...', end = ' ' )
+
+                copy = f'{tempPath}/{table}{extension}'
+
+                with open_data_file( source, 'rb' ) as fileIn:
+                    with open_data_file( copy, 'wb' ) as fileOut:
+                        shutil.copyfileobj( fileIn, fileOut, 1 << 20 )
+
+                ( seconds, lines ) = time_reading( copy, repeats )
+                size = os.path.getsize( copy )
+                estimate = seconds + size / ( bandwidth * 1e6 )
+
+                if plainSeconds is None:
+                    plainSeconds = estimate
+
+                results.append( { 'table' : table, 'format' : extension or 'plain',
+                                    'bytes' : size, 'lines' : lines,
+                                    'seconds' : seconds, 'estimate' : estimate,
+                                    'saved' : plainSeconds - estimate } )
+
+                os.remove( copy )
+
+                print( 'YES' )
+
+    return results
+
+def time_reading( path, repeats = 3 ):
+    """ This function times parsing every line of a file with iterate_data_file( ). """
+    # ARGUMENT path -> str path of the file
+    # ARGUMENT repeats -> int reads (the fastest counts); DEFAULT
+
+    # RETURN tuple ( float seconds, int lines )
+
+    best = None
+
+    for i in range( max( 1, repeats )):
+
+        start = time.perf_counter( )
+        lines = sum( 1 for fields in iterate_data_file( path ))
+        seconds = time.perf_counter( ) - start
+
+        if best is None or seconds < best:
+            best = seconds
+
+    return ( best, lines )
+
+def format_compression_results( results, bandwidth ):
+    """ This function formats the results as a table. """
+    # ARGUMENT results -> list of dicts returned by benchmark_compression( )
+    # ARGUMENT bandwidth -> float MB per second of the storage estimate
+
+    # RETURN
+    output = [ ]    # list of str lines
+
+    output.append( '' )
+    output.append( f'{"table":<28}{"format":<8}{"bytes read":>15}{"read s":>9}'
+                    f'{f"@{bandwidth:g} MB/s":>12}{"saved s":>9}' )
+
+    for result in results:
+        output.append( f'{result[ "table" ]:<28}{result[ "format" ]:<8}'
+                        f'{result[ "bytes" ]:>15,}{result[ "seconds" ]:>9.2f}'
+                        f'{result[ "estimate" ]:>12.2f}{result[ "saved" ]:>9.2f}' )
+
+    return output
+
+def benchmark_parallel( dataPath = 'synthetic_data', shape = 'everything',
+                        workers = ( 1, 2, 4 ), repeats = 3 ):
+    """ This function times reading the NY Times text file with each count of 
+    workers, and compares each table with the table read by one. """
+    # ARGUMENT dataPath -> str directory of covid_data/; DEFAULT
+    # ARGUMENT shape -> str criteria shape (see CRITERIA_SHAPES); DEFAULT
+    # ARGUMENT workers -> sequence of int counts of workers; DEFAULT
+    # ARGUMENT repeats -> int runs of each count (the fastest counts); DEFAULT
+
+    # RETURN
+    results = [ ]   # list of dicts { str : value }, one per count of workers
+
+    nytPath = f'{dataPath}/covid_data/nyt_us_counties.txt'
+    criteria = CRITERIA_SHAPES[ shape ][ 'counties' ]
+    serial = None   # list of str tab-delimited data read by one worker
+
+    # one worker is the baseline of the speedups and the tables
+    for count in sorted( set( workers ) | { 1 } ):
+
+        print( f'Reading with {count} workers...', end = ' ' )
+
+        best = None
+
+        # the function reports its progress, which the benchmark doesn't show
+        with open( os.devnull, 'w' ) as quiet:
+
+            stdout = sys.stdout
+            sys.stdout = quiet
+
+            try:
+                for i in range( max( 1, repeats )):
+
+                    start = time.perf_counter( )
+                    output = parse_nyt_county_data_by_date( criteria, nytPath, 
+                                                useCache = False, workers = count )
+                    seconds = time.perf_counter( ) - start
+
+                    if best is None or seconds < best:
+                        best = seconds
+
+            finally:
+                sys.stdout = stdout
+
+        if serial is None:
+            serial = output
+
+        results.append( { 'workers' : count, 'seconds' : best, 
+                            'speedup' : results[ 0 ][ 'seconds' ] / best if results
+                                        else 1.0,
+                            'same' : output == serial, 'cpus' : os.cpu_count( ) } )
+
+        print( 'YES' )
+
+    return results
+
+def format_parallel_results( results ):
+    """ This function formats the results as a table. """
+    # ARGUMENT results -> list of dicts returned by benchmark_parallel( )
+
+    # RETURN
+    output = [ ]    # list of str lines
+
+    output.append( '' )
+    output.append( f'{"workers":>8}{"seconds":>10}{"speedup":>9}  same table'
+                    f' (on {results[ 0 ][ "cpus" ] if results else "?"} CPUs)' )
+
+    for result in results:
+        output.append( f'{result[ "workers" ]:>8}{result[ "seconds" ]:>10.2f}'
+                        f'{result[ "speedup" ]:>8.2f}x  '
+                        f'{"YES" if result[ "same" ] else "NO"}' )
+
+    return output
+
+if __name__ == '__main__':
+    main( )
@@ -0,0 +1,301 @@
+# columnar_cache
+""" This module writes and reads a binary columnar cache of the NY Times counties
+table so that the parsing script doesn't have to re-parse millions of lines of
+tab-delimited text on every run.
+
+The cache is a directory next to the table (e.g. covid_data/nyt_us_counties.cache/)
+holding dictionary-encoded dates and ( State, County, FIPS ) keys as text and the
+rows as raw native-endian integer arrays. The rows are grouped by key, so the rows
+of one county are a contiguous slice of each array. The arrays are memory mapped
+when the cache is read, so nothing is copied until a slice is used.
+
+The cache records the size and modification time of the table it was built from
+and is ignored once the table changes. A compressed table (see compressed_files.py)
+has the same cache as it would have uncompressed. """
+import array
+import bisect
+import json
+import mmap
+import os
+import sys
+
+from compressed_files import find_data_file, open_data_file, strip_compression
+
+CACHE_VERSION = 1   # int bumped whenever the layout of the cache changes
+MISSING = -1        # int stored for a blank case or death count
+
+# column files of the cache { str file name : str array typecode }
+COLUMNS = { 'offsets.i64' : 'q', 'dates.i32' : 'i', 'cases.i64' : 'q',
+            'deaths.i64' : 'q' }
+
+class Columnar_Cache( ):
+    """ This object holds the memory-mapped columns of a NY Times counties cache. """
+
+    def __init__( self, cachePath, dates, keys ):
+        """ Initializes the object. """
+        # ARGUMENT cachePath -> str path of the cache directory
+        # ARGUMENT dates -> list of str dates in sorted order
+        # ARGUMENT keys -> list of tuples ( str State, str County, str FIPS ) in
+        #   sorted order
+
+        self.path = cachePath
+        self.dates = dates
+        self.keys = keys
+        self.maps = [ ]     # list of mmap.mmap objects kept open for the views
+
+        # memoryviews of the columns
+        self.offsets = self.map_column( 'offsets.i64' )
+        self.date_ids = self.map_column( 'dates.i32' )
+        self.cases = self.map_column( 'cases.i64' )
+        self.deaths = self.map_column( 'deaths.i64' )
+
+        return
+
+    def map_column( self, fileName ):
+        """ Memory maps a column file and returns a typed view of it. """
+        # ARGUMENT fileName -> str name of the column file in the cache directory
+
+        # RETURN memoryview of ints (or an empty array for an empty column)
+
+        typecode = COLUMNS[ fileName ]
+
+        with open( f'{self.path}/{fileName}', 'rb' ) as fileIn:
+
+            # an empty file can't be memory mapped
+            if not os.fstat( fileIn.fileno( ) ).st_size:
+                return array.array( typecode )
+
+            mm = mmap.mmap( fileIn.fileno( ), 0, access = mmap.ACCESS_READ )
+
+        self.maps.append( mm )
+
+        return memoryview( mm ).cast( typecode )
+
+    def rows( self, keyId, dateIds = None ):
+        """ Generates the ( date, cases, deaths ) rows of one key in file order. """
+        # ARGUMENT keyId -> int index of the key in self.keys
+        # ARGUMENT dateIds -> range of the date ids to keep (see date_id_range( ));
+        #   DEFAULT all
+
+        # YIELD tuple ( str date, int cases, int deaths ); a blank count is MISSING
+
+        start = self.offsets[ keyId ]
+        stop = self.offsets[ keyId + 1 ]
+        dates = self.dates
+
+        for dateId, cases, deaths in zip( self.date_ids[ start : stop ],
+                                            self.cases[ start : stop ],
+                                            self.deaths[ start : stop ] ):
+            if dateIds is None or dateId in dateIds:
+                yield ( dates[ dateId ], cases, deaths )
+
+        return
+
+    def date_id_range( self, startDate = None, endDate = None ):
+        """ Gives the ids of a range of dates (both ends included); the ids are in
+        date order. """
+        # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+        # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+
+        # RETURN range of int date ids
+
+        first = bisect.bisect_left( self.dates, startDate ) if startDate else 0
+        stop = bisect.bisect_right( self.dates, endDate ) if endDate else len( self.dates )
+
+        return range( first, stop )
+
+def cache_path_for( path ):
+    """ This function gives the path of the cache directory for a table. """
+    # ARGUMENT path -> str path of the NY Times counties table
+
+    # RETURN str path of the cache directory
+
+    return f'{os.path.splitext( strip_compression( path ))[ 0 ]}.cache'
+
+def source_signature( path ):
+    """ This function gives the size and modification time of a table, which
+    are used to tell whether a cache is still current. """
+    # ARGUMENT path -> str path of the table
+
+    # RETURN dict { str : int }
+
+    stats = os.stat( path )
+
+    return { 'source_size' : stats.st_size, 'source_mtime_ns' : stats.st_mtime_ns }
+
+def parse_count( text ):
+    """ This function converts a case or death count to an int; a blank count is
+    MISSING. """
+    # ARGUMENT text -> str count
+
+    # RETURN int count
+
+    return int( text ) if text else MISSING
+
+def format_count( count ):
+    """ This function formats a case or death count for output; a MISSING count
+    is left blank as it was in the original data. """
+    # ARGUMENT count -> int count
+
+    # RETURN str count
+
+    return '' if count == MISSING else str( count )
+
+def format_field( value ):
+    """ This function formats a value (e.g. a population, or a value from the
+    database) as the field it was in the table; None is blank. """
+    # ARGUMENT value -> int, float, str or None
+
+    # RETURN str field
+
+    return '' if value is None else str( value )
+
+def load_columnar_cache( path ):
+    """ This function opens the cache of a table if it exists and is newer than
+    the table; otherwise, there is no cache to use. """
+    # ARGUMENT path -> str path of the NY Times counties table
+
+    # RETURN Columnar_Cache( ) object or None
+
+    cachePath = cache_path_for( path )
+    path = find_data_file( path )
+
+    try:
+        with open( f'{cachePath}/meta.json' ) as fileIn:
+            meta = json.load( fileIn )
+
+        current = source_signature( path )
+
+    except ( OSError, ValueError ):
+        return None
+
+    # the cache is stale if the table has changed since it was built
+    if ( meta.get( 'version' ) != CACHE_VERSION
+        or meta.get( 'byteorder' ) != sys.byteorder
+        or any( meta.get( k ) != v for k, v in current.items( ) )):
+        return None
+
+    with open( f'{cachePath}/dates.txt' ) as fileIn:
+        dates = fileIn.read( ).split( '\n' )[ : meta[ 'dates' ]]
+
+    with open( f'{cachePath}/keys.txt' ) as fileIn:
+        keys = [ tuple( line.split( '\t' ))
+                    for line in fileIn.read( ).split( '\n' )[ : meta[ 'keys' ]]]
+
+    return Columnar_Cache( cachePath, dates, keys )
+
+def write_columnar_cache( path ):
+    """ This function builds the cache of a NY Times counties table in one pass
+    over the table. """
+    # ARGUMENT path -> str path of the NY Times counties table
+
+    # RETURN str path of the cache directory
+
+    cachePath = cache_path_for( path )
+    path = find_data_file( path )
+    os.makedirs( cachePath, exist_ok = True )
+
+    # remove the metadata first, so a partly written cache is never used
+    try:
+        os.remove( f'{cachePath}/meta.json' )
+    except FileNotFoundError:
+        pass
+
+    signature = source_signature( path )
+
+    dateIds = { }   # dict { str date : int id in order of appearance }
+    keyIds = { }    # dict { tuple ( str State, str County, str FIPS ) : int id }
+
+    # columns in file order
+    rowKeys = array.array( 'i' )
+    rowDates = array.array( 'i' )
+    rowCases = array.array( 'q' )
+    rowDeaths = array.array( 'q' )
+
+    with open_data_file( path ) as fileIn:
+
+        next( fileIn, None )    # skip the header line
+
+        # {'date': 0, 'county': 1, 'state': 2, 'fips': 3, 'cases': 4, 'deaths': 5}
+        for line in fileIn:
+
+            line = line.rstrip( '\n' )
+
+            if not line:
+                continue
+
+            fields = line.split( '\t' )
+            key = ( fields[ 2 ], fields[ 1 ], fields[ 3 ] )
+
+            rowKeys.append( keyIds.setdefault( key, len( keyIds )))
+            rowDates.append( dateIds.setdefault( fields[ 0 ], len( dateIds )))
+            rowCases.append( parse_count( fields[ 4 ] ))
+            rowDeaths.append( parse_count( fields[ 5 ] ))
+
+    # renumber the dates and keys in sorted order
+    dates = sorted( dateIds )
+    keys = sorted( keyIds )
+
+    dateRenumber = array.array( 'i', [ 0 ] ) * len( dates )
+    for i, date in enumerate( dates ):
+        dateRenumber[ dateIds[ date ]] = i
+
+    keyRenumber = array.array( 'i', [ 0 ] ) * len( keys )
+    for i, key in enumerate( keys ):
+        keyRenumber[ keyIds[ key ]] = i
+
+    # group the rows by key with a counting sort, which keeps file order within
+    # each key
+    offsets = array.array( 'q', [ 0 ] ) * ( len( keys ) + 1 )
+
+    for keyId in rowKeys:
+        offsets[ keyRenumber[ keyId ] + 1 ] += 1
+
+    for i in range( len( keys )):
+        offsets[ i + 1 ] += offsets[ i ]
+
+    positions = array.array( 'q', offsets[ : -1 ] )
+    sortedDates = array.array( 'i', [ 0 ] ) * len( rowKeys )
+    sortedCases = array.array( 'q', [ 0 ] ) * len( rowKeys )
+    sortedDeaths = array.array( 'q', [ 0 ] ) * len( rowKeys )
+
+    for row, keyId in enumerate( rowKeys ):
+
+        keyId = keyRenumber[ keyId ]
+        position = positions[ keyId ]
+        positions[ keyId ] += 1
+
+        sortedDates[ position ] = dateRenumber[ rowDates[ row ]]
+        sortedCases[ position ] = rowCases[ row ]
+        sortedDeaths[ position ] = rowDeaths[ row ]
+
+    # write each file under a temporary name and then move it into place
+    def write_file( fileName, writer ):
+        """ This subroutine writes one file of the cache. """
+        # ARGUMENT fileName -> str name of the file in the cache directory
+        # ARGUMENT writer -> function taking the open binary file
+
+        # RETURN nothing
+
+        with open( f'{cachePath}/{fileName}.tmp', 'wb' ) as fileOut:
+            writer( fileOut )
+
+        os.replace( f'{cachePath}/{fileName}.tmp', f'{cachePath}/{fileName}' )
+
+        return
+
+    write_file( 'dates.txt', lambda f : f.write( '\n'.join( dates ).encode( )))
+    write_file( 'keys.txt', lambda f : f.write(
+                    '\n'.join( '\t'.join( key ) for key in keys ).encode( )))
+    write_file( 'offsets.i64', offsets.tofile )
+    write_file( 'dates.i32', sortedDates.tofile )
+    write_file( 'cases.i64', sortedCases.tofile )
+    write_file( 'deaths.i64', sortedDeaths.tofile )
+
+    meta = { 'version' : CACHE_VERSION, 'byteorder' : sys.byteorder,
+            'rows' : len( rowKeys ), 'dates' : len( dates ), 'keys' : len( keys ) }
+    meta.update( signature )
+
+    write_file( 'meta.json', lambda f : f.write( json.dumps( meta ).encode( )))
+
+    return cachePath
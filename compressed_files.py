@@ -0,0 +1,142 @@
+# compressed_files
+""" This module reads and writes the data files either as plain text or compressed
+with gzip or zstd (Zstandard), so that less has to be read from slow storage. The
+compression of a file is told by its extension (.gz or .zst) and the data are
+compressed and decompressed as they are streamed, so a whole file is never held in
+memory.
+
+A file is opened by the path it would have uncompressed (e.g.
+covid_data/nyt_us_counties.txt): if that file doesn't exist, or a compressed copy
+of it (e.g. covid_data/nyt_us_counties.txt.gz) is newer, the compressed copy is
+read instead. So the same paths work however the update script stored the data.
+
+zstd needs the zstandard package (pip install zstandard); gzip is always there. """
+import gzip
+import io
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None    # .zst files can't be read or written without it
+
+# extensions of the compressed files { str extension : int compression level }
+COMPRESSIONS = { '.gz' : 6, '.zst' : 3 }
+
+def compression_of( path ):
+    """ This function tells how a file is compressed from its extension. """
+    # ARGUMENT path -> str path of the file
+
+    # RETURN str extension in COMPRESSIONS, or '' for a plain file
+
+    extension = os.path.splitext( path )[ 1 ]
+
+    return extension if extension in COMPRESSIONS else ''
+
+def strip_compression( path ):
+    """ This function gives the path a file would have uncompressed. """
+    # ARGUMENT path -> str path of the file
+
+    # RETURN str path without a compression extension
+
+    extension = compression_of( path )
+
+    return path[ : -len( extension ) ] if extension else path
+
+def find_data_file( path ):
+    """ This function finds the file to read for a path: the newest of the path
+    itself and its compressed copies. """
+    # ARGUMENT path -> str path of the file, with or without a compression extension
+
+    # RETURN str path of the file to read (the path itself if nothing exists)
+
+    base = strip_compression( path )
+    newest = None   # tuple ( int mtime in ns, str path )
+
+    for candidate in [ base ] + [ base + extension for extension in COMPRESSIONS ]:
+
+        try:
+            mtime = os.stat( candidate ).st_mtime_ns
+        except OSError:
+            continue
+
+        if newest is None or mtime > newest[ 0 ]:
+            newest = ( mtime, candidate )
+
+    return newest[ 1 ] if newest else path
+
+def open_data_file( path, mode = 'r', **kwargs ):
+    """ This function opens a data file for reading or writing, compressing or
+    decompressing it as it is streamed. A file opened for reading is found with
+    find_data_file( ). Appending to a compressed file adds a new gzip member or
+    zstd frame, which reads back as one stream. """
+    # ARGUMENT path -> str path of the file
+    # ARGUMENT mode -> str 'r', 'w' or 'a', with 'b' for bytes; DEFAULT
+    # ARGUMENT kwargs -> arguments of a text file, e.g. encoding or newline
+
+    # RETURN file object
+
+    if 'r' in mode:
+        path = find_data_file( path )
+
+    extension = compression_of( path )
+
+    if not extension:
+        return open( path, mode, **kwargs )
+
+    binaryMode = mode.replace( 't', '' ).replace( 'b', '' ) + 'b'
+
+    if extension == '.gz':
+        binary = gzip.open( path, binaryMode, compresslevel = COMPRESSIONS[ '.gz' ] )
+
+    else:
+
+        if zstandard is None:
+            raise ImportError( f'the zstandard package is needed for {path}' )
+
+        raw = open( path, binaryMode )
+
+        if 'r' in mode:
+            binary = zstandard.ZstdDecompressor( ).stream_reader( raw,
+                                                    read_across_frames = True )
+        else:
+            binary = zstandard.ZstdCompressor( level = COMPRESSIONS[ '.zst' ]
+                                                ).stream_writer( raw )
+
+    if 'b' in mode:
+        return binary
+
+    return io.TextIOWrapper( binary, **kwargs )
+
+def read_size_and_tail( path, size ):
+    """ This function gives the uncompressed length of a data file and the bytes at
+    its end. A plain file is read from the end; a compressed one has to be
+    streamed through. """
+    # ARGUMENT path -> str path of the file
+    # ARGUMENT size -> int bytes wanted from the end of the file
+
+    # RETURN tuple ( int uncompressed bytes, bytes tail of at most size bytes )
+
+    if not compression_of( path ):
+
+        total = os.path.getsize( path )
+
+        with open( path, 'rb' ) as fileIn:
+            fileIn.seek( total - min( total, size ))
+            tail = fileIn.read( )
+
+        return ( total, tail )
+
+    total = 0
+    tail = b''
+
+    with open_data_file( path, 'rb' ) as fileIn:
+
+        chunk = fileIn.read( 1 << 20 )
+
+        while chunk:
+            total += len( chunk )
+            tail = ( tail + chunk )[ -size : ] if size else b''
+            chunk = fileIn.read( 1 << 20 )
+
+    return ( total, tail )
@@ -0,0 +1,179 @@
+# county_metrics
+""" This module derives the metrics that the students compute from the county
+tables (daily increments, rolling averages, doubling time and rates per 100 000)
+for all of the selected counties at once.
+
+The metrics work on the date x county matrix of cumulative counts made by the
+parsing script. The matrix is transposed once into one series per county, each
+metric is computed along the series with running sums (so a rolling average costs
+the same for any window), and the result is transposed back into a matrix by date.
+A value that can't be computed (e.g. before a rolling window is full or without a
+population) is None and is written as a blank cell. """
+import math
+
+# metrics that can be reported { str name : tuple ( str title, int decimals ) }
+METRICS = { 'new_cases' : ( 'NEW CASES', 0 ),
+            'new_deaths' : ( 'NEW DEATHS', 0 ),
+            'new_cases_7day' : ( 'NEW CASES 7-DAY AVERAGE', 2 ),
+            'new_cases_14day' : ( 'NEW CASES 14-DAY AVERAGE', 2 ),
+            'new_deaths_7day' : ( 'NEW DEATHS 7-DAY AVERAGE', 2 ),
+            'new_deaths_14day' : ( 'NEW DEATHS 14-DAY AVERAGE', 2 ),
+            'doubling_time' : ( 'CASES DOUBLING TIME (DAYS)', 2 ),
+            'cases_per_100k' : ( 'CASES PER 100 000', 2 ),
+            'deaths_per_100k' : ( 'DEATHS PER 100 000', 2 ),
+            'new_cases_7day_per_100k' : ( 'NEW CASES 7-DAY AVERAGE PER 100 000', 2 ) }
+
+def compute_county_metrics( counties, cases, deaths, populations, metrics = None ):
+    """ This function computes the requested metrics for every county. """
+    # ARGUMENT counties -> list of tuples ( str State, str County, int FIPS or None )
+    #   of the columns
+    # ARGUMENT cases -> list of lists of int cumulative cases by date and county
+    # ARGUMENT deaths -> list of lists of int cumulative deaths by date and county
+    # ARGUMENT populations -> dict { tuple county of counties : int population }
+    # ARGUMENT metrics -> list of str metric names (see METRICS); DEFAULT all
+
+    # RETURN
+    results = { }   # dict { str metric name : list of lists of values by date and county }
+
+    if metrics is None:
+        metrics = list( METRICS )
+
+    # one series per county
+    caseSeries = [ list( column ) for column in zip( *cases ) ]
+    deathSeries = [ list( column ) for column in zip( *deaths ) ]
+    pops = [ populations.get( county ) for county in counties ]
+
+    # the series that other metrics are built on are computed once
+    derived = { }   # dict { str name : list of series }
+
+    def series( name ):
+        """ This subroutine computes (or recalls) the series of a metric. """
+        # ARGUMENT name -> str metric name
+
+        # RETURN list of lists of values, one per county
+
+        if name in derived:
+            return derived[ name ]
+
+        if name == 'new_cases':
+            result = [ daily_increments( s ) for s in caseSeries ]
+        elif name == 'new_deaths':
+            result = [ daily_increments( s ) for s in deathSeries ]
+        elif name.startswith( 'new_' ) and name.endswith( 'day' ):
+            ( base, window ) = name.rsplit( '_', 1 )
+            window = int( window[ : -3 ] )
+            result = [ rolling_mean( s, window ) for s in series( base ) ]
+        elif name == 'doubling_time':
+            result = [ doubling_time( s ) for s in caseSeries ]
+        elif name == 'cases_per_100k':
+            result = [ per_100k( s, pop ) for s, pop in zip( caseSeries, pops ) ]
+        elif name == 'deaths_per_100k':
+            result = [ per_100k( s, pop ) for s, pop in zip( deathSeries, pops ) ]
+        elif name == 'new_cases_7day_per_100k':
+            result = [ per_100k( s, pop ) for s, pop
+                        in zip( series( 'new_cases_7day' ), pops ) ]
+        else:
+            raise ValueError( f'unknown metric {name!r}' )
+
+        derived[ name ] = result
+
+        return result
+
+    for name in metrics:
+
+        # back to one row per date
+        results[ name ] = [ list( row ) for row in zip( *series( name )) ]
+
+    return results
+
+def daily_increments( series ):
+    """ This function gives the change from one day to the next of a cumulative
+    series; the first day's increment is the first day's count. """
+    # ARGUMENT series -> list of int cumulative counts
+
+    # RETURN list of int increments
+
+    return [ b - a for a, b in zip( [ 0 ] + series[ : -1 ], series ) ]
+
+def rolling_mean( series, window ):
+    """ This function gives the trailing mean of a series over a window of days
+    using a running sum. """
+    # ARGUMENT series -> list of numbers
+    # ARGUMENT window -> int days
+
+    # RETURN list of float means (None until the window is full)
+
+    means = [ None ] * len( series )
+    total = 0
+
+    for i, value in enumerate( series ):
+
+        total += value
+
+        if i >= window:
+            total -= series[ i - window ]
+
+        if i >= window - 1:
+            means[ i ] = total / window
+
+    return means
+
+def doubling_time( series, window = 7 ):
+    """ This function gives the number of days it would take a cumulative count
+    to double at the growth rate of the trailing window. """
+    # ARGUMENT series -> list of int cumulative counts
+    # ARGUMENT window -> int days over which the growth rate is measured; DEFAULT
+
+    # RETURN list of float days (None where there was no growth to measure)
+
+    times = [ None ] * len( series )
+    log2 = window * math.log( 2 )
+
+    for i in range( window, len( series )):
+
+        before = series[ i - window ]
+        now = series[ i ]
+
+        if before > 0 and now > before:
+            times[ i ] = log2 / math.log( now / before )
+
+    return times
+
+def per_100k( series, population ):
+    """ This function scales a series to a rate per 100 000 people. """
+    # ARGUMENT series -> list of numbers
+    # ARGUMENT population -> int population, or None if it isn't known
+
+    # RETURN list of float rates (None without a population)
+
+    if not population:
+        return [ None ] * len( series )
+
+    scale = 100000 / population
+
+    return [ None if value is None else value * scale for value in series ]
+
+def format_metric_table( name, dates, counties, rows ):
+    """ This function formats the matrix of a metric as a table laid out like the
+    cases and deaths tables. """
+    # ARGUMENT name -> str metric name (see METRICS)
+    # ARGUMENT dates -> list of str dates of the rows
+    # ARGUMENT counties -> list of tuples ( str State, str County ) of the columns
+    # ARGUMENT rows -> list of lists of values by date and county
+
+    # RETURN
+    output = [ ]    # list of str tab-delimited data
+
+    ( title, decimals ) = METRICS[ name ]
+
+    # state and county headers
+    output.append( f'{title}\t' + '\t'.join( [ county[ 0 ] for county in counties ] ))
+    output.append( 'date\t' + '\t'.join( [ county[ 1 ] for county in counties ] ))
+
+    for date, row in zip( dates, rows ):
+        output.append( '\t'.join( [ date ] + [ '' if value is None
+                                    else f'{value:.{decimals}f}' for value in row ] ))
+
+    output.append( '' ) # spacer
+
+    return output
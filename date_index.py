@@ -0,0 +1,196 @@
+# date_index
+""" This module writes and reads a small sidecar index of the tables that are
+ordered by date (the NY Times tables in ascending order, The Atlantic tables in
+descending order), so that a parser that only wants a range of dates can seek
+straight to its lines instead of reading the whole history.
+
+The index is a JSON file next to the table (e.g. covid_data/nyt_us_counties.dates.json)
+listing the runs of lines of each date as [ date, first byte, end byte ] in file
+order. A date that appears in more than one run (e.g. a table that isn't sorted)
+simply has more than one entry, so the index is right for any order; it is only
+small when the table is sorted. The dates are kept as YYYY-MM-DD, whichever way the
+table writes them (The Atlantic writes YYYYMMDD).
+
+Like the columnar cache, the index records the size and modification time of the
+table it was built from and is ignored once the table changes. A compressed table
+(see compressed_files.py) can't be sought into, so it gets no index and is read
+from the start. """
+import json
+import os
+
+from columnar_cache import source_signature
+from compressed_files import compression_of, find_data_file, strip_compression
+
+INDEX_VERSION = 1   # int bumped whenever the layout of the index changes
+
+class Date_Index( ):
+    """ This object holds the byte ranges of the dates of a table. """
+
+    def __init__( self, path, runs ):
+        """ Initializes the object. """
+        # ARGUMENT path -> str path of the table
+        # ARGUMENT runs -> list of lists [ str date, int first byte, int end byte ]
+        #   in file order
+
+        self.path = path
+        self.runs = runs
+
+        return
+
+    def byte_ranges( self, startDate = None, endDate = None ):
+        """ Gives the byte ranges of the lines of a range of dates, merging the
+        ranges of dates that follow each other in the table. """
+        # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+        # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+
+        # RETURN list of tuples ( int first byte, int end byte ) in file order
+
+        ranges = [ ]
+
+        for ( date, start, end ) in self.runs:
+
+            if not in_date_range( date, startDate, endDate ):
+                continue
+
+            if ranges and ranges[ -1 ][ 1 ] == start:
+                ranges[ -1 ] = ( ranges[ -1 ][ 0 ], end )
+            else:
+                ranges.append( ( start, end ))
+
+        return ranges
+
+    def read_lines( self, startDate = None, endDate = None ):
+        """ Generates the header line of the table and then only the lines of a
+        range of dates, seeking to each of their byte ranges. """
+        # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+        # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+
+        # YIELD str line, with its line break
+
+        with open( self.path, 'rb' ) as fileIn:
+
+            yield fileIn.readline( ).decode( )
+
+            for ( start, end ) in self.byte_ranges( startDate, endDate ):
+
+                fileIn.seek( start )
+
+                while start < end:
+
+                    line = fileIn.readline( )
+
+                    if not line:
+                        break
+
+                    start += len( line )
+
+                    yield line.decode( )
+
+        return
+
+def index_path_for( path ):
+    """ This function gives the path of the date index of a table. """
+    # ARGUMENT path -> str path of the table
+
+    # RETURN str path of the index file
+
+    return f'{os.path.splitext( strip_compression( path ))[ 0 ]}.dates.json'
+
+def iso_date( date ):
+    """ This function writes a date of either dataset as YYYY-MM-DD. """
+    # ARGUMENT date -> str date as YYYY-MM-DD or YYYYMMDD
+
+    # RETURN str date as YYYY-MM-DD
+
+    if len( date ) == 8 and date.isdigit( ):
+        return f'{date[ : 4 ]}-{date[ 4 : 6 ]}-{date[ 6 : ]}'
+
+    return date
+
+def in_date_range( date, startDate = None, endDate = None ):
+    """ This function tells whether a date is in a range of dates (both ends
+    included). """
+    # ARGUMENT date -> str date as YYYY-MM-DD
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT none
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT none
+
+    # RETURN bool
+
+    return ( not startDate or date >= startDate ) and ( not endDate or date <= endDate )
+
+def load_date_index( path ):
+    """ This function opens the date index of a table if it exists and is newer
+    than the table; otherwise, there is no index to use. """
+    # ARGUMENT path -> str path of the table
+
+    # RETURN Date_Index( ) object or None
+
+    indexPath = index_path_for( path )
+    path = find_data_file( path )
+
+    if compression_of( path ):
+        return None
+
+    try:
+        with open( indexPath ) as fileIn:
+            meta = json.load( fileIn )
+
+        current = source_signature( path )
+
+    except ( OSError, ValueError ):
+        return None
+
+    # the index is stale if the table has changed since it was built
+    if ( meta.get( 'version' ) != INDEX_VERSION
+        or any( meta.get( k ) != v for k, v in current.items( ) )):
+        return None
+
+    return Date_Index( path, meta[ 'runs' ] )
+
+def write_date_index( path ):
+    """ This function builds the date index of a table, whose first field is the
+    date, in one pass over the table. """
+    # ARGUMENT path -> str path of the table
+
+    # RETURN str path of the index file, or None for a compressed table
+
+    indexPath = index_path_for( path )
+    path = find_data_file( path )
+
+    if compression_of( path ):
+        return None
+
+    signature = source_signature( path )
+    runs = [ ]  # list of lists [ str date, int first byte, int end byte ]
+
+    with open( path, 'rb' ) as fileIn:
+
+        position = len( fileIn.readline( ))  # skip the header line
+
+        for line in fileIn:
+
+            start = position
+            position += len( line )
+
+            date = line[ : line.find( b'\t' ) ].decode( ) if b'\t' in line else ''
+
+            if not date.strip( ):
+                continue
+
+            date = iso_date( date )
+
+            # a line of the same date as the line before continues its run
+            if runs and runs[ -1 ][ 0 ] == date and runs[ -1 ][ 2 ] == start:
+                runs[ -1 ][ 2 ] = position
+            else:
+                runs.append( [ date, start, position ] )
+
+    meta = { 'version' : INDEX_VERSION, **signature, 'runs' : runs }
+
+    # write the index under a temporary name and then move it into place
+    with open( f'{indexPath}.tmp', 'w' ) as fileOut:
+        json.dump( meta, fileOut )
+
+    os.replace( f'{indexPath}.tmp', indexPath )
+
+    return indexPath
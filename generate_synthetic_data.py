@@ -0,0 +1,408 @@
+# generate_synthetic_data
+""" The purpose of this script is to write synthetic COVID data files with the same
+schemas as the real ones, at any scale, so that the scripts can be measured (see
+benchmark.py) on files as large as the real ones or larger.
+
+The files are written to /<output>/csv_data/ under the names that the update
+script gives its downloads, and can be converted to tables with
+make_tab_delimited_tables( ) (or --tables):
+
+    nyt_us_counties.csv     date,county,state,fips,cases,deaths
+    atl_historic_states.csv The Atlantic v1/states/daily.csv columns
+    atl_historic_us.csv     The Atlantic v1/us/daily.csv columns
+    nyt_mask_use.csv        COUNTYFP,NEVER,RARELY,SOMETIMES,FREQUENTLY,ALWAYS
+    usc_counties_2019.csv   US Census co-est2019-alldata.csv columns
+
+The counties are the real ones from usc_counties_2019.csv (optionally repeated
+under numbered names to make more of them), so the real criteria still match. The
+NY Times file has a line per county per day, plus an "Unknown" line per state per
+day with no FIPS code or deaths, until it has the number of lines asked for; the
+other files cover the same days. The counts are random but cumulative, and the
+same seed always gives the same files. """
+import argparse
+import csv
+import datetime
+import os
+import random
+
+from compressed_files import open_data_file
+from geography import CENSUS_PATH, STATES, normalize_county_name
+from update_covid_data import Covid_Data, make_tab_delimited_tables
+
+# first date of the NY Times data
+START_DATE = datetime.date( 2020, 1, 21 )
+
+# state postal codes in The Atlantic data { str state name : str postal code }, for
+# the states of the US Census file
+POSTAL_CODES = { name : code for code, ( name, fips ) in STATES.items( ) if fips < 60 }
+
+# columns of The Atlantic files
+ATL_STATES_FIELDS = [ 'date', 'state', 'positive', 'negative', 'pending',
+                    'hospitalizedCurrently', 'hospitalizedCumulative', 'inIcuCurrently',
+                    'inIcuCumulative', 'onVentilatorCurrently', 'onVentilatorCumulative',
+                    'recovered', 'dataQualityGrade', 'lastUpdateEt', 'dateModified',
+                    'checkTimeEt', 'death', 'hospitalized', 'dateChecked',
+                    'totalTestsViral', 'positiveTestsViral', 'negativeTestsViral',
+                    'positiveCasesViral', 'deathConfirmed', 'deathProbable', 'fips',
+                    'positiveIncrease', 'negativeIncrease', 'total', 'totalTestResults',
+                    'totalTestResultsIncrease', 'posNeg', 'deathIncrease',
+                    'hospitalizedIncrease', 'hash', 'commercialScore',
+                    'negativeRegularScore', 'negativeScore', 'positiveScore', 'score',
+                    'grade' ]
+ATL_US_FIELDS = [ 'date', 'states', 'positive', 'negative', 'pending',
+                'hospitalizedCurrently', 'hospitalizedCumulative', 'inIcuCurrently',
+                'inIcuCumulative', 'onVentilatorCurrently', 'onVentilatorCumulative',
+                'recovered', 'dateChecked', 'death', 'hospitalized', 'lastModified',
+                'total', 'totalTestResults', 'posNeg', 'deathIncrease',
+                'hospitalizedIncrease', 'negativeIncrease', 'positiveIncrease',
+                'totalTestResultsIncrease', 'hash' ]
+
+def main( ):
+
+    print( 'GENERATE SYNTHETIC COVID DATA FILES' )
+
+    parser = argparse.ArgumentParser( description = 'Write synthetic COVID data files '
+                                        'with the real schemas.' )
+    parser.add_argument( '--rows', default = 1000000, type = int,
+                        help = 'lines of NY Times county data; DEFAULT %(default)s' )
+    parser.add_argument( '--county-copies', default = 1, type = int, metavar = 'N',
+                        help = 'times each real county is repeated; DEFAULT %(default)s' )
+    parser.add_argument( '--output', default = 'synthetic_data', metavar = 'DIR',
+                        help = 'directory for csv_data/ (and covid_data/); '
+                        'DEFAULT %(default)s' )
+    parser.add_argument( '--seed', default = 2020, type = int,
+                        help = 'seed of the random counts; DEFAULT %(default)s' )
+    parser.add_argument( '--compression', default = '', choices = [ '', '.gz', '.zst' ],
+                        help = 'compress the files (see compressed_files.py)' )
+    parser.add_argument( '--tables', action = 'store_true',
+                        help = 'also convert the files to tables in covid_data/' )
+    args = parser.parse_args( )
+
+    generate_synthetic_data( args.output, args.rows, args.county_copies, args.seed,
+                                args.compression )
+
+    if args.tables:
+
+        print( 'Converting the files to tables...', end = ' ' )
+        os.makedirs( f'{args.output}/covid_data', exist_ok = True )
+        make_tab_delimited_tables( synthetic_files_fields( ),
+                                    f'{args.output}/covid_data',
+                                    f'{args.output}/csv_data', args.compression )
+        print( 'YES' )
+
+    print( ); print( )
+
+    exit( )
+
+def synthetic_files_fields( ):
+    """ This function lists the synthetic files as the update script does. """
+
+    # RETURN list of Covid_Data( ) objects
+
+    return [ Covid_Data( 'nyt_us_counties', 'us-counties.csv', columnar = True,
+                        appendOnly = True, dateIndexed = True ),
+            Covid_Data( 'atl_historic_us', 'v1/us/daily.csv', dateIndexed = True ),
+            Covid_Data( 'atl_historic_states', 'v1/states/daily.csv', dateIndexed = True ),
+            Covid_Data( 'usc_counties_2019', 'co-est2019-alldata.csv' ),
+            Covid_Data( 'nyt_mask_use', 'mask-use/mask-use-by-county.csv' ) ]
+
+def generate_synthetic_data( outputPath = 'synthetic_data', rows = 1000000,
+                                countyCopies = 1, seed = 2020, compression = '',
+                                censusPath = CENSUS_PATH ):
+    """ This function writes the five synthetic CSV files. """
+    # ARGUMENT outputPath -> str directory for csv_data/; DEFAULT
+    # ARGUMENT rows -> int lines of NY Times county data; DEFAULT
+    # ARGUMENT countyCopies -> int times each real county is repeated; DEFAULT
+    # ARGUMENT seed -> int seed of the random counts; DEFAULT
+    # ARGUMENT compression -> str extension of the compression, '', '.gz' or '.zst';
+    #   DEFAULT none
+    # ARGUMENT censusPath -> str path of the real US Census file; DEFAULT
+
+    # RETURN dict { str file name : int data lines written }
+
+    csvPath = f'{outputPath}/csv_data'
+    os.makedirs( csvPath, exist_ok = True )
+
+    rng = random.Random( seed )
+    written = { }
+
+    print( 'Writing the US Census counties...', end = ' ' )
+    ( counties, written[ 'usc_counties_2019' ] ) = write_census_counties(
+                                        f'{csvPath}/usc_counties_2019.csv{compression}',
+                                        censusPath, countyCopies, rng )
+    print( 'YES' )
+
+    print( f'Writing {rows:,} lines of NY Times counties...', end = ' ' )
+    ( days, written[ 'nyt_us_counties' ] ) = write_nyt_counties(
+                                        f'{csvPath}/nyt_us_counties.csv{compression}',
+                                        counties, rows, rng )
+    print( 'YES' )
+
+    print( 'Writing The Atlantic states and USA...', end = ' ' )
+    written[ 'atl_historic_states' ] = write_atlantic_states(
+                                        f'{csvPath}/atl_historic_states.csv{compression}',
+                                        days, rng )
+    written[ 'atl_historic_us' ] = write_atlantic_us(
+                                        f'{csvPath}/atl_historic_us.csv{compression}',
+                                        days, rng )
+    print( 'YES' )
+
+    print( 'Writing the NY Times mask use...', end = ' ' )
+    written[ 'nyt_mask_use' ] = write_mask_use(
+                                        f'{csvPath}/nyt_mask_use.csv{compression}',
+                                        counties, rng )
+    print( 'YES' )
+
+    return written
+
+def write_census_counties( path, censusPath, countyCopies, rng ):
+    """ This function writes the US Census file from the real one, repeating each
+    county under numbered names (e.g. Dane County 2) and varying the populations of
+    the copies. """
+    # ARGUMENT path -> str path of the file to write
+    # ARGUMENT censusPath -> str path of the real US Census file
+    # ARGUMENT countyCopies -> int times each real county is repeated
+    # ARGUMENT rng -> random.Random( ) object
+
+    # RETURN tuple ( list of tuples ( str State, str County, str FIPS ), int lines )
+
+    counties = [ ]
+    lines = 0
+
+    with open_data_file( censusPath, 'r', encoding = 'utf-8', newline = '' ) as fileIn:
+        with open_data_file( path, 'w', encoding = 'utf-8', newline = '' ) as fileOut:
+
+            rows = csv.reader( fileIn )
+            writer = csv.writer( fileOut, lineterminator = '\n' )
+
+            header = next( rows )
+            writer.writerow( header )
+
+            # {'SUMLEV': 0, 'REGION': 1, 'DIVISION': 2, 'STATE': 3, 'COUNTY': 4,
+            #   'STNAME': 5, 'CTYNAME': 6, 'CENSUS2010POP': 7, ...
+            #   'POPESTIMATE2019': 18, ...
+            for row in rows:
+
+                # a state's line isn't repeated
+                if row[ 0 ] != '050':
+                    writer.writerow( row )
+                    lines += 1
+                    continue
+
+                for copy in range( 1, countyCopies + 1 ):
+
+                    row = list( row )
+
+                    if copy > 1:
+                        row[ 4 ] = f'{int( row[ 4 ] ) + 1000 * ( copy - 1 ):03d}'
+                        row[ 6 ] = f'{row[ 6 ]} {copy}'
+                        row[ 18 ] = str( int( int( row[ 18 ] ) * rng.uniform( 0.5, 1.5 )))
+
+                    writer.writerow( row )
+                    lines += 1
+
+                    counties.append( ( row[ 5 ], normalize_county_name( row[ 6 ] ),
+                                        row[ 3 ] + row[ 4 ] ))
+
+    return ( counties, lines )
+
+def write_nyt_counties( path, counties, rows, rng ):
+    """ This function writes the NY Times counties file: the lines of each day in
+    order of state and county, until there are enough lines. """
+    # ARGUMENT path -> str path of the file to write
+    # ARGUMENT counties -> list of tuples ( str State, str County, str FIPS )
+    # ARGUMENT rows -> int lines of data to write
+    # ARGUMENT rng -> random.Random( ) object
+
+    # RETURN tuple ( int days, int lines )
+
+    # the counties of each state, with an unknown county of no FIPS code last
+    keys = [ ]  # list of tuples ( str State, str County, str FIPS )
+    for state in sorted( { county[ 0 ] for county in counties } ):
+        keys.extend( sorted( county for county in counties if county[ 0 ] == state ))
+        keys.append( ( state, 'Unknown', '' ))
+
+    # the counts of each county, the daily growth of its cases and the number of 
+    # cases the growth levels off at
+    cases = [ 0 ] * len( keys )
+    deaths = [ 0 ] * len( keys )
+    growth = [ rng.uniform( 0.0, 0.08 ) for key in keys ]
+    ceilings = [ rng.randrange( 1000, 200000 ) for key in keys ]
+
+    lines = 0
+    day = 0
+
+    with open_data_file( path, 'w', encoding = 'utf-8', newline = '' ) as fileOut:
+
+        fileOut.write( 'date,county,state,fips,cases,deaths\n' )
+
+        while lines < rows:
+
+            date = ( START_DATE + datetime.timedelta( days = day )).isoformat( )
+            chunk = [ ]
+
+            for i, ( state, county, fips ) in enumerate( keys[ : rows - lines ] ):
+
+                cases[ i ] += ( int( cases[ i ] * growth[ i ] 
+                                    * max( 0.0, 1 - cases[ i ] / ceilings[ i ] ))
+                                + rng.randrange( 3 ))
+                deaths[ i ] += rng.randrange( 2 ) if cases[ i ] > 50 else 0
+
+                if fips:
+                    chunk.append( f'{date},{county},{state},{fips},{cases[ i ]},'
+                                    f'{deaths[ i ]}\n' )
+                else:
+                    chunk.append( f'{date},{county},{state},,{cases[ i ]},\n' )
+
+            fileOut.write( ''.join( chunk ))
+
+            lines += len( chunk )
+            day += 1
+
+    return ( day, lines )
+
+def write_atlantic_states( path, days, rng ):
+    """ This function writes The Atlantic states file: a line per state per day,
+    newest first. """
+    # ARGUMENT path -> str path of the file to write
+    # ARGUMENT days -> int days of data
+    # ARGUMENT rng -> random.Random( ) object
+
+    # RETURN int lines
+
+    states = sorted( POSTAL_CODES.values( ))
+    series = { state : atlantic_series( days, rng ) for state in states }
+    lines = 0
+
+    with open_data_file( path, 'w', encoding = 'utf-8', newline = '' ) as fileOut:
+
+        writer = csv.writer( fileOut, lineterminator = '\n' )
+        writer.writerow( ATL_STATES_FIELDS )
+
+        for day in reversed( range( days )):
+
+            date = START_DATE + datetime.timedelta( days = day )
+
+            for fips, state in enumerate( states, 1 ):
+
+                counts = series[ state ][ day ]
+                row = dict.fromkeys( ATL_STATES_FIELDS, '' )
+                row.update( counts )
+                row.update( { 'date' : date.strftime( '%Y%m%d' ), 'state' : state,
+                            'dataQualityGrade' : 'A',
+                            'lastUpdateEt' : f'{date:%m/%d/%Y} 00:00',
+                            'dateModified' : f'{date}T00:00:00Z',
+                            'checkTimeEt' : f'{date:%m/%d} 00:00',
+                            'dateChecked' : f'{date}T00:00:00Z',
+                            'fips' : f'{fips:02d}', 'grade' : 'A',
+                            'hash' : f'{rng.getrandbits( 160 ):040x}' } )
+                writer.writerow( [ row[ field ] for field in ATL_STATES_FIELDS ] )
+                lines += 1
+
+    return lines
+
+def write_atlantic_us( path, days, rng ):
+    """ This function writes The Atlantic USA file: a line per day, newest first. """
+    # ARGUMENT path -> str path of the file to write
+    # ARGUMENT days -> int days of data
+    # ARGUMENT rng -> random.Random( ) object
+
+    # RETURN int lines
+
+    series = atlantic_series( days, rng, 50 )
+
+    with open_data_file( path, 'w', encoding = 'utf-8', newline = '' ) as fileOut:
+
+        writer = csv.writer( fileOut, lineterminator = '\n' )
+        writer.writerow( ATL_US_FIELDS )
+
+        for day in reversed( range( days )):
+
+            date = START_DATE + datetime.timedelta( days = day )
+
+            row = dict.fromkeys( ATL_US_FIELDS, '' )
+            row.update( series[ day ] )
+            row.update( { 'date' : date.strftime( '%Y%m%d' ), 'states' : '56',
+                        'dateChecked' : f'{date}T00:00:00Z',
+                        'lastModified' : f'{date}T00:00:00Z',
+                        'hash' : f'{rng.getrandbits( 160 ):040x}' } )
+            writer.writerow( [ row[ field ] for field in ATL_US_FIELDS ] )
+
+    return days
+
+def write_mask_use( path, counties, rng ):
+    """ This function writes the NY Times mask-use file: a line per county with the
+    shares of people who never, rarely, sometimes, frequently and always wear a
+    mask, which add up to one. """
+    # ARGUMENT path -> str path of the file to write
+    # ARGUMENT counties -> list of tuples ( str State, str County, str FIPS )
+    # ARGUMENT rng -> random.Random( ) object
+
+    # RETURN int lines
+
+    with open_data_file( path, 'w', encoding = 'utf-8', newline = '' ) as fileOut:
+
+        writer = csv.writer( fileOut, lineterminator = '\n' )
+        writer.writerow( [ 'COUNTYFP', 'NEVER', 'RARELY', 'SOMETIMES', 'FREQUENTLY',
+                            'ALWAYS' ] )
+
+        for ( state, county, fips ) in counties:
+
+            weights = [ rng.random( ) for share in range( 5 ) ]
+            shares = [ round( weight / sum( weights ), 3 ) for weight in weights ]
+            shares[ -1 ] = round( 1 - sum( shares[ : -1 ] ), 3 )
+
+            writer.writerow( [ fips ] + [ f'{share:.3f}' for share in shares ] )
+
+    return len( counties )
+
+def atlantic_series( days, rng, scale = 1 ):
+    """ This function makes the cumulative counts of The Atlantic for each day. The
+    hospital counts start blank, as they did in the real data. """
+    # ARGUMENT days -> int days of data
+    # ARGUMENT rng -> random.Random( ) object
+    # ARGUMENT scale -> int size of the counts; DEFAULT
+
+    # RETURN list of dicts { str field : str count }, one per day
+
+    series = [ ]
+    totals = dict.fromkeys( [ 'positive', 'negative', 'hospitalizedCumulative',
+                                'inIcuCumulative', 'onVentilatorCumulative', 'death' ], 0 )
+    previous = dict( totals )
+
+    for day in range( days ):
+
+        totals[ 'positive' ] += rng.randrange( 500 * scale )
+        totals[ 'negative' ] += rng.randrange( 5000 * scale )
+        totals[ 'hospitalizedCumulative' ] += rng.randrange( 50 * scale )
+        totals[ 'inIcuCumulative' ] += rng.randrange( 10 * scale )
+        totals[ 'onVentilatorCumulative' ] += rng.randrange( 5 * scale )
+        totals[ 'death' ] += rng.randrange( 20 * scale )
+
+        counts = { field : str( count ) for field, count in totals.items( ) }
+
+        if day < 14:
+            for field in ( 'hospitalizedCumulative', 'inIcuCumulative',
+                            'onVentilatorCumulative' ):
+                counts[ field ] = ''
+
+        tests = totals[ 'positive' ] + totals[ 'negative' ]
+        counts.update( { 'hospitalized' : counts[ 'hospitalizedCumulative' ],
+                        'total' : str( tests ), 'totalTestResults' : str( tests ),
+                        'posNeg' : str( tests ),
+                        'positiveIncrease' : str( totals[ 'positive' ]
+                                                    - previous[ 'positive' ] ),
+                        'negativeIncrease' : str( totals[ 'negative' ]
+                                                    - previous[ 'negative' ] ),
+                        'deathIncrease' : str( totals[ 'death' ] - previous[ 'death' ] ),
+                        'hospitalizedIncrease' : str(
+                                            totals[ 'hospitalizedCumulative' ]
+                                            - previous[ 'hospitalizedCumulative' ] ) } )
+
+        series.append( counts )
+        previous = dict( totals )
+
+    return series
+
+if __name__ == '__main__':
+    main( )
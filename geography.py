@@ -0,0 +1,257 @@
+# geography
+""" This module is the one place the scripts look up states and counties, so that
+the datasets can be joined on FIPS codes however they name places: the NY Times
+data by state and county name plus FIPS, The Atlantic data by postal code plus
+state FIPS, and the US Census data by STATE and COUNTY codes.
+
+The states and territories are a constant table of postal codes, names and FIPS
+codes. The counties are read once from the US Census counties file
+(usc_counties_2019.csv, or its tab-delimited table) into dicts keyed by their
+five-digit FIPS code as an int and by ( State, normalized county name ). A county
+name is normalized by dropping the kind of county the Census adds to it (County,
+Parish, Borough, Census Area, City and Borough or Municipality), which gives the
+names the NY Times uses (e.g. Orleans Parish -> Orleans). Independent cities keep
+their 'city' (e.g. Richmond city), as they do in the NY Times data, to tell them
+from the county of the same name. 
+
+The Census also files each state under one of four regions and nine divisions,
+whose names are constant tables keyed by their REGION and DIVISION codes. """
+import csv
+import os
+
+from compressed_files import find_data_file, open_data_file, strip_compression
+
+# US Census counties file the geography is read from by default (next to this
+# module)
+CENSUS_PATH = os.path.join( os.path.dirname( os.path.abspath( __file__ )),
+                            'usc_counties_2019.csv' )
+
+# kinds of county the US Census adds to the names, longest first
+COUNTY_SUFFIXES = [ ' City and Borough', ' Census Area', ' Municipality', ' Borough',
+                    ' Parish', ' County' ]
+
+# states and territories { str postal code : tuple ( str name, int FIPS ) }
+STATES = { 'AL' : ( 'Alabama', 1 ), 'AK' : ( 'Alaska', 2 ), 'AZ' : ( 'Arizona', 4 ),
+            'AR' : ( 'Arkansas', 5 ), 'CA' : ( 'California', 6 ),
+            'CO' : ( 'Colorado', 8 ), 'CT' : ( 'Connecticut', 9 ),
+            'DE' : ( 'Delaware', 10 ), 'DC' : ( 'District of Columbia', 11 ),
+            'FL' : ( 'Florida', 12 ), 'GA' : ( 'Georgia', 13 ), 'HI' : ( 'Hawaii', 15 ),
+            'ID' : ( 'Idaho', 16 ), 'IL' : ( 'Illinois', 17 ), 'IN' : ( 'Indiana', 18 ),
+            'IA' : ( 'Iowa', 19 ), 'KS' : ( 'Kansas', 20 ), 'KY' : ( 'Kentucky', 21 ),
+            'LA' : ( 'Louisiana', 22 ), 'ME' : ( 'Maine', 23 ),
+            'MD' : ( 'Maryland', 24 ), 'MA' : ( 'Massachusetts', 25 ),
+            'MI' : ( 'Michigan', 26 ), 'MN' : ( 'Minnesota', 27 ),
+            'MS' : ( 'Mississippi', 28 ), 'MO' : ( 'Missouri', 29 ),
+            'MT' : ( 'Montana', 30 ), 'NE' : ( 'Nebraska', 31 ), 'NV' : ( 'Nevada', 32 ),
+            'NH' : ( 'New Hampshire', 33 ), 'NJ' : ( 'New Jersey', 34 ),
+            'NM' : ( 'New Mexico', 35 ), 'NY' : ( 'New York', 36 ),
+            'NC' : ( 'North Carolina', 37 ), 'ND' : ( 'North Dakota', 38 ),
+            'OH' : ( 'Ohio', 39 ), 'OK' : ( 'Oklahoma', 40 ), 'OR' : ( 'Oregon', 41 ),
+            'PA' : ( 'Pennsylvania', 42 ), 'RI' : ( 'Rhode Island', 44 ),
+            'SC' : ( 'South Carolina', 45 ), 'SD' : ( 'South Dakota', 46 ),
+            'TN' : ( 'Tennessee', 47 ), 'TX' : ( 'Texas', 48 ), 'UT' : ( 'Utah', 49 ),
+            'VT' : ( 'Vermont', 50 ), 'VA' : ( 'Virginia', 51 ),
+            'WA' : ( 'Washington', 53 ), 'WV' : ( 'West Virginia', 54 ),
+            'WI' : ( 'Wisconsin', 55 ), 'WY' : ( 'Wyoming', 56 ),
+            'AS' : ( 'American Samoa', 60 ), 'GU' : ( 'Guam', 66 ),
+            'MP' : ( 'Northern Mariana Islands', 69 ), 'PR' : ( 'Puerto Rico', 72 ),
+            'VI' : ( 'Virgin Islands', 78 ) }
+
+# Census regions and divisions { int code : str name }
+REGION_NAMES = { 1 : 'Northeast', 2 : 'Midwest', 3 : 'South', 4 : 'West' }
+DIVISION_NAMES = { 1 : 'New England', 2 : 'Middle Atlantic', 3 : 'East North Central',
+                    4 : 'West North Central', 5 : 'South Atlantic', 
+                    6 : 'East South Central', 7 : 'West South Central', 8 : 'Mountain',
+                    9 : 'Pacific' }
+
+# the same table keyed the other ways
+STATE_NAMES = { code : name for code, ( name, fips ) in STATES.items( ) }
+POSTAL_CODES = { name : code for code, ( name, fips ) in STATES.items( ) }
+STATE_FIPS = { name : fips for code, ( name, fips ) in STATES.items( ) }
+STATES_BY_FIPS = { fips : name for code, ( name, fips ) in STATES.items( ) }
+
+# geographies already read { tuple ( str path, int mtime in ns ) : Geography( ) }
+GEOGRAPHIES = { }
+
+class Geography( ):
+    """ This object holds the counties of the US Census file with lookups by FIPS
+    code and by name. """
+
+    def __init__( self, path = CENSUS_PATH ):
+        """ Initializes the object. """
+        # ARGUMENT path -> str path of the US Census counties file, as CSV or as a
+        #   tab-delimited table; DEFAULT
+
+        # counties and states by FIPS code (a state is its county 0)
+        # dict { int FIPS : dict { 'state' : str, 'county' : str normalized name,
+        #   'name' : str Census name, 'postal_code' : str, 'region' : int,
+        #   'division' : int, 'population' : int }}
+        self.counties = { }
+
+        # dict { tuple ( str State, str normalized county name ) : int FIPS }
+        self.county_ids = { }
+
+        # {'SUMLEV': 0, 'REGION': 1, 'DIVISION': 2, 'STATE': 3, 'COUNTY': 4,
+        #   'STNAME': 5, 'CTYNAME': 6, 'CENSUS2010POP': 7, ...
+        #   'POPESTIMATE2019': 18, ...
+        for fields in read_census_rows( path ):
+
+            fips = fips_code( fields[ 3 ] + fields[ 4 ] )
+            county = normalize_county_name( fields[ 6 ] )
+
+            self.counties[ fips ] = { 'state' : fields[ 5 ], 'county' : county,
+                                    'name' : fields[ 6 ],
+                                    'postal_code' : POSTAL_CODES.get( fields[ 5 ] ),
+                                    'region' : parse_int( fields[ 1 ] ),
+                                    'division' : parse_int( fields[ 2 ] ),
+                                    'population' : parse_int( fields[ 18 ] ) }
+
+            # a state's own line is looked up by the state alone
+            if fips % 1000:
+                self.county_ids[ ( fields[ 5 ], county ) ] = fips
+
+        return
+
+    def county_fips( self, state, county ):
+        """ Returns the FIPS code of a county from its state and its name, with or
+        without the kind of county. """
+        # ARGUMENT state -> str State
+        # ARGUMENT county -> str County
+
+        # RETURN int FIPS, or None for a county that isn't in the Census (e.g. the
+        #   NY Times 'Unknown' or 'New York City')
+
+        fips = self.county_ids.get( ( state, county ))
+
+        if fips is None:
+            fips = self.county_ids.get( ( state, normalize_county_name( county )))
+
+        return fips
+
+    def county( self, fips ):
+        """ Returns what the Census has on a county (or on a state, by its FIPS code
+        times 1000). """
+        # ARGUMENT fips -> int FIPS
+
+        # RETURN dict (see self.counties), or None
+
+        return self.counties.get( fips )
+        
+    def state( self, state ):
+        """ Returns what the Census has on a state by its name. """
+        # ARGUMENT state -> str State
+        
+        # RETURN dict (see self.counties), or None for a state that isn't in the 
+        #   Census (e.g. a territory)
+        
+        fips = STATE_FIPS.get( state )
+        
+        return None if fips is None else self.counties.get( fips * 1000 )
+
+    def population( self, fips ):
+        """ Returns the 2019 population estimate of a county. """
+        # ARGUMENT fips -> int FIPS, or None
+
+        # RETURN int population, or None
+
+        return self.counties.get( fips, { } ).get( 'population' )
+
+    def county_populations( self, counties ):
+        """ Returns the populations of counties, joined on their FIPS codes. A county
+        given without its FIPS code is looked up by name. """
+        # ARGUMENT counties -> list of tuples ( str State, str County ) or ( str 
+        #   State, str County, int FIPS or None )
+
+        # RETURN dict { tuple county as given : int population }; a county that 
+        #   isn't in the Census is left out
+
+        populations = { }
+
+        for county in counties:
+
+            fips = county[ 2 ] if len( county ) > 2 else None
+            
+            if fips is None:
+                fips = self.county_fips( county[ 0 ], county[ 1 ] )
+                
+            population = self.population( fips )
+
+            if population is not None:
+                populations[ county ] = population
+
+        return populations
+
+def load_geography( path = CENSUS_PATH ):
+    """ This function gives the geography of a US Census counties file, reading the
+    file only the first time (or when it has changed). """
+    # ARGUMENT path -> str path of the US Census counties file; DEFAULT
+
+    # RETURN Geography( ) object
+
+    path = find_data_file( path )
+    key = ( path, os.stat( path ).st_mtime_ns )
+
+    if key not in GEOGRAPHIES:
+        GEOGRAPHIES[ key ] = Geography( path )
+
+    return GEOGRAPHIES[ key ]
+
+def read_census_rows( path ):
+    """ This generator reads the data lines of the US Census counties file, from the
+    CSV or from its tab-delimited table. """
+    # ARGUMENT path -> str path of the file
+
+    # YIELD list of str fields
+
+    with open_data_file( path, 'r', encoding = 'utf-8', errors = 'replace',
+                        newline = '' ) as fileIn:
+
+        if strip_compression( path ).endswith( '.csv' ):
+            rows = csv.reader( fileIn )
+        else:
+            rows = ( line.rstrip( '\r\n' ).split( '\t' ) for line in fileIn )
+
+        next( rows, None )  # skip the header line
+
+        for fields in rows:
+            if len( fields ) > 18:
+                yield fields
+
+    return
+
+def normalize_county_name( county ):
+    """ This function drops the kind of county from a US Census county name (e.g.
+    Orleans Parish -> Orleans), which gives the name the NY Times uses. """
+    # ARGUMENT county -> str county name
+
+    # RETURN str county name
+
+    for suffix in COUNTY_SUFFIXES:
+        if county.endswith( suffix ):
+            return county[ : -len( suffix ) ]
+
+    return county
+
+def fips_code( text ):
+    """ This function reads a FIPS code as an int, so that e.g. '06037' and '6037'
+    are the same. """
+    # ARGUMENT text -> str code
+
+    # RETURN int code, or None for a blank or invalid code
+
+    try:
+        return int( text )
+    except ( TypeError, ValueError ):
+        return None
+
+def parse_int( text ):
+    """ This function reads a number of the US Census file (e.g. a REGION code or a
+    population) as an int. """
+    # ARGUMENT text -> str number
+
+    # RETURN int number, or None for a blank or invalid number
+
+    try:
+        return int( text )
+    except ( TypeError, ValueError ):
+        return None
@@ -0,0 +1,266 @@
+# incremental_output
+""" This module keeps the state of the output tables of the parsing script, so that
+a run after an update that only added new dates can add their lines to the tables
+instead of making them again from the whole history.
+
+The state of a table is a JSON file next to it (e.g. county_cases_and_deaths.state.json)
+holding:
+
+    key         the criteria, options and source files the table was made from
+    columns     the columns of the table (e.g. the counties)
+    last_date   the last date of the sources when the table was made
+    checksums   the SHA-1 of the source lines of each date up to last_date, by
+                source file
+    offsets     the byte offsets in the table where the lines of new dates go (the
+                end of each section)
+    output      the size and modification time of the table as it was written
+
+A table can be updated in place only if its state has the same key and the table
+hasn't been written since (by a full run, or by hand). The checksums of the dates
+up to last_date are then compared with those of the sources: a date whose lines
+have changed, appeared or gone means that upstream revised older data, and the
+table has to be made again. Otherwise, only the dates after last_date are read
+(through the date indexes of the sources, see date_index.py) and their lines are
+inserted at the offsets. """
+import datetime
+import hashlib
+import json
+import os
+import shutil
+
+from compressed_files import find_data_file, open_data_file
+from date_index import in_date_range, iso_date, load_date_index
+
+STATE_VERSION = 1   # int bumped whenever the layout of the state changes
+
+# int bytes copied at a time when lines are inserted into a table
+COPY_CHUNK = 1 << 20
+
+def state_path_for( path ):
+    """ This function gives the path of the state file of an output table. """
+    # ARGUMENT path -> str path of the output table
+
+    # RETURN str path of the state file
+
+    return f'{os.path.splitext( path )[ 0 ]}.state.json'
+
+def output_signature( path ):
+    """ This function gives the size and modification time of an output table, which
+    tell whether it has been written since its state was saved. """
+    # ARGUMENT path -> str path of the output table
+
+    # RETURN dict { str : int }
+
+    stats = os.stat( path )
+
+    return { 'size' : stats.st_size, 'mtime_ns' : stats.st_mtime_ns }
+
+def load_output_state( path, key ):
+    """ This function reads the state of an output table if it was saved for the
+    same key and the table hasn't been written since; otherwise, the table has to
+    be made again. """
+    # ARGUMENT path -> str path of the output table
+    # ARGUMENT key -> dict of the criteria, options and source files of the table
+    #   (JSON values)
+
+    # RETURN dict of the state, or None
+
+    try:
+        with open( state_path_for( path )) as fileIn:
+            state = json.load( fileIn )
+
+        current = output_signature( path )
+
+    except ( OSError, ValueError ):
+        return None
+
+    # the key is compared as it reads back from JSON (e.g. tuples become lists)
+    if ( state.get( 'version' ) != STATE_VERSION
+        or state.get( 'key' ) != json.loads( json.dumps( key ))
+        or state.get( 'output' ) != current ):
+        return None
+
+    return state
+
+def save_output_state( path, key, columns, lastDate, checksums, offsets, **extra ):
+    """ This function writes the state of an output table that was just written. """
+    # ARGUMENT path -> str path of the output table
+    # ARGUMENT key -> dict of the criteria, options and source files of the table
+    # ARGUMENT columns -> list of the columns of the table (JSON values)
+    # ARGUMENT lastDate -> str last date of the sources as YYYY-MM-DD, or None
+    # ARGUMENT checksums -> dict { str source path : dict { str date : str SHA-1 }}
+    # ARGUMENT offsets -> list of int byte offsets where the lines of new dates go
+    # ARGUMENT extra -> other JSON values to keep with the state
+
+    # RETURN nothing
+
+    state = { 'version' : STATE_VERSION, 'key' : key, 'columns' : columns,
+                'last_date' : lastDate, 'checksums' : checksums, 'offsets' : offsets,
+                **extra, 'output' : output_signature( path ) }
+
+    statePath = state_path_for( path )
+
+    # write the state under a temporary name and then move it into place
+    with open( f'{statePath}.tmp', 'w' ) as fileOut:
+        json.dump( state, fileOut )
+
+    os.replace( f'{statePath}.tmp', statePath )
+
+    return
+
+def date_checksums( path, startDate = None, endDate = None ):
+    """ This function gives the SHA-1 of the lines of each date of a table whose
+    first field is the date, in the order they are in the table. The byte ranges of
+    the dates are read from the date index of the table if it is current (without
+    parsing the lines); otherwise, the table is read through. """
+    # ARGUMENT path -> str path of the table
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+
+    # RETURN dict { str date as YYYY-MM-DD : str hex SHA-1 }
+
+    hashes = { }    # dict { str date : hashlib object }
+    dateIndex = load_date_index( path )
+
+    if dateIndex:
+
+        with open( dateIndex.path, 'rb' ) as fileIn:
+
+            for ( date, start, end ) in dateIndex.runs:
+
+                if not in_date_range( date, startDate, endDate ):
+                    continue
+
+                if date not in hashes:
+                    hashes[ date ] = hashlib.sha1( )
+
+                fileIn.seek( start )
+                hashes[ date ].update( fileIn.read( end - start ))
+
+    else:
+
+        with open_data_file( find_data_file( path ), 'rb' ) as fileIn:
+
+            next( fileIn, None )    # skip the header line
+
+            for line in fileIn:
+
+                if not line.strip( ):
+                    continue
+
+                date = iso_date( line[ : line.find( b'\t' ) ].decode( ))
+
+                if not in_date_range( date, startDate, endDate ):
+                    continue
+
+                if date not in hashes:
+                    hashes[ date ] = hashlib.sha1( )
+
+                hashes[ date ].update( line )
+
+    return { date : digest.hexdigest( ) for date, digest in hashes.items( ) }
+
+def revised_dates( state, checksums ):
+    """ This function finds the dates up to the last date of a state whose source
+    lines have changed, appeared or gone since the state was saved. """
+    # ARGUMENT state -> dict returned by load_output_state( )
+    # ARGUMENT checksums -> dict { str source path : dict { str date : str SHA-1 }}
+    #   of the sources now
+
+    # RETURN sorted list of str dates
+
+    lastDate = state[ 'last_date' ]
+    revised = set( )
+
+    for source in set( state[ 'checksums' ] ) | set( checksums ):
+
+        before = state[ 'checksums' ].get( source, { } )
+        now = checksums.get( source, { } )
+
+        revised.update( date for date in set( before ) | set( now )
+                        if ( lastDate is None or date <= lastDate )
+                        and before.get( date ) != now.get( date ))
+
+    return sorted( revised )
+
+def last_date_of( checksums ):
+    """ This function gives the last date of the sources. """
+    # ARGUMENT checksums -> dict { str source path : dict { str date : str SHA-1 }}
+
+    # RETURN str date as YYYY-MM-DD, or None if the sources have no lines
+
+    return max( ( date for dates in checksums.values( ) for date in dates ),
+                default = None )
+
+def next_date( date ):
+    """ This function gives the date after a date. """
+    # ARGUMENT date -> str date as YYYY-MM-DD
+
+    # RETURN str date as YYYY-MM-DD
+
+    return ( datetime.date.fromisoformat( date ) + datetime.timedelta( 1 )).isoformat( )
+
+def line_bytes( lines ):
+    """ This function encodes lines as the output tables are written, each with its
+    line break. """
+    # ARGUMENT lines -> list of str lines
+
+    # RETURN bytes
+
+    return ''.join( f'{line}\n' for line in lines ).encode( )
+
+def insert_lines( path, offsets, blocks ):
+    """ This function inserts blocks of lines into a table at byte offsets. Lines
+    that all go at the end of the table are appended to it; otherwise, the table is
+    copied with the lines inserted, under a temporary name, and moved into place. """
+    # ARGUMENT path -> str path of the table
+    # ARGUMENT offsets -> list of int byte offsets at the start of a line, ascending
+    # ARGUMENT blocks -> list of lists of str lines, one per offset
+
+    # RETURN list of int offsets of the same places after the insertion
+
+    blocks = [ line_bytes( lines ) for lines in blocks ]
+    size = os.path.getsize( path )
+
+    if all( offset == size for offset in offsets ):
+
+        with open( path, 'ab' ) as fileOut:
+            for block in blocks:
+                fileOut.write( block )
+
+    else:
+
+        with open( path, 'rb' ) as fileIn:
+            with open( f'{path}.tmp', 'wb' ) as fileOut:
+
+                position = 0
+
+                for offset, block in zip( offsets, blocks ):
+
+                    # copy the table up to the offset, then the lines
+                    while position < offset:
+
+                        chunk = fileIn.read( min( COPY_CHUNK, offset - position ))
+
+                        if not chunk:
+                            break
+
+                        fileOut.write( chunk )
+                        position += len( chunk )
+
+                    fileOut.write( block )
+
+                # and the rest of the table
+                shutil.copyfileobj( fileIn, fileOut, COPY_CHUNK )
+
+        os.replace( f'{path}.tmp', path )
+
+    # each offset moves by the lines inserted up to and at it
+    output = [ ]
+    inserted = 0
+
+    for offset, block in zip( offsets, blocks ):
+        inserted += len( block )
+        output.append( offset + inserted )
+
+    return output
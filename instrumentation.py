@@ -0,0 +1,378 @@
+# instrumentation
+""" This module measures the stages of the scripts (e.g. fetching a file, reading
+and filtering a dataset, pivoting it into a table, exporting the table) so that a
+long run can be traced to the stage that took the time.
+
+A stage is a block of code run inside a Stage( ) context manager:
+
+    with stage( 'read_filter', dataset = 'nyt_us_counties' ) as s:
+        ...
+        s.count( rows_out = len( lines ))
+
+Each stage records its duration, rows in and out, bytes read and written, fetch
+attempts and the peak memory of the process. The code of a stage (or anything it
+calls) adds to the counters of the innermost stage of its thread, which it gets
+from current_stage( ); code called outside any stage adds to a throwaway one.
+Bytes read and written that aren't counted by the code are taken from the I/O
+counters of the process (/proc/self/io, on Linux only), so they are only exact for
+stages that don't run alongside others.
+
+The records of the stages are kept by the RECORDER, which appends each one to a
+JSON-lines log as it finishes and can write them all as one JSON summary. Stages
+can also be profiled, opt-in and by name: with cProfile, the statistics of each
+run of the stage are dumped to a .prof file (read it with pstats or snakeviz);
+with tracemalloc, the lines whose memory grew the most during the run are dumped
+to a .txt file. Tracing memory also gives each stage the peak of its own allocations,
+which costs time, so it is off unless asked for. """
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None     # Windows has no resource module, nor peak memory without it
+
+# counters of a stage that the code adds to
+COUNTERS = [ 'rows_in', 'rows_out', 'bytes_read', 'bytes_written', 'attempts' ]
+
+# the profilers a stage can be run under
+PROFILE_MODES = [ 'cprofile', 'tracemalloc' ]
+
+# int lines of a tracemalloc profile
+PROFILE_LINES = 25
+
+# stacks of the active stages of each thread
+STACKS = threading.local( )
+
+class Recorder( ):
+    """ This object keeps the records of the finished stages, writes them to the
+    log and holds the profiling options. """
+
+    def __init__( self ):
+        """ Initializes the object. """
+
+        self.records = [ ]      # list of dicts of the finished stages
+        self.log_path = None    # str path of the JSON-lines log, or None
+        self.profile = set( )   # set of str stage names to profile, or 'all'
+        self.profile_mode = 'cprofile'
+        self.profile_dir = 'profiles'
+        self.trace_memory = False
+        self.lock = threading.Lock( )
+        self.runs = { }         # dict { str stage name : int runs profiled }
+
+        return
+
+    def configure( self, logPath = None, profile = None, profileMode = 'cprofile',
+                    profileDir = 'profiles', traceMemory = False ):
+        """ Sets where the records go and which stages are profiled. """
+        # ARGUMENT logPath -> str path of the JSON-lines log to append to; DEFAULT none
+        # ARGUMENT profile -> list of str stage names to profile, with 'all' for every
+        #   stage; DEFAULT none
+        # ARGUMENT profileMode -> str 'cprofile' or 'tracemalloc'; DEFAULT
+        # ARGUMENT profileDir -> str directory of the profile dumps; DEFAULT
+        # ARGUMENT traceMemory -> bool trace the peak allocations of each stage; DEFAULT
+
+        # RETURN nothing
+
+        if profileMode not in PROFILE_MODES:
+            raise ValueError( f'unknown profile mode {profileMode!r}' )
+
+        self.log_path = logPath
+        self.profile = set( profile or [ ] )
+        self.profile_mode = profileMode
+        self.profile_dir = profileDir
+        self.trace_memory = traceMemory or ( bool( self.profile )
+                                            and profileMode == 'tracemalloc' )
+
+        if self.trace_memory and not tracemalloc.is_tracing( ):
+            tracemalloc.start( )
+
+        return
+
+    def profiles( self, name ):
+        """ Tells whether a stage is profiled. """
+        # ARGUMENT name -> str stage name
+
+        # RETURN bool
+
+        return 'all' in self.profile or name in self.profile
+
+    def profile_path( self, name, extension ):
+        """ Gives a new path for a profile dump of a stage. """
+        # ARGUMENT name -> str stage name
+        # ARGUMENT extension -> str file name extension
+
+        # RETURN str path
+
+        with self.lock:
+            run = self.runs[ name ] = self.runs.get( name, 0 ) + 1
+
+        os.makedirs( self.profile_dir, exist_ok = True )
+
+        fileName = re.sub( r'[^\w.-]', '_', name )
+
+        return f'{self.profile_dir}/{fileName}-{run}{extension}'
+
+    def add( self, record ):
+        """ Keeps the record of a finished stage and appends it to the log. """
+        # ARGUMENT record -> dict of the stage
+
+        # RETURN nothing
+
+        with self.lock:
+
+            self.records.append( record )
+
+            if self.log_path:
+                with open( self.log_path, 'a' ) as fileOut:
+                    fileOut.write( json.dumps( record ) + '\n' )
+
+        return
+
+    def summary( self ):
+        """ Gives the records and their totals by stage name. """
+
+        # RETURN dict { 'stages' : list of dicts, 'totals' : dict { str stage name :
+        #   dict { str measure : number }}}
+
+        totals = { }
+
+        for record in self.records:
+
+            total = totals.setdefault( record[ 'stage' ], dict.fromkeys(
+                                        [ 'runs', 'seconds' ] + COUNTERS, 0 ))
+            total[ 'runs' ] += 1
+            total[ 'seconds' ] += record[ 'seconds' ]
+
+            for counter in COUNTERS:
+                total[ counter ] += record.get( counter ) or 0
+
+        return { 'stages' : list( self.records ), 'totals' : totals }
+
+    def write_summary( self, path ):
+        """ Writes the records and their totals as one JSON document. """
+        # ARGUMENT path -> str path of the file
+
+        # RETURN nothing
+
+        with open( path, 'w' ) as fileOut:
+            json.dump( self.summary( ), fileOut, indent = 2 )
+
+        return
+
+class Stage( ):
+    """ This context manager measures one run of a stage and records it when the
+    block finishes (or fails). """
+
+    def __init__( self, name, recorder = None, **labels ):
+        """ Initializes the object. """
+        # ARGUMENT name -> str stage name
+        # ARGUMENT recorder -> Recorder( ) object to keep the record, or None to
+        #   keep none; DEFAULT
+        # ARGUMENT labels -> str values that identify the run, e.g. dataset or path
+
+        self.name = name
+        self.recorder = recorder
+        self.labels = labels
+
+        # the counts of bytes and attempts are None until the code counts them
+        self.rows_in = 0
+        self.rows_out = 0
+        self.bytes_read = None
+        self.bytes_written = None
+        self.attempts = None
+
+        self.traced_peak = 0    # int peak bytes allocated by the stages inside
+        self.profiler = None    # cProfile.Profile( ) object of a profiled stage
+        self.snapshot = None    # tracemalloc snapshot at the start of a profiled stage
+
+        return
+
+    def count( self, **counts ):
+        """ Adds to the counters of the stage. """
+        # ARGUMENT counts -> int amounts keyed by counter name (see COUNTERS)
+
+        # RETURN nothing
+
+        for counter, amount in counts.items( ):
+            setattr( self, counter, ( getattr( self, counter ) or 0 ) + amount )
+
+        return
+
+    def __enter__( self ):
+
+        recorder = self.recorder
+
+        if recorder and recorder.profiles( self.name ):
+
+            if recorder.profile_mode == 'cprofile':
+
+                # only one profiler can run at a time (in Python 3.12 and later), so
+                # a stage that overlaps a profiled one isn't profiled
+                try:
+                    self.profiler = cProfile.Profile( )
+                    self.profiler.enable( )
+                except ValueError:
+                    self.profiler = None
+                    
+            else:
+                self.snapshot = tracemalloc.take_snapshot( )
+
+        if not hasattr( STACKS, 'stack' ):
+            STACKS.stack = [ ]
+
+        # the peak so far belongs to the stage around this one
+        if tracemalloc.is_tracing( ):
+
+            if STACKS.stack:
+                outer = STACKS.stack[ -1 ]
+                outer.traced_peak = max( outer.traced_peak,
+                                        tracemalloc.get_traced_memory( )[ 1 ] )
+
+            tracemalloc.reset_peak( )
+
+        STACKS.stack.append( self )
+
+        self.io = read_process_io( )
+        self.start = time.perf_counter( )
+
+        return self
+
+    def __exit__( self, excType, excValue, traceback ):
+
+        seconds = time.perf_counter( ) - self.start
+        io = read_process_io( )
+
+        if self.profiler:
+            self.profiler.disable( )
+
+        STACKS.stack.remove( self )
+
+        record = { 'stage' : self.name, **self.labels,
+                    'status' : 'failed' if excType else 'ok',
+                    'started' : time.time( ) - seconds, 'seconds' : seconds,
+                    'rows_in' : self.rows_in, 'rows_out' : self.rows_out,
+                    'bytes_read' : self.bytes_read, 'bytes_written' : self.bytes_written }
+
+        # bytes the code didn't count come from the I/O counters of the process
+        if self.bytes_read is None and io and self.io:
+            record[ 'bytes_read' ] = io[ 0 ] - self.io[ 0 ]
+
+        if self.bytes_written is None and io and self.io:
+            record[ 'bytes_written' ] = io[ 1 ] - self.io[ 1 ]
+
+        if self.attempts is not None:
+            record[ 'attempts' ] = self.attempts
+
+        record[ 'peak_rss_kb' ] = peak_rss_kb( )
+
+        # the peak of the stage is also a peak of the stage around it, which the
+        # reset for this one would otherwise lose
+        if tracemalloc.is_tracing( ):
+
+            self.traced_peak = max( self.traced_peak, tracemalloc.get_traced_memory( )[ 1 ] )
+            record[ 'peak_traced_kb' ] = self.traced_peak >> 10
+
+            if STACKS.stack:
+                outer = STACKS.stack[ -1 ]
+                outer.traced_peak = max( outer.traced_peak, self.traced_peak )
+
+        if self.recorder:
+
+            if self.profiler:
+                record[ 'profile' ] = self.recorder.profile_path( self.name, '.prof' )
+                self.profiler.dump_stats( record[ 'profile' ] )
+
+            elif self.snapshot:
+                record[ 'profile' ] = self.recorder.profile_path( self.name, '.txt' )
+                dump_memory_profile( record[ 'profile' ], self.snapshot )
+
+            self.recorder.add( record )
+
+        return False
+
+# the records of the stages of the scripts
+RECORDER = Recorder( )
+
+def stage( name, **labels ):
+    """ This function starts a stage recorded by the RECORDER. """
+    # ARGUMENT name -> str stage name
+    # ARGUMENT labels -> str values that identify the run, e.g. dataset or path
+
+    # RETURN Stage( ) object to use in a with statement
+
+    return Stage( name, RECORDER, **labels )
+
+def current_stage( ):
+    """ This function gives the innermost active stage of the calling thread, or a
+    throwaway stage if there is none, so code can count without checking. """
+
+    # RETURN Stage( ) object
+
+    stack = getattr( STACKS, 'stack', None )
+
+    return stack[ -1 ] if stack else Stage( '' )
+
+def read_process_io( ):
+    """ This function reads the bytes read and written by the process so far,
+    including those served from the page cache. """
+
+    # RETURN tuple ( int bytes read, int bytes written ), or None where the counters
+    #   aren't available
+
+    try:
+        with open( '/proc/self/io' ) as fileIn:
+            counters = dict( line.split( ': ' ) for line in fileIn.read( ).split( '\n' )
+                            if ': ' in line )
+
+        return ( int( counters[ 'rchar' ] ), int( counters[ 'wchar' ] ))
+
+    except ( OSError, KeyError, ValueError ):
+        return None
+
+def peak_rss_kb( ):
+    """ This function gives the peak resident memory of the process so far. """
+
+    # RETURN int kilobytes, or None without the resource module
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak >> 10 if sys.platform == 'darwin' else peak
+
+def dump_memory_profile( path, start ):
+    """ This function writes the lines whose traced memory grew the most since a
+    snapshot. """
+    # ARGUMENT path -> str path of the file
+    # ARGUMENT start -> tracemalloc.Snapshot( ) object taken at the start
+
+    # RETURN nothing
+
+    statistics = tracemalloc.take_snapshot( ).compare_to( start, 'lineno' )
+
+    with open( path, 'w' ) as fileOut:
+        for statistic in statistics[ : PROFILE_LINES ]:
+            fileOut.write( f'{statistic}\n' )
+
+    return
+
+def file_size( path ):
+    """ This function gives the size of a file on disk, or None if it doesn't
+    exist. """
+    # ARGUMENT path -> str path of the file
+
+    # RETURN int bytes or None
+
+    try:
+        return os.path.getsize( path )
+    except ( OSError, TypeError ):
+        return None
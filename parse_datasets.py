@@ -6,11 +6,287 @@ manageable sizes.
 The NY Times and The Atlantic files to be parsed were created by the update script 
 and stored in the /covid_data/ directory. The cenus data (in the same directory) is
 downloaded from 'https://www2.census.gov/programs-surveys/popest/datasets/2010-2019/counties/totals/co-est2019-alldata.csv'
-saved as 'usc_counties_2019.txt'. """
+saved as 'usc_counties_2019.txt'.
 
+The NY Times counties data are read from the columnar cache written by the update 
+script (see columnar_cache.py) whenever the cache is newer than the text file. 
+
+Any of the files may be stored compressed as .gz or .zst (see compressed_files.py);
+they are still given by their plain paths. 
+
+Each stage of the parsing (reading and filtering a dataset, pivoting it into
+matrices, formatting and exporting the tables) is measured (see instrumentation.py);
+the measurements are written with --metrics-log or --metrics-summary, and any stage
+can be profiled with --profile. 
+
+With --database, the datasets are queried from the SQLite database loaded by the
+update script (see sqlite_store.py) instead of being read from the tables, so a
+few counties are looked up in its indexes rather than found by a scan. 
+
+With --start-date and --end-date, the tables only cover a range of dates. The
+tables ordered by date have a date index written by the update script (see 
+date_index.py), so only the lines of the range are read. 
+
+With --workers, the NY Times text file is split into shards of whole lines that a
+pool of processes reads and filters in parallel; the partial tables are merged in
+the order of the shards, so the tables are the same as those read in one pass. 
+
+With --rollup, the NY Times data are also written summed by state, Census division,
+Census region or for the USA, read from the rollup cube of the update script (see
+rollup_cube.py). 
+
+With --incremental, the county and state tables written by an earlier run are
+brought up to date by adding the lines of the new dates only; they are made again
+when older dates were revised upstream or the columns have changed (see 
+incremental_output.py). """
+import argparse
+import array
+import concurrent.futures
+import contextlib
+import datetime
+import heapq
+import itertools
+import os
+
+from columnar_cache import ( MISSING, format_count, format_field, load_columnar_cache,
+                                parse_count )
+from compressed_files import compression_of, find_data_file, open_data_file
+from county_metrics import METRICS, compute_county_metrics, format_metric_table
+from date_index import in_date_range, iso_date, load_date_index
+from geography import STATE_NAMES, fips_code, load_geography, normalize_county_name
+from incremental_output import ( date_checksums, insert_lines, last_date_of, line_bytes,
+                                    load_output_state, next_date, revised_dates, 
+                                    save_output_state )
+from instrumentation import PROFILE_MODES, RECORDER, current_stage, file_size, stage
+from result_cache import DEFAULT_MAX_BYTES, Result_Cache
+from rollup_cube import ROLLUP_FIELDS, ROLLUP_LEVELS, Rollup, load_rollup_cube
+from sqlite_store import ( atlantic_postal_codes, connect_database, 
+                            query_atlantic_states, query_atlantic_us, 
+                            query_census_counties, query_mask_use, query_nyt_counties )
+
+WRITE_BUFFER = 1 << 20      # int bytes buffered by the output files
+WRITE_CHUNK_LINES = 4096    # int lines joined into each write to an output file
+
+# int bytes of a row of the columnar cache (a date id, cases and deaths)
+ROW_BYTES = 4 + 8 + 8
+
+# int fewest bytes of the shards of a file read in parallel
+SHARD_MIN_BYTES = 1 << 20
+
+# fields of The Atlantic data reported for the USA and each state
+STATE_FIELDS = [ 'positives', 'hospitalized', 'icu', 'ventilator', 'deaths' ]
+
+# shares of the NY Times mask-use estimates of each county
+MASK_FIELDS = [ 'never', 'rarely', 'sometimes', 'frequently', 'always' ]
+
+class Criteria_Index( ):
+    """ This object compiles a list of ( State, County ) criteria into hash lookups
+    so that each line of data is classified once, however many criteria there are. 
+    An entry of None (or '') for either means that no entries will be filtered. """
+
+    def __init__( self, criteria ):
+        """ Initializes the object. """
+        # ARGUMENT criteria -> list of tuples ( str State, str County )
+    
+        self.criteria = [ ( state or None, county or None ) 
+                            for ( state, county ) in criteria ]
+        
+        # dicts of lists of int criterion indices keyed by what they must match
+        self.exact = { }        # dict { tuple ( str State, str County ) : list }
+        self.states = { }       # dict { str State : list } for ( State, None )
+        self.counties = { }     # dict { str County : list } for ( None, County )
+        self.wildcards = [ ]    # list for ( None, None )
+        
+        # memo of the classified keys
+        # dict { tuple ( str State, str County ) : tuple of int criterion indices }
+        self.memo = { }
+        
+        for i, ( state, county ) in enumerate( self.criteria ):
+        
+            if state and county:
+                self.exact.setdefault( ( state, county ), [ ] ).append( i )
+            elif state:
+                self.states.setdefault( state, [ ] ).append( i )
+            elif county:
+                self.counties.setdefault( county, [ ] ).append( i )
+            else:
+                self.wildcards.append( i )
+        
+        return
+        
+    def match( self, state, county = None ):
+        """ Returns a tuple of the indices of the criteria that a ( State, County ) 
+        meets, in the order of the criteria. The tuple is empty if none are met. """
+        # ARGUMENT state -> str State of a line of data
+        # ARGUMENT county -> str County of a line of data; DEFAULT
+        
+        # RETURN
+        matches = self.memo.get( ( state, county ))  # tuple of int indices
+        
+        if matches is None:
+        
+            matches = tuple( sorted( self.exact.get( ( state, county ), [ ] ) 
+                                    + self.states.get( state, [ ] )
+                                    + self.counties.get( county, [ ] )
+                                    + self.wildcards ))
+            self.memo[ ( state, county ) ] = matches
+            
+        return matches
+        
+    def filter_criteria( self ):
+        """ Returns the criteria that a line must meet at least one of to match, 
+        e.g. to select the lines from a database. """
+        
+        # RETURN list of tuples ( str State, str County )
+        
+        return self.criteria
+        
+class Criteria_Groups( ):
+    """ This object routes a line of data to every named group of criteria that it
+    meets, classifying each ( State, County ) once for all of the groups together. 
+    With splitByState, every state is also a group of its own named after the state
+    (so a named group shouldn't share the name of a state). """
+    
+    def __init__( self, groups, splitByState = False ):
+        """ Initializes the object. """
+        # ARGUMENT groups -> dict { str group name : list of tuples ( str State, 
+        #   str County ) }
+        # ARGUMENT splitByState -> bool also make a group for each state; DEFAULT
+        
+        self.groups = dict( groups )
+        self.split_by_state = splitByState
+        
+        # the criteria of all of the groups in one index, and the group and the 
+        # index within the group of each of them
+        criteria = [ ]
+        self.owners = [ ]   # list of tuples ( str group name, int criterion index )
+        
+        for name, groupCriteria in self.groups.items( ):
+            for i, criterion in enumerate( groupCriteria ):
+                criteria.append( criterion )
+                self.owners.append( ( name, i ))
+                
+        self.index = Criteria_Index( criteria )
+        
+        # memo of the routed keys
+        # dict { tuple ( str State, str County ) : tuple of routes }
+        self.memo = { }
+        
+        return
+        
+    def match( self, state, county = None ):
+        """ Returns a tuple of the groups that a ( State, County ) meets, each as a 
+        tuple ( str group name, tuple of int criterion indices within the group ). 
+        The tuple is empty if no group is met. """
+        # ARGUMENT state -> str State of a line of data
+        # ARGUMENT county -> str County of a line of data; DEFAULT
+        
+        # RETURN
+        routes = self.memo.get( ( state, county ))   # tuple of routes
+        
+        if routes is None:
+        
+            groupMatches = { }  # dict { str group name : list of int indices }
+            
+            for i in self.index.match( state, county ):
+                ( name, j ) = self.owners[ i ]
+                groupMatches.setdefault( name, [ ] ).append( j )
+                
+            routes = tuple( ( name, tuple( matches )) 
+                            for name, matches in groupMatches.items( ))
+                            
+            if self.split_by_state and state:
+                routes += ( ( state, ( 0, )), )
+                
+            self.memo[ ( state, county ) ] = routes
+            
+        return routes
+        
+    def criteria( self, name ):
+        """ Returns the criteria of a group. """
+        # ARGUMENT name -> str group name
+        
+        # RETURN list of tuples ( str State, str County )
+        
+        return self.groups.get( name, [ ( name, None ) ] )
+        
+    def filter_criteria( self ):
+        """ Returns the criteria that a line must meet at least one of to be routed
+        to a group, e.g. to select the lines from a database. """
+        
+        # RETURN list of tuples ( str State, str County )
+        
+        # every line with a state has a group of its state
+        if self.split_by_state:
+            return [ ( None, None ) ]
+        
+        return self.index.filter_criteria( )
+        
 def main( ):
 
     print( 'PARSE THE COVID DATA FILES' )
+    
+    # Everything below can also be given on the command line (see 
+    # parse_arguments( ) or run with --help); without arguments, the values here
+    # are used.
+    args = parse_arguments( )
+    
+    # The stages are measured and, if asked, profiled (see instrumentation.py).
+    RECORDER.configure( args.metrics_log, args.profile, args.profile_mode,
+                        args.profile_dir, args.trace_memory )
+    
+    if args.clear_cache:
+    
+        count = Result_Cache( args.cache_dir ).clear( )
+        print( f'Deleted {count} tables from the result cache' )
+        
+        exit( )
+        
+    # Tables already made from the same criteria and source files are read back
+    # from the result cache (see result_cache.py) instead of being made again.
+    cache = Result_Cache( args.cache_dir, args.cache_size << 20, args.no_cache )
+    useCache = not args.no_columnar_cache
+    
+    # The datasets can be queried from the SQLite database of the update script
+    # instead (see sqlite_store.py); None reads the tables.
+    databasePath = args.database
+    
+    # A county without a line for a date is reported as zero cases and deaths, or
+    # with forwardFill as the cumulative counts of the date before.
+    forwardFill = args.forward_fill
+    
+    # The tables can be limited to a range of dates (None for the first or the last
+    # date), which are read from the date indexes of the tables (see date_index.py).
+    startDate = args.start_date
+    endDate = args.end_date
+    
+    # The NY Times text file can be read in parallel by a pool of processes, each
+    # reading a shard of the file; the tables are the same as with one.
+    workers = max( 1, args.workers )
+    
+    # The county and state tables can be brought up to date by adding only the new
+    # dates of the tables (see incremental_output.py), but not from the database.
+    incremental = args.incremental and not databasePath
+    
+    # For many reports at once, the criteria can be given as named groups instead,
+    # and/or split by state. Each source is then read only once, and the tables of
+    # each group are written to a directory of their own (see parse_batch( )).
+    # For example, { 'Upper Midwest' : [ ( 'Wisconsin', None ), ( 'Minnesota', None ) ] }
+    batchGroups = args.group or { }
+    splitByState = args.split_by_state
+    
+    if batchGroups or splitByState:
+    
+        parse_batch( batchGroups, splitByState, args.batch_output, args.metric,
+                        args.nyt, args.census, args.atlantic_us, args.atlantic_states,
+                        useCache, forwardFill, databasePath, startDate, endDate )
+        
+        if args.metrics_summary:
+            RECORDER.write_summary( args.metrics_summary )
+        
+        print( ); print( )
+        
+        exit( )
 
     # The counties to be sampled are specified as a list of ( State, County )
     # tuples. An entry of None for either means that no entries will be filtered.
@@ -18,113 +294,591 @@ def main( ):
     # For example, ( 'Wisconsin', None ) would return all counties in Wisconsin.
     # For another, ( None, Chippewa ) would return all Chippewa counties in every
     # state. 
-    countyCriteria = [ ( 'California', 'Los Angeles' ), ( 'Wisconsin', None ) ]
-
-    lines = parse_nyt_county_data_by_date( countyCriteria )
-    export_lines_to_file( lines, 'county_cases_and_deaths.txt' )
+    countyCriteria = args.county or [ ( 'California', 'Los Angeles' ), 
+                                        ( 'Wisconsin', None ) ]
     
-    lines = parse_census_county_data( countyCriteria )
-    export_lines_to_file( lines, 'county_cenus_population.txt' )
+    # The derived metrics to be reported, each written to its own table (see
+    # county_metrics.METRICS for the full list), e.g. [ 'new_cases', 
+    # 'new_cases_7day', 'doubling_time', 'cases_per_100k' ]. An empty list reports
+    # none.
+    metricsToReport = [ ]
     
+    if args.metric is not None:
+        metricsToReport = [ name for name in args.metric if name ]
+        
     # The states to be sampled are specified as a list of states. An entry of None
-    # means no entries will be filtered.
-    stateCriteria = [ state for ( state, county ) in countyCriteria ]
-    lines = parse_atlantic_states_data( stateCriteria )
-    export_lines_to_file( lines, 'state_cases_and_deaths.txt' )
+    # means no entries will be filtered. By default, they are the states of the
+    # county criteria (a criterion without a state adds none).
+    stateCriteria = args.state or [ state for ( state, county ) in countyCriteria 
+                                    if state ]
+    
+    os.makedirs( args.output_dir, exist_ok = True )
+    
+    # the NY Times matrices are made only if a table that needs them isn't cached
+    tables = [ ]    # list of the tuple returned by tabulate_nyt_county_data( )
+    
+    def county_table( ):
+        """ This subroutine makes the NY Times matrices once. """
+        
+        # RETURN tuple returned by tabulate_nyt_county_data( )
+        
+        if not tables:
+        
+            print( 'Parsing county data from the NY Times...', end = ' ' )
+            tables.append( tabulate_nyt_county_data( countyCriteria, args.nyt, useCache,
+                                                    forwardFill, databasePath, 
+                                                    startDate, endDate, workers ))
+            print( 'YES' )
+            
+        return tables[ 0 ]
+        
+    # likewise, the metrics are all computed at once if any isn't cached
+    metricsLines = { }  # dict { str metric name : list of str tab-delimited data }
+    
+    def metric_lines( name ):
+        """ This subroutine computes the metrics tables once. """
+        # ARGUMENT name -> str metric name
+        
+        # RETURN list of str tab-delimited data
+        
+        if not metricsLines:
+            metricsLines.update( parse_nyt_county_metrics( countyCriteria, 
+                                                    metricsToReport, args.nyt,
+                                                    args.census, useCache, 
+                                                    county_table( ), databasePath ))
+            
+        return metricsLines[ name ]
+        
+    fillOption = { 'forwardFill' : forwardFill, 'startDate' : startDate, 
+                    'endDate' : endDate }
+    dateOptions = { 'startDate' : startDate, 'endDate' : endDate }
+    
+    # the tables are made from the database instead of the files if it is given
+    def sources( *paths ):
+        """ This subroutine gives the files a table is made from. """
+        # ARGUMENT paths -> str paths of the tables
+        
+        # RETURN list of str paths
+        
+        return [ databasePath ] if databasePath else list( paths )
+    
+    # With incremental, the dates that are new since the county and state tables
+    # were written are added to them, unless they have to be made again (see 
+    # incremental_output.py); the tables are made in full the first time.
+    countyPath = f'{args.output_dir}/county_cases_and_deaths.txt'
+    statePath = f'{args.output_dir}/state_cases_and_deaths.txt'
+    
+    if not ( incremental and update_county_tables( countyCriteria, countyPath, args.nyt,
+                                                    useCache, forwardFill, startDate,
+                                                    endDate, workers )):
+    
+        ( lines, cached ) = cache.lines( tabulate_nyt_county_data, countyCriteria, 
+                                        sources( args.nyt ), 
+                                        lambda : format_county_tables( *county_table( )),
+                                        fillOption, ordered = False )
+        report_cached( cached, 'county data from the NY Times' )
+        export_lines_to_file( lines, countyPath )
+        
+        if incremental:
+            save_county_tables_state( countyCriteria, countyPath, lines, args.nyt,
+                                        forwardFill, startDate, endDate )
+    
+    for name in metricsToReport:
+    
+        ( lines, cached ) = cache.lines( format_county_metrics, countyCriteria, 
+                                        sources( args.nyt, args.census ),
+                                        lambda : metric_lines( name ),
+                                        dict( fillOption, metric = name ), 
+                                        ordered = False )
+        report_cached( cached, f'county metric {name}' )
+        export_lines_to_file( lines, f'{args.output_dir}/county_{name}.txt' )
+    
+    ( lines, cached ) = cache.lines( parse_census_county_data, countyCriteria,
+                                    sources( args.census ),
+                                    lambda : parse_census_county_data( countyCriteria,
+                                                                        args.census,
+                                                                        databasePath = 
+                                                                        databasePath ))
+    report_cached( cached, 'county data from the USA Census' )
+    export_lines_to_file( lines, f'{args.output_dir}/county_cenus_population.txt' )
+    
+    # The county data can also be joined with the populations and the mask-use
+    # estimates into one table with a line per county and date.
+    if args.enriched:
+    
+        ( lines, cached ) = cache.lines( parse_enriched_county_data, countyCriteria,
+                                        sources( args.nyt, args.census, args.mask_use ),
+                                        lambda : parse_enriched_county_data( 
+                                                countyCriteria, args.nyt, args.census, 
+                                                args.mask_use, useCache, databasePath, 
+                                                startDate, endDate ), 
+                                        dateOptions, ordered = False )
+        report_cached( cached, 'county data joined with populations and mask use' )
+        export_lines_to_file( lines, f'{args.output_dir}/county_enriched.txt' )
+    
+    if incremental:
+    
+        # the full table is made without the result cache, to learn its columns
+        if not update_state_table( stateCriteria, statePath, args.atlantic_us,
+                                    args.atlantic_states, startDate, endDate ):
+            write_state_table( stateCriteria, statePath, args.atlantic_us, 
+                                args.atlantic_states, startDate, endDate )
+                                
+    else:
+    
+        ( lines, cached ) = cache.lines( parse_atlantic_states_data, stateCriteria,
+                                        sources( args.atlantic_us, args.atlantic_states ),
+                                        lambda : parse_atlantic_states_data( 
+                                                    stateCriteria, args.atlantic_us,
+                                                    args.atlantic_states, databasePath, 
+                                                    startDate, endDate ),
+                                        dateOptions )
+        report_cached( cached, 'USA and states data from The Atlantic' )
+        export_lines_to_file( lines, statePath )
+    
+    # The NY Times counties can also be reported rolled up by state, division,
+    # region or for the USA, from the rollup cube of the update script.
+    for level in args.rollup or [ ]:
+    
+        ( lines, cached ) = cache.lines( parse_rollup_data, [ level ],
+                                        [ args.nyt, args.census ],
+                                        lambda : parse_rollup_data( level, args.nyt, 
+                                                                    args.census,
+                                                                    startDate, endDate ),
+                                        dateOptions )
+        report_cached( cached, f'NY Times data rolled up by {level}' )
+        export_lines_to_file( lines, f'{args.output_dir}/rollup_{level}.txt' )
+    
+    if args.metrics_summary:
+        RECORDER.write_summary( args.metrics_summary )
     
     print( ); print( )
     
     exit( )
     
+def parse_arguments( argv = None ):
+    """ This function reads the command line of the script. """
+    # ARGUMENT argv -> list of str arguments; DEFAULT sys.argv[ 1 : ]
+    
+    # RETURN argparse.Namespace of the options
+    
+    parser = argparse.ArgumentParser( description = 'Parse the COVID data files down '
+                                        'to tables of the selected counties and states.' )
+    
+    parser.add_argument( '--county', action = 'append', type = parse_criterion,
+                        metavar = 'STATE:COUNTY', help = 'a county criterion; a blank '
+                        'STATE or COUNTY matches all (e.g. Wisconsin: or :Adams); '
+                        'repeat for more' )
+    parser.add_argument( '--state', action = 'append', metavar = 'STATE', 
+                        help = 'a state for the The Atlantic table; DEFAULT the states '
+                        'of the county criteria' )
+    parser.add_argument( '--metric', action = 'append', metavar = 'NAME',
+                        choices = list( METRICS ) + [ '' ], help = 'a metric to report; '
+                        'repeat for more; DEFAULT none' )
+    parser.add_argument( '--forward-fill', action = 'store_true', help = 'carry '
+                        'cumulative counts forward over missing dates instead of zero' )
+    parser.add_argument( '--enriched', action = 'store_true', help = 'also write '
+                        'county_enriched.txt, the county data joined with the '
+                        'populations and the mask-use estimates' )
+    parser.add_argument( '--rollup', action = 'append', choices = ROLLUP_LEVELS, 
+                        metavar = 'LEVEL', help = 'also write rollup_LEVEL.txt, the '
+                        'NY Times data of every county, state, division, region or '
+                        'the usa by date; repeat for more' )
+    parser.add_argument( '--start-date', type = parse_date, metavar = 'YYYY-MM-DD',
+                        help = 'first date of the tables; DEFAULT the first date' )
+    parser.add_argument( '--end-date', type = parse_date, metavar = 'YYYY-MM-DD',
+                        help = 'last date of the tables; DEFAULT the last date' )
+    
+    parser.add_argument( '--group', action = 'append', type = parse_group,
+                        metavar = 'NAME=STATE:COUNTY', help = 'a county criterion of a '
+                        'named group for batch mode; repeat the NAME for more' )
+    parser.add_argument( '--split-by-state', action = 'store_true', 
+                        help = 'batch mode with a group for each state' )
+    parser.add_argument( '--batch-output', default = 'batch_output', metavar = 'DIR',
+                        help = 'directory of the group directories; DEFAULT %(default)s' )
+    
+    parser.add_argument( '--nyt', default = 'covid_data/nyt_us_counties.txt',
+                        metavar = 'PATH', help = 'NY Times counties data' )
+    parser.add_argument( '--census', default = 'covid_data/usc_counties_2019.txt',
+                        metavar = 'PATH', help = 'US Census counties data' )
+    parser.add_argument( '--mask-use', default = 'covid_data/nyt_mask_use.txt',
+                        metavar = 'PATH', help = 'NY Times mask-use data' )
+    parser.add_argument( '--atlantic-us', default = 'covid_data/atl_historic_us.txt',
+                        metavar = 'PATH', help = 'The Atlantic USA data' )
+    parser.add_argument( '--atlantic-states', 
+                        default = 'covid_data/atl_historic_states.txt',
+                        metavar = 'PATH', help = 'The Atlantic states data' )
+    parser.add_argument( '--database', metavar = 'PATH', help = 'query the datasets '
+                        'from this SQLite database of the update script (e.g. '
+                        'covid_data/covid.sqlite) instead of the tables' )
+    parser.add_argument( '--output-dir', default = '.', metavar = 'DIR',
+                        help = 'directory of the tables; DEFAULT the current directory' )
+    
+    parser.add_argument( '--no-cache', action = 'store_true', 
+                        help = 'make every table without the result cache' )
+    parser.add_argument( '--clear-cache', action = 'store_true',
+                        help = 'empty the result cache and exit' )
+    parser.add_argument( '--cache-dir', default = 'covid_data/result_cache', 
+                        metavar = 'DIR', help = 'directory of the result cache; '
+                        'DEFAULT %(default)s' )
+    parser.add_argument( '--cache-size', default = DEFAULT_MAX_BYTES >> 20, type = int,
+                        metavar = 'MB', help = 'size limit of the result cache; '
+                        'DEFAULT %(default)s' )
+    parser.add_argument( '--no-columnar-cache', action = 'store_true',
+                        help = 'read the NY Times text file even if its columnar '
+                        'cache is current' )
+    parser.add_argument( '--incremental', action = 'store_true', help = 'add only the '
+                        'new dates to the county and state tables written before, '
+                        'unless older dates were revised or the columns changed '
+                        '(not with --database)' )
+    parser.add_argument( '--workers', default = 1, type = int, metavar = 'N',
+                        help = 'processes reading shards of the NY Times text file in '
+                        'parallel; DEFAULT %(default)s' )
+    
+    parser.add_argument( '--metrics-log', metavar = 'PATH', help = 'append the '
+                        'measurements of each stage to this JSON-lines file' )
+    parser.add_argument( '--metrics-summary', metavar = 'PATH', help = 'write the '
+                        'measurements of all of the stages to this JSON file' )
+    parser.add_argument( '--profile', action = 'append', metavar = 'STAGE',
+                        help = 'profile a stage (read_filter, pivot, format, metrics, '
+                        'join, rollup or export, or all); repeat for more' )
+    parser.add_argument( '--profile-mode', default = 'cprofile', choices = PROFILE_MODES,
+                        help = 'profiler of the stages; DEFAULT %(default)s' )
+    parser.add_argument( '--profile-dir', default = 'profiles', metavar = 'DIR',
+                        help = 'directory of the profile dumps; DEFAULT %(default)s' )
+    parser.add_argument( '--trace-memory', action = 'store_true', help = 'measure the '
+                        'peak allocations of each stage with tracemalloc (slower)' )
+    
+    args = parser.parse_args( argv )
+    
+    # the criteria of each group are gathered under its name
+    if args.group:
+    
+        groups = { }    # dict { str group name : list of tuples ( str State, str County ) }
+        
+        for ( name, criterion ) in args.group:
+            groups.setdefault( name, [ ] ).append( criterion )
+            
+        args.group = groups
+        
+    return args
+    
+def parse_criterion( text ):
+    """ This function reads a ( State, County ) criterion from the command line. """
+    # ARGUMENT text -> str STATE:COUNTY, STATE: or :COUNTY (or just STATE)
+    
+    # RETURN tuple ( str State, str County ); a blank part is None
+    
+    ( state, sep, county ) = text.partition( ':' )
+    
+    return ( state or None, county or None )
+    
+def parse_group( text ):
+    """ This function reads a criterion of a named group from the command line. """
+    # ARGUMENT text -> str NAME=STATE:COUNTY
+    
+    # RETURN tuple ( str group name, tuple ( str State, str County ))
+    
+    ( name, sep, criterion ) = text.partition( '=' )
+    
+    if not ( name and sep ):
+        raise argparse.ArgumentTypeError( f'expected NAME=STATE:COUNTY, not {text!r}' )
+        
+    return ( name, parse_criterion( criterion ))
+    
+def parse_date( text ):
+    """ This function reads a date from the command line. """
+    # ARGUMENT text -> str YYYY-MM-DD
+    
+    # RETURN str date as YYYY-MM-DD
+    
+    try:
+        return datetime.date.fromisoformat( text ).isoformat( )
+    except ValueError:
+        raise argparse.ArgumentTypeError( f'expected YYYY-MM-DD, not {text!r}' )
+    
+def report_cached( cached, what ):
+    """ This function reports a table that was read from the result cache. """
+    # ARGUMENT cached -> bool whether the table came from the cache
+    # ARGUMENT what -> str description of the table
+    
+    # RETURN nothing
+    
+    if cached:
+        print( f'Reading {what} from the result cache... YES' )
+        
+    return
+    
+def parse_batch( criteriaGroups, splitByState = False, outputPath = 'batch_output',
+                    metrics = None, nytPath = 'covid_data/nyt_us_counties.txt',
+                    censusPath = 'covid_data/usc_counties_2019.txt',
+                    usPath = 'covid_data/atl_historic_us.txt', 
+                    statesPath = 'covid_data/atl_historic_states.txt', useCache = True,
+                    forwardFill = False, databasePath = None, startDate = None, 
+                    endDate = None ):
+    """ This function makes the county, census and state tables for many groups of 
+    criteria at once. Each source is read only once, and every line is routed to
+    all of the groups it meets. The tables of a group are written to a directory of
+    its own named after the group. """
+    # ARGUMENT criteriaGroups -> dict { str group name : list of tuples ( str State,
+    #   str County ) }
+    # ARGUMENT splitByState -> bool also make a group for each state; DEFAULT
+    # ARGUMENT outputPath -> str path of the directory for the group directories;
+    #   DEFAULT
+    # ARGUMENT metrics -> list of str metric names to write as well; DEFAULT none
+    # ARGUMENT nytPath -> str path of NY Times counties data
+    # ARGUMENT censusPath -> str path of US Census counties data
+    # ARGUMENT usPath -> str path to The Atlantic USA data
+    # ARGUMENT statesPath -> str path to The Atlantic states data
+    # ARGUMENT useCache -> bool read the columnar cache if it is current; DEFAULT
+    # ARGUMENT forwardFill -> bool carry cumulative counts forward over missing 
+    #   dates instead of zero; DEFAULT
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the files; DEFAULT none
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # RETURN list of str group names written
+    
+    countyRouter = Criteria_Groups( criteriaGroups, splitByState )
+    
+    # the states criteria of a group are the states of its county criteria (a 
+    # criterion without a state adds none)
+    stateRouter = Criteria_Groups( { name : [ ( state, None ) 
+                                            for ( state, county ) in groupCriteria 
+                                            if state ]
+                                    for name, groupCriteria in criteriaGroups.items( ) },
+                                    splitByState )
+    
+    print( 'Parsing county data from the NY Times for the batch...', end = ' ' )
+    
+    countyTables = { }  # dict { str group name : County_Table( ) object }
+    
+    with stage( 'read_filter', dataset = 'nyt_us_counties', path = nytPath ) as s:
+    
+        for ( routes, date, county, cases, deaths ) in iterate_nyt_county_records( 
+                                        countyRouter, nytPath, useCache, databasePath,
+                                        startDate, endDate ):
+                                                    
+            s.rows_out += 1
+            
+            for ( name, matches ) in routes:
+            
+                if name not in countyTables:
+                    countyTables[ name ] = County_Table( )
+                    
+                countyTables[ name ].add( date, county, cases, deaths )
+            
+    print( 'YES' )
+    print( 'Parsing county data from the USA Census for the batch...', end = ' ' )
+    
+    # dict { str group name : list of lists of str tab-delimited data by criterion }
+    censusLines = { }
+    
+    with stage( 'read_filter', dataset = 'usc_counties_2019', path = censusPath ) as s:
+    
+        for ( routes, state, county, population ) in iterate_census_county_records( 
+                                                countyRouter, censusPath, databasePath ):
+                                                            
+            s.rows_out += 1
+            
+            for ( name, matches ) in routes:
+            
+                if name not in censusLines:
+                    censusLines[ name ] = [ [ ] for c in countyRouter.criteria( name ) ]
+                    
+                for i in matches:
+                    censusLines[ name ][ i ].append( '\t'.join( [ state, county, 
+                                                                population ] ))
+    
+    print( 'YES' )
+    print( 'Parse USA and states data from The Atlantic for the batch...', end = ' ' )
+            
+    usDct = read_atlantic_us_data( usPath, databasePath, startDate, endDate )
+    stateTables = { }   # dict { str group name : State_Table( ) object }
+    
+    with stage( 'read_filter', dataset = 'atl_historic_states', path = statesPath ) as s:
+    
+        for ( routes, date, state, fieldsDct ) in iterate_atlantic_state_records( 
+                                                stateRouter, statesPath, databasePath,
+                                                startDate, endDate ):
+                                                            
+            s.rows_out += 1
+            
+            for ( name, matches ) in routes:
+            
+                if name not in stateTables:
+                    stateTables[ name ] = State_Table( )
+                    
+                stateTables[ name ].add( date, state, fieldsDct )
+            
+    print( 'YES' )
+    
+    # the named groups in order, then the states
+    names = list( criteriaGroups )
+    names += sorted( ( set( countyTables ) | set( censusLines ) | set( stateTables )) 
+                        - set( names ))
+    
+    print( f'Writing the tables of {len( names )} groups...', end = ' ' )
+    
+    for name in names:
+    
+        directory = f'{outputPath}/{name.replace( os.sep, "_" )}'
+        os.makedirs( directory, exist_ok = True )
+        
+        table = countyTables.get( name, County_Table( )).matrices( forwardFill )
+        export_lines_to_file( format_county_tables( *table ), 
+                                f'{directory}/county_cases_and_deaths.txt' )
+        
+        lines = [ 'state\tcounty\tpopulation' ]
+        for criterionLines in censusLines.get( name, [ ] ):
+            lines.extend( criterionLines )
+            
+        export_lines_to_file( lines, f'{directory}/county_cenus_population.txt' )
+        
+        statesCriteria = [ state for ( state, county ) in countyRouter.criteria( name )
+                            if state ]
+        export_lines_to_file( format_state_table( statesCriteria, usDct, 
+                                            stateTables.get( name, State_Table( ))),
+                                f'{directory}/state_cases_and_deaths.txt' )
+                                
+        if metrics:
+            metricsLines = format_county_metrics( table, 
+                                    get_census_populations( table[ 1 ], censusPath ), 
+                                    metrics )
+            
+            for metric, lines in metricsLines.items( ):
+                export_lines_to_file( lines, f'{directory}/county_{metric}.txt' )
+                
+    print( 'YES' )
+    
+    return names
+    
 def parse_atlantic_states_data( statesCriteria, 
                                 usPath = 'covid_data/atl_historic_us.txt', 
-                                statesPath = 'covid_data/atl_historic_states.txt' ):
+                                statesPath = 'covid_data/atl_historic_states.txt',
+                                databasePath = None, startDate = None, endDate = None ):
     """ This function reduces the full The Atlantic states and USA datasets down to a
-    table of results by date. """
+    table of results by date. A range of dates is read from the date indexes of the
+    files (see date_index.py), so only its lines are read. """
     # ARGUMENT statesCriteria -> list of str states to limit dataset
     # ARGUMENT usPath -> str path to The Atlantic USA data
     # ARGUMENT statesPath -> str path to The Atlantic states data
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the files; DEFAULT none
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
     
     # RETURN                            
     output = [ ]    # list of str tab-delimited data
     
     print( 'Parse USA and states data from The Atlantic...', end = ' ' )
     
-    # get us data
-    usData = import_data_file( usPath )
+    ( usDct, table ) = read_atlantic_states_data( statesCriteria, usPath, statesPath,
+                                                    databasePath, startDate, endDate )
+    output = format_state_table( statesCriteria, usDct, table )
+        
+    print( 'YES' )
     
-    # {'date': 0, 'states': 1, 'positive': 2, 'negative': 3, 'pending': 4,
-    # 'hospitalizedCurrently': 5, 'hospitalizedCumulative': 6, 'inIcuCurrently': 7, 
-    # 'inIcuCumulative': 8, 'onVentilatorCurrently': 9, 'onVentilatorCumulative': 10, 
-    # 'recovered': 11, 'dateChecked': 12, 'death': 13, 'hospitalized': 14, 
-    # 'lastModified': 15, 'total': 16, 'totalTestResults': 17, 'posNeg': 18, 
-    # 'deathIncrease': 19, 'hospitalizedIncrease': 20, 'negativeIncrease': 21, 
-    # 'positiveIncrease': 22, 'totalTestResultsIncrease': 23, 'hash': 24}
+    return output
+    
+def read_atlantic_states_data( statesCriteria, 
+                                usPath = 'covid_data/atl_historic_us.txt', 
+                                statesPath = 'covid_data/atl_historic_states.txt',
+                                databasePath = None, startDate = None, endDate = None ):
+    """ This function reads the The Atlantic USA dataset and the lines of the states
+    dataset that meet the criteria. """
+    # ARGUMENT statesCriteria -> list of str states to limit dataset
+    # ARGUMENT usPath -> str path to The Atlantic USA data
+    # ARGUMENT statesPath -> str path to The Atlantic states data
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the files; DEFAULT none
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
     
-    # get states data
-    stateData = import_data_file( statesPath )
+    # RETURN tuple ( dict returned by read_atlantic_us_data( ), State_Table( ) object )
     
-    # {'date': 0, 'state': 1, 'positive': 2, 'negative': 3, 'pending': 4, 
-    # 'hospitalizedCurrently': 5, 'hospitalizedCumulative': 6, 'inIcuCurrently': 7, 
-    # 'inIcuCumulative': 8, 'onVentilatorCurrently': 9, 'onVentilatorCumulative': 10, 
-    # 'recovered': 11, 'dataQualityGrade': 12, 'lastUpdateEt': 13, 'dateModified': 14, 
-    # 'checkTimeEt': 15, 'death': 16, 'hospitalized': 17, 'dateChecked': 18, 
-    # 'totalTestsViral': 19, 'positiveTestsViral': 20, 'negativeTestsViral': 21, 
-    # 'positiveCasesViral': 22, 'deathConfirmed': 23, 'deathProbable': 24, 'fips': 25, 
-    # 'positiveIncrease': 26, 'negativeIncrease': 27, 'total': 28, 
-    # 'totalTestResults': 29, 'totalTestResultsIncrease': 30, 'posNeg': 31, 
-    # 'deathIncrease': 32, 'hospitalizedIncrease': 33, 'hash': 34, 'commercialScore': 35, 
-    # 'negativeRegularScore': 36, 'negativeScore': 37, 'positiveScore': 38, 'score': 39, 
-    # 'grade': 40}
+    usDct = read_atlantic_us_data( usPath, databasePath, startDate, endDate )
+    
+    # compile the states criteria for single-pass matching
+    index = Criteria_Index( [ ( state, None ) for state in statesCriteria ] )
+    table = State_Table( )
     
-    # reformat dates is US data
-    for d in usData[ 1 : ]:
+    # keep only the lines that meet a state criterion
+    with stage( 'read_filter', dataset = 'atl_historic_states', path = statesPath ) as s:
     
-        # add hypthens to date
-        date = d[ 0 ]
-        reformattedDate = f'{date[ : 4 ]}-{date[ 4 : 6 ]}-{date[ 6 : ]}'
-        d[ 0 ] = reformattedDate
+        for ( matches, date, state, fieldsDct ) in iterate_atlantic_state_records( 
+                                    index, statesPath, databasePath, startDate, endDate ):
+            table.add( date, state, fieldsDct )
+            
+        s.rows_out = len( table.states_dct )
         
-    # reformat dates and states in states data
-    for d in stateData:
+    return ( usDct, table )
+    
+class State_Table( ):
+    """ This object collects the The Atlantic state lines that meet one set of 
+    criteria. """
+    
+    def __init__( self ):
+        """ Initializes the object. """
         
-        # add hypthens to date
-        date = d[ 0 ]
-        reformattedDate = f'{date[ : 4 ]}-{date[ 4 : 6 ]}-{date[ 6 : ]}'
-        d[ 0 ] = reformattedDate
+        self.dates = set( )     # set of str dates in the limited states data
+        self.states = set( )    # set of str states in the limited states data
         
-        # get state from abbreviatin
-        d[ 1 ] = state_from_postal_code( d[ 1 ] )
+        # states dict { tuple ( str date, str state ) :
+        #               dict { str field names : str counts }}
+        self.states_dct = { }
+        
+        return
+        
+    def add( self, date, state, fieldsDct ):
+        """ Adds the fields of a state on a date. """
+        
+        self.dates.add( date )
+        self.states.add( state )
+        self.states_dct[ ( date, state ) ] = fieldsDct
+        
+        return
     
-    # reduce dataset by criteria
-    limitedData = [ ]   # list of lines of data based on state criteria
+def format_state_table( statesCriteria, usDct, table, states = None ):
+    """ This function formats the USA data and the collected states data as a table 
+    of results by date. """
+    # ARGUMENT statesCriteria -> list of str states used as column headers
+    # ARGUMENT usDct -> dict { str date : dict { str field names : str counts }}
+    # ARGUMENT table -> State_Table( ) object
+    # ARGUMENT states -> list of str states of the columns; DEFAULT the sorted states
+    #   of the table
+    
+    # RETURN                            
+    output = [ ]    # list of str tab-delimited data
     
-    # evaluate each state criterion
-    for state in statesCriteria:
+    with stage( 'pivot', dataset = 'atl_historic_states' ) as s:
     
-        # get the subset of data lines for a specific criterion in each dataset
-        subset = [ line for line in stateData if not state or line[ 1 ] == state ]
-        limitedData.extend( subset )
+        s.rows_in = len( table.states_dct ) + len( usDct )
+        output = tabulate_state_table( statesCriteria, usDct, table, states )
+        s.rows_out = len( output )
         
+    return output
+    
+def tabulate_state_table( statesCriteria, usDct, table, states = None ):
+    """ This function lays out the USA data and the collected states data by 
+    date. """
+    # ARGUMENT statesCriteria -> list of str states used as column headers
+    # ARGUMENT usDct -> dict { str date : dict { str field names : str counts }}
+    # ARGUMENT table -> State_Table( ) object
+    # ARGUMENT states -> list of str states of the columns; DEFAULT the sorted states
+    #   of the table
+    
+    # RETURN                            
+    output = [ ]    # list of str tab-delimited data
+    
     # get lists of dates and states
-    dates = sorted( list( { fields[ 0 ] for fields in limitedData + usData[ 1 : ] }))
-    states = sorted( list( { fields[ 1 ] for fields in limitedData }))
-    
-    # make states dict { tuple ( str date, str state ) :
-    #                   dict { str field names : str counts }}
-    statesDct = { ( fields[ 0 ], fields [ 1 ] ) :
-                    { 'positives' : fields[ 2 ], 'hospitalized' : fields[ 6 ],
-                    'icu' : fields[ 8 ], 'ventilator' : fields[ 10 ],
-                    'deaths' : fields[ 16 ] } for fields in limitedData }
-                    
-    # make US dict { str date : dict { str field names : str counts }}
-    usDct = { fields[ 0 ] :
-                    { 'positives' : fields[ 2 ], 'hospitalized' : fields[ 6 ],
-                    'icu' : fields[ 8 ], 'ventilator' : fields[ 10 ],
-                    'deaths' : fields[ 13 ] } for fields in usData }
+    dates = sorted( table.dates | set( usDct ))
+    states = sorted( table.states ) if states is None else states
+    statesDct = table.states_dct
     
     # list of fields to report
-    fields = [ 'positives', 'hospitalized', 'icu', 'ventilator', 'deaths' ]
+    fields = STATE_FIELDS
     
     # format output header lines
     headerLine1 = [ '' ]
@@ -167,107 +921,818 @@ def parse_atlantic_states_data( statesCriteria,
         # add the line of data to the output    
         output.append( '\t'.join( outputLine ))
         
-    print( 'YES' )
-    
     return output
     
-def parse_census_county_data( countyCriteria, path = 'covid_data/usc_counties_2019.txt' ):
-    """ This function reduces the full US Census counties dataset down to a table of
-    the population of specified counties. """
-    # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
-    # ARGUMENT path -> str path of US Census counties data
-
-    # RETURN
-    output = [ 'state\tcounty\tpopulation' ] # list of str tab-delimited data
+def read_atlantic_us_data( path = 'covid_data/atl_historic_us.txt', databasePath = None,
+                            startDate = None, endDate = None ):
+    """ This function reads the The Atlantic USA dataset into the fields reported 
+    for each date. """
+    # ARGUMENT path -> str path to The Atlantic USA data
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the file; DEFAULT none
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
     
-    print( 'Parsing county data from the USA Census...', end = ' ' )
+    # RETURN
+    usDct = { } # dict { str date : dict { str field names : str counts }}
     
-    # import the complete dataset from the file
-    data = import_data_file( path )
+    # {'date': 0, 'states': 1, 'positive': 2, 'negative': 3, 'pending': 4,
+    # 'hospitalizedCurrently': 5, 'hospitalizedCumulative': 6, 'inIcuCurrently': 7, 
+    # 'inIcuCumulative': 8, 'onVentilatorCurrently': 9, 'onVentilatorCumulative': 10, 
+    # 'recovered': 11, 'dateChecked': 12, 'death': 13, 'hospitalized': 14, 
+    # 'lastModified': 15, 'total': 16, 'totalTestResults': 17, 'posNeg': 18, 
+    # 'deathIncrease': 19, 'hospitalizedIncrease': 20, 'negativeIncrease': 21, 
+    # 'positiveIncrease': 22, 'totalTestResultsIncrease': 23, 'hash': 24}
     
-    # field indices of the US Census county data
-    # {'SUMLEV': 0, 'REGION': 1, 'DIVISION': 2, 'STATE': 3, 'COUNTY': 4, 'STNAME': 5,
-    #   'CTYNAME': 6, 'CENSUS2010POP': 7, 'ESTIMATESBASE2010': 8, 'POPESTIMATE2010': 9,
-    #   'POPESTIMATE2011': 10, 'POPESTIMATE2012': 11, 'POPESTIMATE2013': 12,
-    #   'POPESTIMATE2014': 13, 'POPESTIMATE2015': 14, 'POPESTIMATE2016': 15,
-    #   'POPESTIMATE2017': 16, 'POPESTIMATE2018': 17, 'POPESTIMATE2019': 18, ...
+    if databasePath:
     
-    # reduce dataset by criteria
-    limitedData = [ ]   # list of lines of data based on county criteria
+        with stage( 'read_filter', dataset = 'atl_historic_us', path = databasePath ) as s:
+            with contextlib.closing( connect_database( databasePath )) as connection:
+            
+                for ( date, *counts ) in query_atlantic_us( connection, startDate, 
+                                                            endDate ):
+                    usDct[ date ] = dict( zip( STATE_FIELDS, map( format_field, counts )))
+                    
+            s.rows_in = s.rows_out = len( usDct )
+            
+        return usDct
     
-    # evaluate each ( state, county) criterion
-    for ( state, county ) in countyCriteria:
+    with stage( 'read_filter', dataset = 'atl_historic_us', path = path ) as s:
     
-        # get the subset of data lines for a specific criterion
-        subset = [ line for line in data
-                    if ( not state or line[ 5 ] == state )
-                    and ( not county or line[ 6 ].replace( ' County', '' ) == county ) ]
+        # stream the US data, skipping the header line
+        usData = iterate_data_file( path, startDate, endDate )
+        next( usData, None )
         
-        # add the subet to the set of limited data
-        limitedData.extend( subset )
+        for fields in usData:
+        
+            # add hypthens to date
+            date = reformat_atlantic_date( fields[ 0 ] )
+            
+            usDct[ date ] = { 'positives' : fields[ 2 ], 'hospitalized' : fields[ 6 ],
+                                'icu' : fields[ 8 ], 'ventilator' : fields[ 10 ],
+                                'deaths' : fields[ 13 ] }
+                                
+        s.rows_out = len( usDct )
+                            
+    return usDct
     
-    # go thru each line of the limited dataset    
-    for line in limitedData:
+def iterate_atlantic_state_records( index, path = 'covid_data/atl_historic_states.txt',
+                                    databasePath = None, startDate = None, 
+                                    endDate = None ):
+    """ This generator yields the lines of the The Atlantic states dataset whose 
+    state meets the criteria of a Criteria_Index( ). """
+    # ARGUMENT index -> Criteria_Index( ) object of ( State, None ) criteria
+    # ARGUMENT path -> str path to The Atlantic states data
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the file; DEFAULT none
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
     
-        # parse specific fields
-        state = line[ 5 ]
-        county = line[ 6 ].replace( ' County', '' )
-        population = line[ 18 ]
+    # YIELD tuple ( tuple of int criterion indices, str date, str State,
+    #   dict { str field names : str counts } )
+    
+    # {'date': 0, 'state': 1, 'positive': 2, 'negative': 3, 'pending': 4, 
+    # 'hospitalizedCurrently': 5, 'hospitalizedCumulative': 6, 'inIcuCurrently': 7, 
+    # 'inIcuCumulative': 8, 'onVentilatorCurrently': 9, 'onVentilatorCumulative': 10, 
+    # 'recovered': 11, 'dataQualityGrade': 12, 'lastUpdateEt': 13, 'dateModified': 14, 
+    # 'checkTimeEt': 15, 'death': 16, 'hospitalized': 17, 'dateChecked': 18, 
+    # 'totalTestsViral': 19, 'positiveTestsViral': 20, 'negativeTestsViral': 21, 
+    # 'positiveCasesViral': 22, 'deathConfirmed': 23, 'deathProbable': 24, 'fips': 25, 
+    # 'positiveIncrease': 26, 'negativeIncrease': 27, 'total': 28, 
+    # 'totalTestResults': 29, 'totalTestResultsIncrease': 30, 'posNeg': 31, 
+    # 'deathIncrease': 32, 'hospitalizedIncrease': 33, 'hash': 34, 'commercialScore': 35, 
+    # 'negativeRegularScore': 36, 'negativeScore': 37, 'positiveScore': 38, 'score': 39, 
+    # 'grade': 40}
+    
+    if databasePath:
+        yield from query_atlantic_state_records( index, databasePath, startDate, 
+                                                    endDate )
+        
+        return
+    
+    # stream the states data, skipping the header line
+    stateData = iterate_data_file( path, startDate, endDate )
+    next( stateData, None )
+    
+    for fields in stateData:
+    
+        # get state from abbreviatin
+        state = state_from_postal_code( fields[ 1 ] )
+        matches = index.match( state )
+        
+        if matches:
+        
+            # add hypthens to date
+            yield ( matches, reformat_atlantic_date( fields[ 0 ] ), state,
+                    { 'positives' : fields[ 2 ], 'hospitalized' : fields[ 6 ], 
+                    'icu' : fields[ 8 ], 'ventilator' : fields[ 10 ], 
+                    'deaths' : fields[ 16 ] } )
+                    
+    return
+    
+def query_atlantic_state_records( index, databasePath, startDate = None, endDate = None ):
+    """ This generator yields the lines of the The Atlantic states table of the 
+    database whose state meets the criteria of a Criteria_Index( ). The states are
+    stored by postal code, so only the codes of the states that meet the criteria
+    are looked up. """
+    # ARGUMENT index -> Criteria_Index( ) object of ( State, None ) criteria
+    # ARGUMENT databasePath -> str path of the SQLite database
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # YIELD tuple as iterate_atlantic_state_records( )
+    
+    with contextlib.closing( connect_database( databasePath )) as connection:
+    
+        codes = [ code for code in atlantic_postal_codes( connection ) 
+                    if index.match( state_from_postal_code( code )) ]
+        lines = 0   # int lines read, counted for the stage that reads them
         
-        # append fields to the output file
-        output.append( '\t'.join( [ state, county, population ] ))
+        for lines, ( date, code, *counts ) in enumerate( 
+                    query_atlantic_states( connection, codes, startDate, endDate ), 1 ):
+        
+            state = state_from_postal_code( code )
+            
+            yield ( index.match( state ), date, state,
+                    dict( zip( STATE_FIELDS, map( format_field, counts ))))
+                    
+    current_stage( ).count( rows_in = lines )
+                    
+    return
+    
+def parse_census_county_data( countyCriteria, path = 'covid_data/usc_counties_2019.txt',
+                                unique = False, databasePath = None ):
+    """ This function reduces the full US Census counties dataset down to a table of
+    the population of specified counties. The counties are listed by criterion, so
+    a county that meets more than one criterion is listed more than once unless 
+    unique is set. """
+    # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
+    # ARGUMENT path -> str path of US Census counties data
+    # ARGUMENT unique -> bool list each county only once, under its first criterion;
+    #   DEFAULT
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the file; DEFAULT none
+
+    # RETURN
+    output = [ ]    # list of str tab-delimited data
+    
+    print( 'Parsing county data from the USA Census...', end = ' ' )
+    
+    # compile the criteria for single-pass matching
+    index = Criteria_Index( countyCriteria )
+    
+    with stage( 'read_filter', dataset = 'usc_counties_2019', path = path ) as s:
+    
+        output = format_census_table( countyCriteria, iterate_census_county_records( 
+                                            index, path, databasePath ), unique )
+        s.rows_out = len( output ) - 1
         
     print( 'YES' )
         
     return output
     
-def parse_nyt_county_data_by_date( countyCriteria, path = 'covid_data/nyt_us_counties.txt' ):
+def format_census_table( countyCriteria, records, unique = False ):
+    """ This function formats the US Census lines that meet the criteria as a table
+    of populations listed by criterion. """
+    # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
+    # ARGUMENT records -> iterable of tuples yielded by iterate_census_county_records( )
+    #   for the same criteria
+    # ARGUMENT unique -> bool list each county only once, under its first criterion;
+    #   DEFAULT
+    
+    # RETURN
+    output = [ 'state\tcounty\tpopulation' ] # list of str tab-delimited data
+    
+    # the output lines are grouped by criterion in the order the criteria are
+    # given, so each criterion collects its own output lines
+    # list of lists of str tab-delimited data
+    criteriaLines = [ [ ] for criterion in countyCriteria ]
+    
+    for ( matches, state, county, population ) in records:
+    
+        if unique:
+            matches = matches[ : 1 ]
+        
+        for i in matches:
+            criteriaLines[ i ].append( '\t'.join( [ state, county, population ] ))
+    
+    # append the lines to the output in the order of the criteria
+    for lines in criteriaLines:
+        output.extend( lines )
+        
+    return output
+    
+def get_census_populations( counties, path = 'covid_data/usc_counties_2019.txt' ):
+    """ This function gets the population of each county from the US Census, joined
+    on the FIPS code of the county (see geography.py). """
+    # ARGUMENT counties -> list of tuples ( str State, str County, int FIPS or None ) 
+    #   as in the NY Times data
+    # ARGUMENT path -> str path of US Census counties data
+    
+    # RETURN
+    populations = { }   # dict { tuple county as given : int population }
+    
+    with stage( 'read_filter', dataset = 'usc_counties_2019', path = path ) as s:
+    
+        populations = load_geography( path ).county_populations( counties )
+        s.count( rows_in = len( counties ), rows_out = len( populations ))
+        
+    return populations
+    
+def iterate_census_county_records( index, path = 'covid_data/usc_counties_2019.txt',
+                                    databasePath = None ):
+    """ This generator yields the lines of the US Census counties dataset that meet
+    the criteria of a Criteria_Index( ). """
+    # ARGUMENT index -> Criteria_Index( ) object
+    # ARGUMENT path -> str path of US Census counties data
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the file; DEFAULT none
+    
+    # YIELD tuple ( tuple of int criterion indices, str State, str County, 
+    #   str population )
+    
+    # field indices of the US Census county data
+    # {'SUMLEV': 0, 'REGION': 1, 'DIVISION': 2, 'STATE': 3, 'COUNTY': 4, 'STNAME': 5,
+    #   'CTYNAME': 6, 'CENSUS2010POP': 7, 'ESTIMATESBASE2010': 8, 'POPESTIMATE2010': 9,
+    #   'POPESTIMATE2011': 10, 'POPESTIMATE2012': 11, 'POPESTIMATE2013': 12,
+    #   'POPESTIMATE2014': 13, 'POPESTIMATE2015': 14, 'POPESTIMATE2016': 15,
+    #   'POPESTIMATE2017': 16, 'POPESTIMATE2018': 17, 'POPESTIMATE2019': 18, ...
+    
+    # the database gives the lines of the criteria in the order of the file
+    if databasePath:
+    
+        lines = 0   # int lines read, counted for the stage that reads them
+        
+        with contextlib.closing( connect_database( databasePath )) as connection:
+            for lines, ( state, county, population ) in enumerate( 
+                    query_census_counties( connection, index.filter_criteria( )), 1 ):
+                
+                matches = index.match( state, county )
+                
+                if matches:
+                    yield ( matches, state, county, format_field( population ))
+                    
+        current_stage( ).count( rows_in = lines )
+                    
+        return
+    
+    # stream the dataset, skipping the header line
+    data = iterate_data_file( path )
+    next( data, None )
+    
+    for line in data:
+    
+        # parse specific fields
+        state = line[ 5 ]
+        county = normalize_county_name( line[ 6 ] )
+        
+        # get the ( state, county ) criteria met by the line
+        matches = index.match( state, county )
+        
+        if matches:
+            yield ( matches, state, county, line[ 18 ] )
+            
+    return
+    
+def parse_nyt_county_data_by_date( countyCriteria, path = 'covid_data/nyt_us_counties.txt',
+                                    useCache = True, forwardFill = False, 
+                                    databasePath = None, startDate = None, 
+                                    endDate = None, workers = 1 ):
     """ This function reduces the full NY Times counties dataset down to a table of
-    results by date. """
+    results by date. A range of dates is read from the date index of the file (see
+    date_index.py), so only its lines are read. With more than one worker, shards of
+    the file are read in parallel; the table is the same. """
     # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
     # ARGUMENT path -> str path of NY Times counties data
+    # ARGUMENT useCache -> bool read the columnar cache if it is current; DEFAULT
+    # ARGUMENT forwardFill -> bool carry cumulative counts forward over missing 
+    #   dates instead of zero; DEFAULT
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the file; DEFAULT none
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    # ARGUMENT workers -> int processes to read the text file; DEFAULT one
 
     # RETURN
     output = [ ]    # list of str tab-delimited data
     
     print( 'Parsing county data from the NY Times...', end = ' ' )
+    
+    ( dates, counties, cases, deaths ) = tabulate_nyt_county_data( countyCriteria, 
+                                        path, useCache, forwardFill, databasePath,
+                                        startDate, endDate, workers )
+    output = format_county_tables( dates, counties, cases, deaths )
+    
+    print( 'YES' )
+    
+    return output
+    
+def parse_nyt_county_metrics( countyCriteria, metrics = None, 
+                                path = 'covid_data/nyt_us_counties.txt',
+                                censusPath = 'covid_data/usc_counties_2019.txt',
+                                useCache = True, table = None, databasePath = None,
+                                startDate = None, endDate = None ):
+    """ This function derives metrics (daily increments, rolling averages, doubling
+    time and rates per 100 000; see county_metrics.py) from the NY Times counties 
+    dataset and the US Census populations, each as a table laid out like the cases
+    table. For a range of dates, the metrics of its first dates are computed without
+    the dates before it (e.g. the first increment is the whole count). """
+    # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
+    # ARGUMENT metrics -> list of str metric names; DEFAULT all
+    # ARGUMENT path -> str path of NY Times counties data
+    # ARGUMENT censusPath -> str path of US Census counties data
+    # ARGUMENT useCache -> bool read the columnar cache if it is current; DEFAULT
+    # ARGUMENT table -> tuple returned by tabulate_nyt_county_data( ) for the same
+    #   criteria, so the dataset isn't parsed again; DEFAULT
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the files; DEFAULT none
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # RETURN
+    output = { }    # dict { str metric name : list of str tab-delimited data }
+    
+    print( 'Computing county metrics...', end = ' ' )
+    
+    if not table:
+        table = tabulate_nyt_county_data( countyCriteria, path, useCache, 
+                                            databasePath = databasePath, 
+                                            startDate = startDate, endDate = endDate )
+    
+    populations = get_census_populations( table[ 1 ], censusPath )
+    
+    with stage( 'metrics', dataset = 'nyt_us_counties' ) as s:
+    
+        s.rows_in = len( table[ 0 ] )
+        output = format_county_metrics( table, populations, metrics )
+        s.rows_out = sum( len( lines ) for lines in output.values( ))
+        
+    print( 'YES' )
+    
+    return output
+    
+def format_county_metrics( table, populations, metrics = None ):
+    """ This function computes metrics from the cases and deaths matrices and 
+    formats each as a table. """
+    # ARGUMENT table -> tuple returned by tabulate_nyt_county_data( )
+    # ARGUMENT populations -> dict returned by get_census_populations( ) for the
+    #   counties of the table
+    # ARGUMENT metrics -> list of str metric names; DEFAULT all
+    
+    # RETURN
+    output = { }    # dict { str metric name : list of str tab-delimited data }
+        
+    ( dates, counties, cases, deaths ) = table
+    
+    # blank counts count as zero
+    cases = [ [ max( count, 0 ) for count in row ] for row in cases ]
+    deaths = [ [ max( count, 0 ) for count in row ] for row in deaths ]
+    
+    results = compute_county_metrics( counties, cases, deaths, populations, metrics )
+    
+    for name, rows in results.items( ):
+        output[ name ] = format_metric_table( name, dates, counties, rows )
+        
+    return output
+    
+def parse_enriched_county_data( countyCriteria, path = 'covid_data/nyt_us_counties.txt',
+                                censusPath = 'covid_data/usc_counties_2019.txt',
+                                maskPath = 'covid_data/nyt_mask_use.txt', useCache = True,
+                                databasePath = None, startDate = None, endDate = None ):
+    """ This function joins the NY Times counties dataset with the US Census 
+    populations and the NY Times mask-use estimates into one table with a line per
+    county and date. """
+    # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
+    # ARGUMENT path -> str path of NY Times counties data
+    # ARGUMENT censusPath -> str path of US Census counties data
+    # ARGUMENT maskPath -> str path of NY Times mask-use data
+    # ARGUMENT useCache -> bool read the columnar cache if it is current; DEFAULT
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the files; DEFAULT none
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # RETURN
+    output = [ ]    # list of str tab-delimited data
+    
+    print( 'Joining county data with populations and mask use...', end = ' ' )
+    
+    output = list( iterate_enriched_county_lines( countyCriteria, path, censusPath,
+                                                    maskPath, useCache, databasePath,
+                                                    startDate, endDate ))
+    
+    print( 'YES' )
+    
+    return output
+    
+def iterate_enriched_county_lines( countyCriteria, path = 'covid_data/nyt_us_counties.txt',
+                                    censusPath = 'covid_data/usc_counties_2019.txt',
+                                    maskPath = 'covid_data/nyt_mask_use.txt', 
+                                    useCache = True, databasePath = None, 
+                                    startDate = None, endDate = None ):
+    """ This generator joins the NY Times county lines that meet the criteria with
+    the US Census populations and the NY Times mask-use estimates on the FIPS code
+    of each line (or on its names for a line without one). The small sides are held
+    in hash tables keyed by FIPS code, and the county lines are streamed past them
+    once in order of date, state and county, whichever source they are read from
+    (see iterate_nyt_county_records( )). """
+    # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
+    # ARGUMENT path -> str path of NY Times counties data
+    # ARGUMENT censusPath -> str path of US Census counties data
+    # ARGUMENT maskPath -> str path of NY Times mask-use data
+    # ARGUMENT useCache -> bool read the columnar cache if it is current; DEFAULT
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the files; DEFAULT none
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # YIELD str tab-delimited data, starting with the header line
+    
+    # the populations are held by the geography (see geography.py)
+    geography = load_geography( censusPath )
+    masks = read_mask_use( maskPath, databasePath )
+    
+    yield '\t'.join( [ 'date', 'state', 'county', 'fips', 'cases', 'deaths', 
+                        'population', 'cases_per_100k', 'deaths_per_100k' ] 
+                        + MASK_FIELDS )
+    
+    # the FIPS code of each county without one, looked up by name once
+    countyFips = { }    # dict { tuple county : int FIPS or None }
+    blanks = [ '' ] * len( MASK_FIELDS )
+    
+    with stage( 'join', dataset = 'nyt_us_counties', path = path ) as s:
+    
+        for ( matches, date, county, cases, deaths ) in iterate_nyt_county_records( 
+                                    Criteria_Index( countyCriteria ), path, useCache, 
+                                    databasePath, startDate, endDate, byDate = True ):
+                                    
+            fips = county[ 2 ]
+            
+            if fips is None:
+            
+                if county not in countyFips:
+                    countyFips[ county ] = geography.county_fips( county[ 0 ], 
+                                                                    county[ 1 ] )
+                    
+                fips = countyFips[ county ]
+            population = geography.population( fips )
+            
+            s.rows_out += 1
+            
+            yield '\t'.join( [ date, county[ 0 ], county[ 1 ], 
+                                '' if fips is None else f'{fips:05d}',
+                                format_count( cases ), format_count( deaths ),
+                                format_field( population ),
+                                format_rate( cases, population ),
+                                format_rate( deaths, population ), 
+                                *masks.get( fips, blanks ) ] )
+                                
+    return
+    
+def parse_rollup_data( level, path = 'covid_data/nyt_us_counties.txt', 
+                        censusPath = 'covid_data/usc_counties_2019.txt',
+                        startDate = None, endDate = None ):
+    """ This function gives the NY Times data of one level of the rollup cube (see
+    rollup_cube.py): the cases, deaths and population of each county, state, Census
+    division, Census region or the USA by date. The table of the level is read from
+    the cube if it is current; otherwise, the counties are rolled up here. """
+    # ARGUMENT level -> str 'county', 'state', 'division', 'region' or 'usa'
+    # ARGUMENT path -> str path of NY Times counties data
+    # ARGUMENT censusPath -> str path of US Census counties data
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # RETURN
+    output = [ ]    # list of str tab-delimited data
+    
+    print( f'Parsing county data rolled up by {level}...', end = ' ' )
+    
+    cube = load_rollup_cube( path, censusPath )
+    
+    if cube:
+    
+        with stage( 'read_filter', dataset = 'nyt_rollup', level = level, 
+                    path = cube.level_path( level )) as s:
+            
+            output = list( cube.lines( level, startDate, endDate ))
+            s.rows_in = s.rows_out = len( output ) - 1
+            
+    else:
+    
+        rollup = Rollup( load_geography( censusPath ))
+        output.append( '\t'.join( ROLLUP_FIELDS ))
+        
+        with stage( 'rollup', dataset = 'nyt_us_counties', level = level, 
+                    path = path ) as s:
+        
+            # stream the dataset, skipping the header line
+            data = iterate_data_file( path, startDate, endDate )
+            next( data, None )
+            
+            # {'date': 0, 'county': 1, 'state': 2, 'fips': 3, 'cases': 4, 'deaths': 5}
+            for fields in data:
+            
+                line = rollup.add( fields[ 0 ], fields[ 2 ], fields[ 1 ], fields[ 3 ],
+                                    parse_count( fields[ 4 ] ), parse_count( fields[ 5 ] ))
+                
+                if level == 'county':
+                    output.append( line )
+                    
+            if level != 'county':
+                output.extend( rollup.lines( level ))
+                
+            s.rows_out = len( output ) - 1
+            
+    print( 'YES' )
+    
+    return output
+    
+def read_mask_use( path = 'covid_data/nyt_mask_use.txt', databasePath = None ):
+    """ This function reads the NY Times mask-use estimates into a hash table keyed
+    by FIPS code. """
+    # ARGUMENT path -> str path of NY Times mask-use data
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the file; DEFAULT none
+    
+    # RETURN
+    masks = { } # dict { int FIPS : list of str shares, in the order of MASK_FIELDS }
+    
+    with stage( 'read_filter', dataset = 'nyt_mask_use', 
+                path = databasePath or path ) as s:
+    
+        if databasePath:
+        
+            with contextlib.closing( connect_database( databasePath )) as connection:
+                rows = [ ( fips, shares ) for ( fips, *shares ) 
+                            in query_mask_use( connection ) ]
+                            
+            s.rows_in = len( rows )
+            
+        else:
+        
+            # {'COUNTYFP': 0, 'NEVER': 1, 'RARELY': 2, 'SOMETIMES': 3, 
+            #   'FREQUENTLY': 4, 'ALWAYS': 5}
+            
+            # stream the data, skipping the header line
+            data = iterate_data_file( path )
+            next( data, None )
+            
+            rows = ( ( fips_code( fields[ 0 ] ), fields[ 1 : 6 ] ) for fields in data )
+            
+        # the shares are written alike from either source
+        for ( fips, shares ) in rows:
+            masks[ fips ] = [ '' if share in ( None, '' ) else f'{float( share ):.3f}' 
+                                for share in shares ]
+            
+        s.rows_out = len( masks )
+        
+    return masks
+    
+def tabulate_nyt_county_data( countyCriteria, path = 'covid_data/nyt_us_counties.txt',
+                                useCache = True, forwardFill = False, databasePath = None,
+                                startDate = None, endDate = None, workers = 1,
+                                counties = None, before = None ):
+    """ This function reduces the full NY Times counties dataset down to matrices of
+    cases and deaths by date and county. A county without a line for a date has a 
+    count of zero, or the count of the date before with forwardFill. With more than
+    one worker, the text file is read by a pool of processes (see 
+    tabulate_nyt_county_shards( )). The columns can be given (see 
+    County_Table.matrices( )). """
+    # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
+    # ARGUMENT path -> str path of NY Times counties data
+    # ARGUMENT useCache -> bool read the columnar cache if it is current; DEFAULT
+    # ARGUMENT forwardFill -> bool carry cumulative counts forward over missing 
+    #   dates instead of zero; DEFAULT
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the file; DEFAULT none
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    # ARGUMENT workers -> int processes to read the text file; DEFAULT one
+    # ARGUMENT counties -> list of tuples ( str State, str County ) of the columns;
+    #   DEFAULT the counties that meet the criteria sorted by name
+    # ARGUMENT before -> tuple ( sequence of int cases, sequence of int deaths ) of
+    #   the date before startDate, by column, for forwardFill; DEFAULT none
 
-    # import the complete dataset from the file
-    data = import_data_file( path )    
+    # RETURN tuple ( list of str dates, list of tuples ( str State, str County, 
+    #   int FIPS or None ), list of int cases rows, list of int deaths rows ); the
+    #   matrices have one row (a sequence of ints) per date and one column per 
+    #   county
     
-    # {'date': 0, 'county': 1, 'state': 2, 'fips': 3, 'cases': 4, 'deaths': 5}
+    # compile the criteria for single-pass matching
+    index = Criteria_Index( countyCriteria )
+    table = County_Table( )
+    
+    # the text file is read in parallel if asked, unless the lines come from the
+    # database or the columnar cache, or the file is compressed (and can't be split)
+    sharded = ( workers > 1 and not databasePath 
+                and not ( useCache and load_columnar_cache( path ))
+                and not compression_of( find_data_file( path )))
+    
+    with stage( 'read_filter', dataset = 'nyt_us_counties', path = path, 
+                workers = workers if sharded else 1 ) as s:
+    
+        if sharded:
+            table = tabulate_nyt_county_shards( countyCriteria, find_data_file( path ), 
+                                                workers, startDate, endDate )
+        else:
+            for ( matches, date, county, cases, deaths ) in iterate_nyt_county_records( 
+                                                index, path, useCache, databasePath,
+                                                startDate, endDate ):
+                table.add( date, county, cases, deaths )
+            
+        s.rows_out = len( table.line_dates )
+        
+    with stage( 'pivot', dataset = 'nyt_us_counties' ) as s:
+    
+        s.rows_in = len( table.line_dates )
+        matrices = table.matrices( forwardFill, counties, before )
+        s.rows_out = len( matrices[ 0 ] )
+                
+    return matrices
     
-    # reduced dataset by criteria
-    limitedData = [ ]   # list of lines of data based on county criteria
+class County_Table( ):
+    """ This object collects the NY Times county lines that meet one set of criteria
+    into cases and deaths by date and county. A county is a column of the matrices
+    by its FIPS code (see county_key( )); its names are only shown in the headers.
     
-    # evaluate each ( state, county) criterion
-    for ( state, county ) in countyCriteria:
+    The lines are kept as compact columns of dense date and county ids, so nothing
+    is keyed by tuple; the matrices are then filled in one pass into preallocated 
+    flat integer arrays, one row of counties after another. """
     
-        # get the subset of data lines for a specific criterion
-        subset = [ line for line in data
-                    if ( not state or line[ 2 ] == state )
-                    and ( not county or line[ 1 ] == county ) ]
+    def __init__( self ):
+        """ Initializes the object. """
+    
+        self.date_ids = { }     # dict { str date : int id in order of appearance }
+        
+        # dict { tuple ( str State, str County, int FIPS or None ) : int id }
+        self.county_ids = { }
+        
+        # the lines in the order they were added
+        self.line_dates = array.array( 'i' )
+        self.line_counties = array.array( 'i' )
+        self.line_cases = array.array( 'q' )
+        self.line_deaths = array.array( 'q' )
+        
+        return
+        
+    def add( self, date, county, cases, deaths ):
+        """ Adds the counts of a county on a date. """
+        # ARGUMENT date -> str date as YYYY-MM-DD
+        # ARGUMENT county -> tuple ( str State, str County, int FIPS or None )
+        # ARGUMENT cases -> int cumulative cases, or MISSING
+        # ARGUMENT deaths -> int cumulative deaths, or MISSING
+        
+        self.line_dates.append( self.date_ids.setdefault( date, len( self.date_ids )))
+        self.line_counties.append( self.county_ids.setdefault( county, 
+                                                            len( self.county_ids )))
+        self.line_cases.append( cases )
+        self.line_deaths.append( deaths )
+        
+        return
+        
+    def merge( self, other ):
+        """ Adds the lines of another table after the lines of this one, as if they
+        had been added to this one in the same order. """
+        # ARGUMENT other -> County_Table( ) object
+        
+        # the ids of the other table in this one
+        dateIds = array.array( 'i', [ self.date_ids.setdefault( date, len( self.date_ids ))
+                                        for date in other.date_ids ] )
+        countyIds = array.array( 'i', [ self.county_ids.setdefault( county, 
+                                                            len( self.county_ids ))
+                                        for county in other.county_ids ] )
+        
+        self.line_dates.extend( dateIds[ i ] for i in other.line_dates )
+        self.line_counties.extend( countyIds[ i ] for i in other.line_counties )
+        self.line_cases.extend( other.line_cases )
+        self.line_deaths.extend( other.line_deaths )
+        
+        return
+        
+    def matrices( self, forwardFill = False, counties = None, before = None ):
+        """ Gives the sorted dates and counties and the cases and deaths matrices. A
+        county without a line for a date has a count of zero or, with forwardFill, 
+        the count of the date before (the counts are cumulative). The lines of a 
+        FIPS code are one column, under the names of its first line.
+        
+        The columns can be given instead (e.g. those of a table the rows are added 
+        to, by name), with the counts of the date before the first date for 
+        forwardFill; a county of the table that isn't one of them raises a 
+        ValueError. """
+        # ARGUMENT forwardFill -> bool carry counts forward over missing dates; DEFAULT
+        # ARGUMENT counties -> list of tuples ( str State, str County ) of the columns,
+        #   which must include every county of the table; DEFAULT the counties sorted
+        #   by name
+        # ARGUMENT before -> tuple ( sequence of int cases, sequence of int deaths )
+        #   of the date before the first date, by column; DEFAULT none
+    
+        # the first county of each key, in the order of the lines
+        # dict { int FIPS or tuple ( str State, str County ) : tuple ( str State,
+        #   str County, int FIPS or None ) }
+        names = { }
+        for county in self.county_ids:
+            names.setdefault( county_key( county ), county )
+    
+        # get the sets of dates and counties as sorted lists
+        # counties are represented as tuples ( State, County, FIPS )
+        dates = sorted( self.date_ids )
+        
+        if counties is None:
+            counties = sorted( names.values( ), key = lambda county : county[ : 2 ] )
+            columns = { county_key( county ) : i for i, county in enumerate( counties ) }
+        else:
+            byName = { tuple( county[ : 2 ] ) : i for i, county in enumerate( counties ) }
+            columns = { key : byName[ county[ : 2 ]] for key, county in names.items( )
+                        if county[ : 2 ] in byName }
+            
+        width = len( counties )
+        size = len( dates ) * width
+        
+        # the row and column of each id
+        dateRows = array.array( 'q', bytes( 8 * len( dates )))
+        for i, date in enumerate( dates ):
+            dateRows[ self.date_ids[ date ]] = i * width
+            
+        countyColumns = array.array( 'q', bytes( 8 * len( self.county_ids )))
+        
+        for county, countyId in self.county_ids.items( ):
+        
+            key = county_key( county )
+            
+            if key not in columns:
+                raise ValueError( f'{county} is not one of the columns' )
+                
+            countyColumns[ countyId ] = columns[ key ]
+        
+        # zero-filled matrices and a mask of the cells that have a line
+        cases = array.array( 'q', bytes( 8 * size ))
+        deaths = array.array( 'q', bytes( 8 * size ))
+        filled = bytearray( size )
+        
+        for dateId, countyId, caseCount, deathCount in zip( self.line_dates, 
+                                                        self.line_counties,
+                                                        self.line_cases,
+                                                        self.line_deaths ):
+            cell = dateRows[ dateId ] + countyColumns[ countyId ]
+            cases[ cell ] = caseCount
+            deaths[ cell ] = deathCount
+            filled[ cell ] = 1
+            
+        if forwardFill:
+        
+            # a missing cell of the first row takes the date before, if it is given
+            if before:
+            
+                cell = filled.find( 0, 0, width )
+                
+                while cell >= 0:
+                    cases[ cell ] = before[ 0 ][ cell ]
+                    deaths[ cell ] = before[ 1 ][ cell ]
+                    cell = filled.find( 0, cell + 1, width )
+                    
+            # a missing cell after the first row takes the cell above it
+            cell = filled.find( 0, width )
+            
+            while cell >= 0:
+                cases[ cell ] = cases[ cell - width ]
+                deaths[ cell ] = deaths[ cell - width ]
+                cell = filled.find( 0, cell + 1 )
+                
+        # one row view per date
+        casesView = memoryview( cases )
+        deathsView = memoryview( deaths )
+        
+        cases = [ casesView[ i : i + width ] for i in range( 0, size, width or 1 ) ]
+        deaths = [ deathsView[ i : i + width ] for i in range( 0, size, width or 1 ) ]
                     
-        # add the subet to the set of limited data
-        limitedData.extend( subset )
-    
-    # get the sets of dates and counties as sorted lists
-    # counties are represented as tuples ( State, County )    
-    dates = sorted( list( { fields[ 0 ] for fields in limitedData } ))
-    counties = sorted( list( { ( fields[ 2 ], fields[ 1 ] ) for fields in limitedData }))
-    
-    # create cases and deaths dictionaries
-    # dict { tuple ( str date, tuple ( state, county )) : str case or death count }
-    casesDct = { ( fields[ 0 ], ( fields[ 2 ], fields[ 1 ] ) ) : fields[ 4 ]
-                for fields in limitedData }
-    deathsDct = { ( fields[ 0 ], ( fields[ 2 ], fields[ 1 ] ) ) : fields[ 5 ]
-                for fields in limitedData }
+        return ( dates, counties, cases, deaths )
+    
+def county_key( county ):
+    """ This function gives the key a NY Times county is tabulated and joined on: 
+    its FIPS code, or its state and name for a line without one (e.g. New York 
+    City or Unknown). """
+    # ARGUMENT county -> tuple ( str State, str County, int FIPS or None )
+    
+    # RETURN int FIPS, or tuple ( str State, str County )
+    
+    return county[ : 2 ] if county[ 2 ] is None else county[ 2 ]
+    
+def format_county_tables( dates, counties, cases, deaths ):
+    """ This function formats the cases and deaths matrices as two tables of 
+    results by date, one after the other. """
+    # ARGUMENT dates -> list of str dates of the rows
+    # ARGUMENT counties -> list of tuples ( str State, str County ) of the columns
+    # ARGUMENT cases -> list of sequences of int cases by date and county
+    # ARGUMENT deaths -> list of sequences of int deaths by date and county
+    
+    # RETURN
+    output = [ ]    # list of str tab-delimited data
                 
-    def encapsulte_output_cycles( title, dct ):
+    def encapsulte_output_cycles( title, matrix ):
         """ This subroutine encapsulates the code for making the cases and deaths
         tables in succession. """
         # ARGUMENT title -> str table title
-        # ARGUMENT dct -> dct for either casesDct or deathsDct
+        # ARGUMENT matrix -> list of sequences of either cases or deaths
         
         # RETURN nothing
     
@@ -275,89 +1740,655 @@ def parse_nyt_county_data_by_date( countyCriteria, path = 'covid_data/nyt_us_cou
         output.append( f'{title.upper( )}\t' + '\t'.join( [ county[ 0 ] for county in counties ] ))
         output.append( 'date\t' + '\t'.join( [ county[ 1 ] for county in counties ] ))
     
-        # go thru list of dates
-        for date in dates:
+        output.extend( format_county_rows( dates, matrix ))
+        output.append( '' ) # spacer
+            
+        return
+    
+    # make the two tables    
+    with stage( 'format', dataset = 'nyt_us_counties' ) as s:
+    
+        encapsulte_output_cycles( 'CASES', cases )
+        encapsulte_output_cycles( 'DEATHS', deaths )
+        
+        s.rows_in = 2 * len( dates )
+        s.rows_out = len( output )
+    
+    return output
+    
+def format_county_rows( dates, matrix ):
+    """ This function formats the rows of the cases or deaths matrix, one line per
+    date. """
+    # ARGUMENT dates -> list of str dates of the rows
+    # ARGUMENT matrix -> list of sequences of either cases or deaths
+    
+    # RETURN
+    output = [ ]    # list of str tab-delimited data
+    
+    # go thru list of dates
+    for date, row in zip( dates, matrix ):
+    
+        # a whole row is converted at once unless it has a blank count
+        if MISSING in row:
+            outputFields = map( format_count, row )
+        else:
+            outputFields = map( str, row )
+        
+        # append the joined fields to the output list    
+        output.append( '\t'.join( [ date, *outputFields ] ))
+        
+    return output
+    
+def iterate_nyt_county_records( index, path = 'covid_data/nyt_us_counties.txt',
+                                useCache = True, databasePath = None, startDate = None,
+                                endDate = None, byDate = False ):
+    """ This generator yields the lines of the NY Times counties dataset that meet
+    the criteria of a Criteria_Index( ) within a range of dates. The lines come from
+    the database if one is given, or from the columnar cache when it is current, so
+    only the matching counties are touched; otherwise, the text file is streamed 
+    (only the lines of the range of dates, if it has a current date index). 
+    
+    The order of the lines depends on where they come from (the cache gives them
+    county by county), unless byDate is set: the lines are then in order of date,
+    state and county from any of them. The rows of the cache are merged by date,
+    and the lines of each date of the text file (which is in date order) are 
+    sorted, so only the lines of one date are held. """
+    # ARGUMENT index -> Criteria_Index( ) object
+    # ARGUMENT path -> str path of NY Times counties data
+    # ARGUMENT useCache -> bool read the columnar cache if it is current; DEFAULT
+    # ARGUMENT databasePath -> str path of the SQLite database to query instead of
+    #   the file; DEFAULT none
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    # ARGUMENT byDate -> bool yield the lines in order of date, state and county;
+    #   DEFAULT
+    
+    # YIELD tuple ( tuple of int criterion indices, str date, 
+    #   tuple ( str State, str County, int FIPS or None ), int cases, int deaths ); a
+    #   blank count is MISSING
+    
+    # the database gives the lines in order of date, state and county
+    if databasePath:
+    
+        lines = 0   # int lines read, counted for the stage that reads them
         
-            # make list of fields to be joined and appended to output
-            outputFields = [ date ]
+        with contextlib.closing( connect_database( databasePath )) as connection:
+            for lines, ( date, state, county, fips, cases, deaths ) in enumerate( 
+                        query_nyt_counties( connection, index.filter_criteria( ), 
+                                            startDate, endDate ), 1 ):
+                
+                matches = index.match( state, county )
+                
+                if matches:
+                    yield ( matches, date, ( state, county, fips ), 
+                            MISSING if cases is None else cases,
+                            MISSING if deaths is None else deaths )
+                    
+        current_stage( ).count( rows_in = lines )
+                    
+        return
+    
+    cache = load_columnar_cache( path ) if useCache else None
+    
+    if cache:
+    
+        dateIds = cache.date_id_range( startDate, endDate )
         
-            # append data for each county
-            for county in counties:
-                outputFields.append( str( dct.get( ( date, county ), 0 ) ) )
+        def iterate_key_records( keyId, matches, county ):
+            """ This subroutine yields the lines of a key of the cache in date 
+            order. """
             
-            # append the joined fields to the output list    
-            output.append( '\t'.join( outputFields ))
+            # YIELD tuple as iterate_nyt_county_records( )
             
-        output.append( '' ) # spacer
+            for ( date, cases, deaths ) in cache.rows( keyId, dateIds ):
+                yield ( matches, date, county, cases, deaths )
+                
+            return
+            
+        keyRecords = [ ]    # list of the generators of the matching keys
+    
+        # classify each ( State, County, FIPS ) key once and read its rows
+        for keyId, ( state, county, fips ) in enumerate( cache.keys ):
+        
+            matches = index.match( state, county )
             
+            if matches:
+            
+                # the memory-mapped rows are read without a read( ) call, so
+                # their bytes are counted here
+                rows = cache.offsets[ keyId + 1 ] - cache.offsets[ keyId ]
+                current_stage( ).count( rows_in = rows, bytes_read = rows * ROW_BYTES )
+                
+                keyRecords.append( iterate_key_records( keyId, matches, 
+                                                ( state, county, fips_code( fips ))))
+                                                
+        if byDate:
+            yield from heapq.merge( *keyRecords, key = nyt_record_order )
+        else:
+            yield from itertools.chain.from_iterable( keyRecords )
+    
         return
     
-    # make the two tables    
-    encapsulte_output_cycles( 'CASES', casesDct )
-    encapsulte_output_cycles( 'DEATHS', deathsDct )
+    # stream the dataset, skipping the header line
+    data = iterate_data_file( path, startDate, endDate )
+    next( data, None )
     
-    print( 'YES' )
+    records = match_nyt_county_fields( index, data )
+    
+    if byDate:
+        for date, dateRecords in itertools.groupby( records, 
+                                                    key = lambda record : record[ 1 ] ):
+            yield from sorted( dateRecords, key = nyt_record_order )
+    else:
+        yield from records
+            
+    return
+    
+def nyt_record_order( record ):
+    """ This function gives the sort key of a line yielded by 
+    iterate_nyt_county_records( ): its date, state and county. """
+    # ARGUMENT record -> tuple yielded by iterate_nyt_county_records( )
+    
+    # RETURN tuple ( str date, str State, str County )
+    
+    return ( record[ 1 ], record[ 2 ][ 0 ], record[ 2 ][ 1 ] )
+    
+def match_nyt_county_fields( index, data ):
+    """ This generator yields the NY Times county lines that meet the criteria of a
+    Criteria_Index( ) from the parsed fields of the lines. """
+    # ARGUMENT index -> Criteria_Index( ) object
+    # ARGUMENT data -> iterable of lists of str fields of the data lines
+    
+    # YIELD tuple as iterate_nyt_county_records( )
+    
+    # {'date': 0, 'county': 1, 'state': 2, 'fips': 3, 'cases': 4, 'deaths': 5}
+    
+    for fields in data:
+    
+        # keep only the lines that meet a ( state, county ) criterion
+        matches = index.match( fields[ 2 ], fields[ 1 ] )
+        
+        if matches:
+            yield ( matches, fields[ 0 ], ( fields[ 2 ], fields[ 1 ], 
+                                            fips_code( fields[ 3 ] )),
+                    parse_count( fields[ 4 ] ), parse_count( fields[ 5 ] ))
+            
+    return
+    
+def tabulate_nyt_county_shards( countyCriteria, path = 'covid_data/nyt_us_counties.txt',
+                                workers = 2, startDate = None, endDate = None ):
+    """ This function reads the NY Times counties text file in parallel: the file is
+    split into shards of whole lines, a pool of processes reads and filters the
+    shards, each into a County_Table( ) of its own, and the tables are merged in
+    the order of the shards, so the result is the same as reading the file in one
+    pass. """
+    # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
+    # ARGUMENT path -> str path of the plain NY Times counties table
+    # ARGUMENT workers -> int processes; DEFAULT
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # RETURN County_Table( ) object
+    
+    table = County_Table( )
+    shards = nyt_shard_ranges( path, workers, startDate, endDate )
+    
+    with concurrent.futures.ProcessPoolExecutor( workers ) as executor:
+    
+        futures = [ executor.submit( tabulate_nyt_shard, path, start, end, 
+                                    countyCriteria, startDate, endDate )
+                    for ( start, end ) in shards ]
+        
+        for future in futures:
+        
+            ( shardTable, lines ) = future.result( )
+            
+            table.merge( shardTable )
+            current_stage( ).count( rows_in = lines )
+            
+    return table
+    
+def nyt_shard_ranges( path, shards, startDate = None, endDate = None ):
+    """ This function splits a table into byte ranges of whole lines, about the 
+    same size, for as many shards. Only the lines of a range of dates are split if
+    the table has a current date index (see date_index.py). """
+    # ARGUMENT path -> str path of the plain table
+    # ARGUMENT shards -> int shards wanted
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
     
+    # RETURN list of tuples ( int first byte, int end byte ) in file order
+    
+    output = [ ]
+    
+    with open( path, 'rb' ) as fileIn:
+    
+        # the lines after the header line, or only those of the dates
+        dateIndex = load_date_index( path ) if startDate or endDate else None
+        
+        if dateIndex:
+            ranges = dateIndex.byte_ranges( startDate, endDate )
+        else:
+            ranges = [ ( len( fileIn.readline( )), os.fstat( fileIn.fileno( )).st_size ) ]
+            
+        total = sum( end - start for ( start, end ) in ranges )
+        size = max( SHARD_MIN_BYTES, -( -total // max( 1, shards )))
+        
+        for ( start, end ) in ranges:
+        
+            while start < end:
+            
+                # each shard ends after the line break at or after its size
+                fileIn.seek( min( start + size, end ) - 1 )
+                fileIn.readline( )
+                stop = min( fileIn.tell( ), end )
+                
+                output.append( ( start, stop ))
+                start = stop
+                
     return output
     
+def tabulate_nyt_shard( path, start, end, countyCriteria, startDate = None, 
+                        endDate = None ):
+    """ This function reads and filters the lines of one shard of the NY Times 
+    counties text file, in a process of the pool of tabulate_nyt_county_shards( ). """
+    # ARGUMENT path -> str path of the plain NY Times counties table
+    # ARGUMENT start -> int first byte of the shard, at the start of a line
+    # ARGUMENT end -> int end byte of the shard, after a line break
+    # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # RETURN tuple ( County_Table( ) object, int lines read )
+    
+    table = County_Table( )
+    lines = 0   # int lines read, for the stage of the parent process
+    
+    def iterate_shard_fields( ):
+        """ This subroutine yields the fields of the lines of the shard. """
+        
+        # YIELD list of str fields
+        
+        nonlocal lines
+        
+        with open( path, 'rb' ) as fileIn:
+        
+            fileIn.seek( start )
+            position = start
+            
+            while position < end:
+            
+                line = fileIn.readline( )
+                
+                if not line:
+                    break
+                    
+                position += len( line )
+                lines += 1
+                line = line.decode( ).rstrip( '\r\n' )
+                
+                if not line:
+                    continue
+                    
+                fields = line.split( '\t' )
+                
+                if in_date_range( iso_date( fields[ 0 ] ), startDate, endDate ):
+                    yield fields
+                    
+        return
+        
+    for ( matches, date, county, cases, deaths ) in match_nyt_county_fields( 
+                                Criteria_Index( countyCriteria ), iterate_shard_fields( )):
+        table.add( date, county, cases, deaths )
+        
+    return ( table, lines )
+    
+def format_rate( count, population ):
+    """ This function formats a case or death count as a rate per 100 000 people;
+    the rate is blank without a count or a population. """
+    # ARGUMENT count -> int count
+    # ARGUMENT population -> int population, or None if it isn't known
+    
+    # RETURN str rate
+    
+    if count == MISSING or not population:
+        return ''
+        
+    return f'{count * 100000 / population:.2f}'
+    
 def state_from_postal_code( abbrev ):
     """ This function provides a full state name from a two-letter abbreviation. If 
     the abbreviation isn't in the dictionary, the abbreviation itself is return. """
     # ARGUMENT abbrev -> str 2-letter state abbreviation
     
-    # RETURN
-    state = ''  # str state name
-
-    statesAbbrevDct = { 'AL' : 'Alabama', 'AK' : 'Alaska', 'AZ' : 'Arizona', 
-                    'AR' : 'Arkansas', 'CA' : 'California', 'CO' : 'Colorado', 
-                    'CT' : 'Connecticut', 'DE' : 'Delaware', 'FL' : 'Florida', 
-                    'GA' : 'Georgia', 'HI' : 'Hawaii', 'ID' : 'Idaho', 'IL' : 'Illinois', 
-                    'IN' : 'Indiana', 'IA' : 'Iowa', 'KS' : 'Kansas', 'KY' : 'Kentucky', 
-                    'LA' : 'Louisiana', 'ME' : 'Maine', 'MD' : 'Maryland', 
-                    'MA' : 'Massachusetts', 'MI' : 'Michigan', 'MN' : 'Minnesota', 
-                    'MS' : 'Mississippi', 'MO' : 'Missouri', 'MT' : 'Montana', 
-                    'NE' : 'Nebraska', 'NV' : 'Nevada', 'NH' : 'New Hampshire', 
-                    'NJ' : 'New Jersey', 'NM' : 'New Mexico', 'NY' : 'New York', 
-                    'NC' : 'North Carolina', 'ND' : 'North Dakota', 'OH' : 'Ohio', 
-                    'OK' : 'Oklahoma', 'OR' : 'Oregon', 'PA' : 'Pennsylvania', 
-                    'RI' : 'Rhode Island', 'SC' : 'South Carolina', 'SD' : 'South Dakota', 
-                    'TN' : 'Tennessee', 'TX' : 'Texas', 'UT' : 'Utah', 'VT' : 'Vermont', 
-                    'VA' : 'Virginia', 'WA' : 'Washington', 'WV' : 'West Virginia', 
-                    'WI' : 'Wisconsin', 'WY' : 'Wyoming', 'GU' : 'Guam', 
-                    'PR' : 'Puerto Rico', 'MP' : 'Northern Mariana Islands', 
-                    'AS' : 'American Samoa', 'VI' : 'Virgin Islands',
-                    'DC' : 'District of Columbia' }
-                    
-    state = statesAbbrevDct.get( abbrev.upper( ), f'{abbrev}**' )
-
-    return state
+    # RETURN str state name
+    
+    return STATE_NAMES.get( abbrev.upper( ), f'{abbrev}**' )
 
 def export_lines_to_file( lines, path ):
     """ This function writes lines of text to a file. """
-    # ARGUMENT lines -> list of str text
+    # ARGUMENT lines -> list (or iterable) of str text
     # ARGUMENT path -> str path and file name to write
     
     # RETURN nothing
 
-    with open( path, 'w' ) as fileOut:
-        for line in lines:
-            print( line, file = fileOut )
+    lines = iter( lines )
+    
+    with stage( 'export', path = path ) as s:
+    
+        # join and write the lines a chunk at a time rather than one by one
+        with open( path, 'w', buffering = WRITE_BUFFER ) as fileOut:
+        
+            chunk = list( itertools.islice( lines, WRITE_CHUNK_LINES ))
+            
+            while chunk:
+                s.rows_in += len( chunk )
+                fileOut.write( '\n'.join( chunk ) + '\n' )
+                chunk = list( itertools.islice( lines, WRITE_CHUNK_LINES ))
+                
+        s.rows_out = s.rows_in
+        s.bytes_written = file_size( path )
 
     return
     
+def county_tables_key( countyCriteria, path, forwardFill = False, startDate = None,
+                        endDate = None ):
+    """ This function gives the key of the incremental state of a county cases and
+    deaths table (see incremental_output.py). """
+    # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
+    # ARGUMENT path -> str path of NY Times counties data
+    # ARGUMENT forwardFill -> bool carry cumulative counts forward; DEFAULT
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # RETURN dict
+    
+    return { 'table' : 'county_cases_and_deaths', 'criteria' : countyCriteria, 
+            'sources' : [ path ], 'forwardFill' : forwardFill, 'startDate' : startDate,
+            'endDate' : endDate }
+    
+def update_county_tables( countyCriteria, outputPath, path = 'covid_data/nyt_us_counties.txt',
+                            useCache = True, forwardFill = False, startDate = None,
+                            endDate = None, workers = 1 ):
+    """ This function adds the dates that are new since a county cases and deaths
+    table was written to the end of its CASES and DEATHS tables, if that gives the
+    same table as making it again: the table has an incremental state for the same
+    criteria, no older date of the NY Times data has been revised and the new dates
+    have no new county. """
+    # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
+    # ARGUMENT outputPath -> str path of the table
+    # ARGUMENT path -> str path of NY Times counties data
+    # ARGUMENT useCache -> bool read the columnar cache if it is current; DEFAULT
+    # ARGUMENT forwardFill -> bool carry cumulative counts forward; DEFAULT
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    # ARGUMENT workers -> int processes to read the text file; DEFAULT one
+    
+    # RETURN bool whether the table is up to date; False if it has to be made again
+    
+    key = county_tables_key( countyCriteria, path, forwardFill, startDate, endDate )
+    state = load_output_state( outputPath, key )
+    
+    if not state or not state[ 'last_date' ]:
+        return False
+        
+    checksums = { path : date_checksums( path, startDate, endDate ) }
+    
+    if revised_dates( state, checksums ):
+        return False
+        
+    print( 'Adding new dates to county data from the NY Times...', end = ' ' )
+    
+    lastDate = last_date_of( checksums )
+    lastRows = state[ 'last_rows' ]
+    offsets = state[ 'offsets' ]
+    
+    if lastDate > state[ 'last_date' ]:
+    
+        # the new dates are laid out in the columns of the table, carrying its last
+        # counts forward with forwardFill; a new county is a new column
+        counties = [ tuple( county ) for county in state[ 'columns' ] ]
+        before = lastRows and [ [ parse_count( field ) for field in row ] 
+                                for row in lastRows ]
+        
+        try:
+            ( dates, counties, cases, deaths ) = tabulate_nyt_county_data( 
+                                    countyCriteria, path, useCache, forwardFill, None,
+                                    next_date( state[ 'last_date' ] ), endDate, workers,
+                                    counties, before )
+        except ValueError:
+            print( 'NO' )
+            return False
+            
+        blocks = [ format_county_rows( dates, cases ), 
+                    format_county_rows( dates, deaths ) ]
+        
+        if dates:
+            offsets = insert_lines( outputPath, offsets, blocks )
+            lastRows = [ block[ -1 ].split( '\t' )[ 1 : ] for block in blocks ]
+            
+    save_output_state( outputPath, key, state[ 'columns' ], lastDate, checksums, 
+                        offsets, last_rows = lastRows )
+    
+    print( 'YES' )
+    
+    return True
+    
+def save_county_tables_state( countyCriteria, outputPath, lines,
+                                path = 'covid_data/nyt_us_counties.txt', 
+                                forwardFill = False, startDate = None, endDate = None ):
+    """ This function saves the incremental state of a county cases and deaths table
+    that was just written in full, so that the next run can add the new dates to
+    it (see update_county_tables( )). """
+    # ARGUMENT countyCriteria -> list of tuples ( str State, str County ) to limit dataset
+    # ARGUMENT outputPath -> str path of the table
+    # ARGUMENT lines -> list of str lines of the table (see format_county_tables( ))
+    # ARGUMENT path -> str path of NY Times counties data
+    # ARGUMENT forwardFill -> bool carry cumulative counts forward; DEFAULT
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # RETURN nothing
+    
+    checksums = { path : date_checksums( path, startDate, endDate ) }
+    
+    # the table is the CASES table and then the DEATHS table, each with two header
+    # lines, a line per date and a spacer
+    rows = len( lines ) // 2 - 3
+    header = [ line.split( '\t' )[ 1 : ] for line in lines[ : 2 ] ]
+    columns = [ ] if lines[ 1 ] == 'date\t' else [ list( county ) 
+                                                    for county in zip( *header ) ]
+    
+    # the new dates go after the last line of each table
+    offsets = [ len( line_bytes( lines[ : 2 + rows ] )), 
+                len( line_bytes( lines[ : 5 + 2 * rows ] )) ]
+    lastRows = rows and [ lines[ 1 + rows ].split( '\t' )[ 1 : ], 
+                            lines[ 4 + 2 * rows ].split( '\t' )[ 1 : ] ]
+    
+    save_output_state( outputPath, county_tables_key( countyCriteria, path, forwardFill,
+                                                        startDate, endDate ),
+                        columns, last_date_of( checksums ), checksums, offsets,
+                        last_rows = lastRows or None )
+    
+    return
+    
+def state_table_key( statesCriteria, usPath, statesPath, startDate = None, 
+                        endDate = None ):
+    """ This function gives the key of the incremental state of a USA and states
+    table (see incremental_output.py). """
+    # ARGUMENT statesCriteria -> list of str states to limit dataset
+    # ARGUMENT usPath -> str path to The Atlantic USA data
+    # ARGUMENT statesPath -> str path to The Atlantic states data
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # RETURN dict
+    
+    return { 'table' : 'state_cases_and_deaths', 'criteria' : statesCriteria, 
+            'sources' : [ usPath, statesPath ], 'startDate' : startDate, 
+            'endDate' : endDate }
+    
+def update_state_table( statesCriteria, outputPath, 
+                        usPath = 'covid_data/atl_historic_us.txt', 
+                        statesPath = 'covid_data/atl_historic_states.txt',
+                        startDate = None, endDate = None ):
+    """ This function appends the dates that are new since a USA and states table 
+    was written, if that gives the same table as making it again: the table has an
+    incremental state for the same criteria, no older date of The Atlantic data has
+    been revised and the new dates have no new state. """
+    # ARGUMENT statesCriteria -> list of str states to limit dataset
+    # ARGUMENT outputPath -> str path of the table
+    # ARGUMENT usPath -> str path to The Atlantic USA data
+    # ARGUMENT statesPath -> str path to The Atlantic states data
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # RETURN bool whether the table is up to date; False if it has to be made again
+    
+    key = state_table_key( statesCriteria, usPath, statesPath, startDate, endDate )
+    state = load_output_state( outputPath, key )
+    
+    if not state or not state[ 'last_date' ]:
+        return False
+        
+    checksums = { path : date_checksums( path, startDate, endDate ) 
+                    for path in ( usPath, statesPath ) }
+    
+    if revised_dates( state, checksums ):
+        return False
+        
+    print( 'Adding new dates to USA and states data from The Atlantic...', end = ' ' )
+    
+    lastDate = last_date_of( checksums )
+    offsets = state[ 'offsets' ]
+    
+    if lastDate > state[ 'last_date' ]:
+    
+        ( usDct, table ) = read_atlantic_states_data( statesCriteria, usPath, statesPath,
+                                                        None, next_date( 
+                                                        state[ 'last_date' ] ), endDate )
+        
+        # a new state is a new column
+        if table.states - set( state[ 'columns' ] ):
+            print( 'NO' )
+            return False
+            
+        # the lines of the new dates, without the header lines
+        lines = format_state_table( statesCriteria, usDct, table, 
+                                    state[ 'columns' ] )[ 2 : ]
+        offsets = insert_lines( outputPath, offsets, [ lines ] )
+        
+    save_output_state( outputPath, key, state[ 'columns' ], lastDate, checksums, 
+                        offsets )
+    
+    print( 'YES' )
+    
+    return True
+    
+def write_state_table( statesCriteria, outputPath, 
+                        usPath = 'covid_data/atl_historic_us.txt', 
+                        statesPath = 'covid_data/atl_historic_states.txt',
+                        startDate = None, endDate = None ):
+    """ This function writes a USA and states table in full and saves its 
+    incremental state, so that the next run can append the new dates to it (see
+    update_state_table( )). """
+    # ARGUMENT statesCriteria -> list of str states to limit dataset
+    # ARGUMENT outputPath -> str path of the table
+    # ARGUMENT usPath -> str path to The Atlantic USA data
+    # ARGUMENT statesPath -> str path to The Atlantic states data
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # RETURN nothing
+    
+    print( 'Parse USA and states data from The Atlantic...', end = ' ' )
+    
+    checksums = { path : date_checksums( path, startDate, endDate ) 
+                    for path in ( usPath, statesPath ) }
+    
+    # the columns are the states of the table (see tabulate_state_table( ))
+    ( usDct, table ) = read_atlantic_states_data( statesCriteria, usPath, statesPath,
+                                                    None, startDate, endDate )
+    lines = format_state_table( statesCriteria, usDct, table )
+    
+    export_lines_to_file( lines, outputPath )
+    save_output_state( outputPath, state_table_key( statesCriteria, usPath, statesPath,
+                                                    startDate, endDate ),
+                        sorted( table.states ), last_date_of( checksums ), checksums,
+                        [ len( line_bytes( lines )) ] )
+    
+    print( 'YES' )
+    
+    return
+    
 def import_data_file( path ):
     """ This function reads lines from a text file and parses the fields in
-    each tab-delimited line. """
+    each tab-delimited line. The whole file is held in memory, so the parsers
+    stream the file with iterate_data_file( ) instead. """
     # ARGUMENT path -> str path and file name of file to read
     
     # RETURN
-    lines = [ ] # list of lists of str fields
-
-    with open( path ) as fileIn:
-        lines = [ line.split( '\t' ) for line in fileIn.read( ).split( '\n' )
-                    if line ]
+    lines = list( iterate_data_file( path ))    # list of lists of str fields
                     
     return lines
+    
+def iterate_data_file( path, startDate = None, endDate = None ):
+    """ This generator reads a tab-delimited text file one line at a time and 
+    yields the parsed fields of each line, so only the current line is held in
+    memory. Empty lines are skipped. A compressed copy of the file is read if it
+    is newer (see compressed_files.find_data_file( )). 
+    
+    Given a range of dates, only the header line and the lines whose first field 
+    is in the range are yielded. They are read from the byte ranges of the date 
+    index of the file (see date_index.py) if it is current; otherwise, the whole 
+    file is read and the lines are filtered. """
+    # ARGUMENT path -> str path and file name of file to read
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+    
+    # YIELD list of str fields
+    
+    lines = 0   # int lines read, counted for the stage that reads them
+    dated = bool( startDate or endDate )
+    dateIndex = load_date_index( path ) if dated else None
+    
+    try:
+        with contextlib.ExitStack( ) as stack:
+        
+            if dateIndex:
+                fileIn = stack.enter_context( contextlib.closing( 
+                                            dateIndex.read_lines( startDate, endDate )))
+                dated = False
+            else:
+                fileIn = stack.enter_context( open_data_file( path ))
+                
+            for lines, line in enumerate( fileIn, 1 ):
+            
+                line = line.rstrip( '\n' )
+                
+                if not line:
+                    continue
+                    
+                fields = line.split( '\t' )
+                
+                # the header line is always kept
+                if ( not dated or lines == 1
+                    or in_date_range( iso_date( fields[ 0 ] ), startDate, endDate )):
+                    yield fields
+                    
+    finally:
+        current_stage( ).count( rows_in = lines )
+                
+    return
+    
+def reformat_atlantic_date( date ):
+    """ This function adds hyphens to a The Atlantic date (e.g. 20200401) so that 
+    it matches the NY Times format (e.g. 2020-04-01). """
+    # ARGUMENT date -> str date as YYYYMMDD
+    
+    # RETURN str date as YYYY-MM-DD
+    
+    return f'{date[ : 4 ]}-{date[ 4 : 6 ]}-{date[ 6 : ]}'
         
     
 if __name__ == '__main__':
@@ -0,0 +1,456 @@
+# query_service
+""" The purpose of this script is to serve the parsed tables over HTTP from datasets
+that are loaded into memory once, so that each query doesn't re-read the NY Times,
+The Atlantic and US Census files from disk.
+
+The service answers the same tables that the parsing script writes, for criteria
+given as query parameters, e.g.
+
+    http://127.0.0.1:8000/counties?criterion=California:Los Angeles&criterion=Wisconsin
+    http://127.0.0.1:8000/census?criterion=:Adams&unique=1&format=json
+    http://127.0.0.1:8000/states?state=California&state=Wisconsin
+
+A county criterion is State:County, where a blank (or missing) part matches every
+state or county. Tables are tab-delimited text unless format=json is given; the
+counties tables also take fill=forward (see County_Table.matrices( )).
+
+The files are checked every few seconds, and when the update script rewrites any
+of them, the datasets are reloaded in the background and swapped in whole; the
+queries in the meantime are answered from the datasets already loaded. """
+import array
+import collections
+import json
+import os
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from columnar_cache import MISSING
+from compressed_files import find_data_file
+from parse_datasets import ( STATE_FIELDS, County_Table, Criteria_Index, State_Table,
+                            format_census_table, format_county_tables,
+                            format_state_table, iterate_atlantic_state_records,
+                            iterate_census_county_records, iterate_nyt_county_records,
+                            read_atlantic_us_data )
+
+# paths of the datasets { str dataset name : str path }
+DEFAULT_PATHS = { 'nyt' : 'covid_data/nyt_us_counties.txt',
+                    'census' : 'covid_data/usc_counties_2019.txt',
+                    'us' : 'covid_data/atl_historic_us.txt',
+                    'states' : 'covid_data/atl_historic_states.txt' }
+
+RELOAD_INTERVAL = 5.0   # float seconds between checks of the files
+MEMO_SIZE = 256         # int responses remembered per snapshot of the datasets
+
+def main( ):
+
+    print( 'SERVE THE COVID DATA TABLES' )
+
+    serve_queries( )
+
+    exit( )
+
+class Resident_Data( ):
+    """ This object holds one snapshot of the datasets in memory, indexed by county
+    and state, along with the signatures of the files it was loaded from. """
+
+    def __init__( self, paths ):
+        """ Initializes the object. """
+        # ARGUMENT paths -> dict { str dataset name : str path } (see DEFAULT_PATHS)
+
+        self.signatures = dataset_signatures( paths )
+
+        # every line of each dataset is kept
+        everything = Criteria_Index( [ ( None, None ) ] )
+
+        # NY Times counties as columns of the lines of each county in file order
+        self.dates = [ ]        # list of str dates by id
+        # dict { tuple ( str State, str County, int FIPS or None ) : tuple ( array of
+        #   int date ids, array of int cases, array of int deaths ) }
+        self.counties = { }
+        dateIds = { }           # dict { str date : int id }
+
+        for ( matches, date, county, cases, deaths ) in iterate_nyt_county_records(
+                                                        everything, paths[ 'nyt' ] ):
+
+            if date not in dateIds:
+                dateIds[ date ] = len( self.dates )
+                self.dates.append( date )
+
+            if county not in self.counties:
+                self.counties[ county ] = ( array.array( 'i' ), array.array( 'q' ),
+                                            array.array( 'q' ))
+
+            ( countyDates, countyCases, countyDeaths ) = self.counties[ county ]
+            countyDates.append( dateIds[ date ] )
+            countyCases.append( cases )
+            countyDeaths.append( deaths )
+
+        # US Census counties in file order
+        # list of tuples ( str State, str County, str population )
+        self.census = [ ( state, county, population )
+                        for ( matches, state, county, population )
+                        in iterate_census_county_records( everything, paths[ 'census' ] ) ]
+
+        # The Atlantic USA and the lines of each state in file order
+        self.us_dct = read_atlantic_us_data( paths[ 'us' ] )
+        # dict { str State : list of tuples ( str date, dict { str field : str } ) }
+        self.states = { }
+
+        for ( matches, date, state, fieldsDct ) in iterate_atlantic_state_records(
+                                                        everything, paths[ 'states' ] ):
+            self.states.setdefault( state, [ ] ).append( ( date, fieldsDct ))
+
+        # responses already made from this snapshot, least recently used first
+        # collections.OrderedDict { tuple query : tuple ( str content type, bytes ) }
+        self.memo = collections.OrderedDict( )
+        self.memo_lock = threading.Lock( )
+
+        return
+
+    def county_table( self, countyCriteria, forwardFill = False ):
+        """ Gives the cases and deaths matrices of the counties that meet the
+        criteria, as tabulate_nyt_county_data( ) does. """
+        # ARGUMENT countyCriteria -> list of tuples ( str State, str County )
+        # ARGUMENT forwardFill -> bool carry counts forward over missing dates; DEFAULT
+
+        # RETURN tuple ( list of str dates, list of tuples ( str State, str County,
+        #   int FIPS or None ), list of int cases rows, list of int deaths rows )
+
+        index = Criteria_Index( countyCriteria )
+        table = County_Table( )
+        dates = self.dates
+
+        for county, ( countyDates, countyCases, countyDeaths ) in self.counties.items( ):
+            if index.match( county[ 0 ], county[ 1 ] ):
+                for dateId, cases, deaths in zip( countyDates, countyCases, countyDeaths ):
+                    table.add( dates[ dateId ], county, cases, deaths )
+
+        return table.matrices( forwardFill )
+
+    def census_records( self, countyCriteria ):
+        """ Generates the US Census lines that meet the criteria, as
+        iterate_census_county_records( ) does. """
+        # ARGUMENT countyCriteria -> list of tuples ( str State, str County )
+
+        # YIELD tuple ( tuple of int criterion indices, str State, str County,
+        #   str population )
+
+        index = Criteria_Index( countyCriteria )
+
+        for ( state, county, population ) in self.census:
+
+            matches = index.match( state, county )
+
+            if matches:
+                yield ( matches, state, county, population )
+
+        return
+
+    def state_table( self, statesCriteria ):
+        """ Gives the The Atlantic lines of the states that meet the criteria. """
+        # ARGUMENT statesCriteria -> list of str states
+
+        # RETURN State_Table( ) object
+
+        index = Criteria_Index( [ ( state, None ) for state in statesCriteria ] )
+        table = State_Table( )
+
+        for state, lines in self.states.items( ):
+            if index.match( state ):
+                for ( date, fieldsDct ) in lines:
+                    table.add( date, state, fieldsDct )
+
+        return table
+
+    def respond( self, query, make ):
+        """ Gives the response to a query, making it only if it isn't remembered. """
+        # ARGUMENT query -> tuple that identifies the query
+        # ARGUMENT make -> function of no arguments returning the response
+
+        # RETURN tuple ( str content type, bytes body )
+
+        with self.memo_lock:
+            if query in self.memo:
+                self.memo.move_to_end( query )
+                return self.memo[ query ]
+
+        response = make( )
+
+        with self.memo_lock:
+            self.memo[ query ] = response
+
+            while len( self.memo ) > MEMO_SIZE:
+                self.memo.popitem( last = False )
+
+        return response
+
+class Data_Store( ):
+    """ This object keeps the current snapshot of the datasets and replaces it when
+    the files change. """
+
+    def __init__( self, paths = None, reloadInterval = RELOAD_INTERVAL ):
+        """ Initializes the object and loads the datasets. """
+        # ARGUMENT paths -> dict { str dataset name : str path }; DEFAULT DEFAULT_PATHS
+        # ARGUMENT reloadInterval -> float seconds between checks of the files; DEFAULT
+
+        self.paths = dict( DEFAULT_PATHS, **( paths or { } ))
+        self.reload_interval = reloadInterval
+        self.reload_lock = threading.Lock( )
+        self.stopped = threading.Event( )
+
+        print( 'Loading the datasets...', end = ' ' )
+        self.data = Resident_Data( self.paths )  # the current Resident_Data( ) object
+        print( 'YES' )
+
+        return
+
+    def reload_if_changed( self ):
+        """ Loads the datasets again if any file has changed since the current
+        snapshot was loaded. """
+
+        # RETURN bool whether the snapshot was replaced
+
+        with self.reload_lock:
+
+            try:
+                if dataset_signatures( self.paths ) == self.data.signatures:
+                    return False
+
+                data = Resident_Data( self.paths )
+
+            except ( OSError, IndexError, ValueError ) as error:
+
+                # e.g. a file is being replaced; try again at the next check
+                print( f'Reloading the datasets failed ({error})' )
+
+                return False
+
+            # the queries being answered keep the snapshot they started with
+            self.data = data
+
+        print( 'Reloaded the datasets' )
+
+        return True
+
+    def watch( self ):
+        """ Checks the files until the store is stopped (run in a thread). """
+
+        while not self.stopped.wait( self.reload_interval ):
+            self.reload_if_changed( )
+
+        return
+
+class Query_Handler( BaseHTTPRequestHandler ):
+    """ This object answers one HTTP request for a table. """
+
+    def do_GET( self ):
+        """ Answers a GET request. """
+
+        url = urllib.parse.urlsplit( self.path )
+        params = urllib.parse.parse_qs( url.query, keep_blank_values = True )
+
+        data = self.server.store.data
+        query = ( url.path, tuple( sorted( ( k, tuple( v )) for k, v in params.items( ))))
+
+        try:
+            if url.path == '/counties':
+                make = lambda : respond_counties( data, params )
+            elif url.path == '/census':
+                make = lambda : respond_census( data, params )
+            elif url.path == '/states':
+                make = lambda : respond_states( data, params )
+            else:
+                self.send_error( 404, 'use /counties, /census or /states' )
+                return
+
+            ( contentType, body ) = data.respond( query, make )
+
+        except ValueError as error:
+            self.send_error( 400, str( error ))
+            return
+
+        self.send_response( 200 )
+        self.send_header( 'Content-Type', contentType )
+        self.send_header( 'Content-Length', str( len( body )))
+        self.end_headers( )
+        self.wfile.write( body )
+
+        return
+
+def serve_queries( host = '127.0.0.1', port = 8000, paths = None,
+                    reloadInterval = RELOAD_INTERVAL ):
+    """ This function loads the datasets and answers queries until interrupted. """
+    # ARGUMENT host -> str address to listen on; DEFAULT
+    # ARGUMENT port -> int port to listen on; DEFAULT
+    # ARGUMENT paths -> dict { str dataset name : str path }; DEFAULT DEFAULT_PATHS
+    # ARGUMENT reloadInterval -> float seconds between checks of the files; DEFAULT
+
+    # RETURN nothing
+
+    store = Data_Store( paths, reloadInterval )
+
+    server = ThreadingHTTPServer( ( host, port ), Query_Handler )
+    server.daemon_threads = True
+    server.store = store
+
+    watcher = threading.Thread( target = store.watch, daemon = True )
+    watcher.start( )
+
+    print( f'Serving the tables at http://{host}:{server.server_port}/' )
+
+    try:
+        server.serve_forever( )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.stopped.set( )
+        server.server_close( )
+
+    return
+
+def respond_counties( data, params ):
+    """ This function makes the cases and deaths tables of a query. """
+    # ARGUMENT data -> Resident_Data( ) object
+    # ARGUMENT params -> dict { str name : list of str values } of the query
+
+    # RETURN tuple ( str content type, bytes body )
+
+    countyCriteria = county_criteria_from( params )
+    fill = params.get( 'fill', [ 'zero' ] )[ -1 ]
+
+    if fill not in ( 'zero', 'forward' ):
+        raise ValueError( f'fill must be zero or forward, not {fill!r}' )
+
+    ( dates, counties, cases, deaths ) = data.county_table( countyCriteria,
+                                                            fill == 'forward' )
+
+    if is_json( params ):
+        return json_response( { 'dates' : dates,
+                                'counties' : [ list( county ) for county in counties ],
+                                'cases' : [ [ None if count == MISSING else count
+                                                for count in row ] for row in cases ],
+                                'deaths' : [ [ None if count == MISSING else count
+                                                for count in row ] for row in deaths ] } )
+
+    return tsv_response( format_county_tables( dates, counties, cases, deaths ))
+
+def respond_census( data, params ):
+    """ This function makes the population table of a query. """
+    # ARGUMENT data -> Resident_Data( ) object
+    # ARGUMENT params -> dict { str name : list of str values } of the query
+
+    # RETURN tuple ( str content type, bytes body )
+
+    countyCriteria = county_criteria_from( params )
+    unique = params.get( 'unique', [ '' ] )[ -1 ] not in ( '', '0', 'false' )
+
+    lines = format_census_table( countyCriteria, data.census_records( countyCriteria ),
+                                    unique )
+
+    if is_json( params ):
+        return json_response( [ { 'state' : state, 'county' : county,
+                                    'population' : int( population ) }
+                                for ( state, county, population )
+                                in ( line.split( '\t' ) for line in lines[ 1 : ] ) ] )
+
+    return tsv_response( lines )
+
+def respond_states( data, params ):
+    """ This function makes the USA and states table of a query. """
+    # ARGUMENT data -> Resident_Data( ) object
+    # ARGUMENT params -> dict { str name : list of str values } of the query
+
+    # RETURN tuple ( str content type, bytes body )
+
+    # without a state, the table has only the USA columns
+    statesCriteria = params.get( 'state', [ ] )
+
+    table = data.state_table( statesCriteria )
+
+    if is_json( params ):
+
+        dates = sorted( table.dates | set( data.us_dct ))
+
+        # one list of values by date for each field of the USA and each state
+        series = { 'USA' : { f : [ data.us_dct.get( date, { } ).get( f ) or None
+                                    for date in dates ] for f in STATE_FIELDS } }
+
+        for state in sorted( table.states ):
+            series[ state ] = { f : [ table.states_dct.get( ( date, state ),
+                                                            { } ).get( f ) or None
+                                        for date in dates ] for f in STATE_FIELDS }
+
+        return json_response( { 'dates' : dates, 'series' : series } )
+
+    return tsv_response( format_state_table( statesCriteria, data.us_dct, table ))
+
+def county_criteria_from( params ):
+    """ This function reads the ( State, County ) criteria of a query. """
+    # ARGUMENT params -> dict { str name : list of str values } of the query
+
+    # RETURN list of tuples ( str State, str County ); a blank part is None
+
+    criteria = [ ]
+
+    for criterion in params.get( 'criterion', [ ] ):
+
+        ( state, sep, county ) = criterion.partition( ':' )
+        criteria.append( ( state.strip( ) or None, county.strip( ) or None ))
+
+    if not criteria:
+        raise ValueError( 'give at least one criterion=State:County' )
+
+    return criteria
+
+def is_json( params ):
+    """ This function tells whether a query asks for JSON. """
+    # ARGUMENT params -> dict { str name : list of str values } of the query
+
+    # RETURN bool
+
+    answer = params.get( 'format', [ 'tsv' ] )[ -1 ]
+
+    if answer not in ( 'tsv', 'json' ):
+        raise ValueError( f'format must be tsv or json, not {answer!r}' )
+
+    return answer == 'json'
+
+def tsv_response( lines ):
+    """ This function makes a tab-delimited response from lines of text, as they
+    would be written to a file. """
+    # ARGUMENT lines -> list of str text
+
+    # RETURN tuple ( str content type, bytes body )
+
+    return ( 'text/tab-separated-values; charset=utf-8',
+            ( '\n'.join( lines ) + '\n' ).encode( ))
+
+def json_response( value ):
+    """ This function makes a JSON response. """
+    # ARGUMENT value -> object that can be converted to JSON
+
+    # RETURN tuple ( str content type, bytes body )
+
+    return ( 'application/json', json.dumps( value ).encode( ))
+
+def dataset_signatures( paths ):
+    """ This function gives the size and modification time of each dataset file
+    (or the compressed copy of it that is read), which change whenever the update
+    script rewrites the file. """
+    # ARGUMENT paths -> dict { str dataset name : str path }
+
+    # RETURN dict { str dataset name : tuple ( str path read, int size, 
+    #   int mtime in ns ) }
+
+    signatures = { }
+
+    for name, path in paths.items( ):
+        path = find_data_file( path )
+        stats = os.stat( path )
+        signatures[ name ] = ( path, stats.st_size, stats.st_mtime_ns )
+
+    return signatures
+
+if __name__ == '__main__':
+    main( )
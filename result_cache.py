@@ -0,0 +1,273 @@
+# result_cache
+""" This module keeps the tables made by the parsing script in a content-addressed
+cache, so that a table already made for the same criteria from the same source
+files is read back instead of being made again.
+
+Each table is a text file in the cache directory (covid_data/result_cache/ by
+default, next to the datasets) named after the SHA-256 hash of what it was made
+from: the function that made it, the size and modification time of its module and
+of every module of the package that module imports (directly or not), the
+normalized criteria, any options, and the size and modification time of each
+source file. A table is never looked up under a stale key, so nothing has to be
+invalidated; the cache is simply kept under a size limit by deleting the least
+recently used tables. """
+import hashlib
+import inspect
+import json
+import os
+import sys
+import tempfile
+
+from compressed_files import find_data_file
+
+DEFAULT_MAX_BYTES = 256 << 20   # int bytes kept in the cache before evicting
+SUFFIX = '.tsv'                 # str file name extension of the cached tables
+
+class Result_Cache( ):
+    """ This object reads and writes the tables in a cache directory. """
+
+    def __init__( self, path = 'covid_data/result_cache', maxBytes = DEFAULT_MAX_BYTES,
+                    bypass = False ):
+        """ Initializes the object. """
+        # ARGUMENT path -> str path of the cache directory; DEFAULT
+        # ARGUMENT maxBytes -> int size limit of the cache; DEFAULT
+        # ARGUMENT bypass -> bool neither read nor write the cache; DEFAULT
+
+        self.path = path
+        self.max_bytes = maxBytes
+        self.bypass = bypass
+
+        return
+
+    def key( self, function, criteria, sourcePaths, options = None, ordered = True ):
+        """ Gives the key of a table. """
+        # ARGUMENT function -> function that makes the table
+        # ARGUMENT criteria -> list of criteria, each a str or a tuple of str
+        # ARGUMENT sourcePaths -> list of str paths of the files the table is made from
+        # ARGUMENT options -> dict of other arguments that change the table; DEFAULT
+        # ARGUMENT ordered -> bool the order of the criteria changes the table; DEFAULT
+
+        # RETURN str hexadecimal SHA-256 hash
+
+        identity = { 'function' : f'{function.__module__}.{function.__qualname__}',
+                    'code' : [ file_signature( path )
+                                for path in code_paths( function ) ],
+                    'criteria' : normalize_criteria( criteria, ordered ),
+                    'options' : options or { },
+                    'sources' : [ [ path, file_signature( path ) ]
+                                    for path in sourcePaths ] }
+
+        text = json.dumps( identity, sort_keys = True )
+
+        return hashlib.sha256( text.encode( )).hexdigest( )
+
+    def get( self, key ):
+        """ Reads a table from the cache and marks it as recently used. """
+        # ARGUMENT key -> str key of the table
+
+        # RETURN list of str lines, or None if the table isn't cached
+
+        path = f'{self.path}/{key}{SUFFIX}'
+
+        try:
+            with open( path ) as fileIn:
+                text = fileIn.read( )
+
+            os.utime( path )
+
+        except FileNotFoundError:
+            return None
+
+        # every line ends with a newline, so the last piece is empty
+        return text.split( '\n' )[ : -1 ]
+
+    def put( self, key, lines ):
+        """ Writes a table to the cache and evicts old tables if the cache is full. """
+        # ARGUMENT key -> str key of the table
+        # ARGUMENT lines -> list of str lines
+
+        # RETURN nothing
+
+        os.makedirs( self.path, exist_ok = True )
+
+        # write under a temporary name, so a table is never read half written
+        ( handle, tempPath ) = tempfile.mkstemp( dir = self.path, suffix = '.tmp' )
+
+        try:
+            with os.fdopen( handle, 'w' ) as fileOut:
+                fileOut.write( ''.join( f'{line}\n' for line in lines ))
+
+            os.replace( tempPath, f'{self.path}/{key}{SUFFIX}' )
+
+        except BaseException:
+            os.remove( tempPath )
+            raise
+
+        self.evict( )
+
+        return
+
+    def lines( self, function, criteria, sourcePaths, make, options = None,
+                ordered = True ):
+        """ Gives a table from the cache, or makes it and adds it to the cache. """
+        # ARGUMENT function -> function that makes the table
+        # ARGUMENT criteria -> list of criteria, each a str or a tuple of str
+        # ARGUMENT sourcePaths -> list of str paths of the files the table is made from
+        # ARGUMENT make -> function of no arguments that makes the table
+        # ARGUMENT options -> dict of other arguments that change the table; DEFAULT
+        # ARGUMENT ordered -> bool the order of the criteria changes the table; DEFAULT
+
+        # RETURN tuple ( list of str lines, bool whether they came from the cache )
+
+        if self.bypass:
+            return ( make( ), False )
+
+        key = self.key( function, criteria, sourcePaths, options, ordered )
+        lines = self.get( key )
+
+        if lines is not None:
+            return ( lines, True )
+
+        lines = make( )
+        self.put( key, lines )
+
+        return ( lines, False )
+
+    def entries( self ):
+        """ Lists the tables in the cache. """
+
+        # RETURN list of tuples ( float last use, int bytes, str path ), oldest first
+
+        entries = [ ]
+
+        try:
+            names = os.listdir( self.path )
+        except FileNotFoundError:
+            return entries
+
+        for name in names:
+
+            if not name.endswith( SUFFIX ):
+                continue
+
+            path = f'{self.path}/{name}'
+
+            try:
+                stats = os.stat( path )
+            except FileNotFoundError:
+                continue
+
+            entries.append( ( stats.st_mtime, stats.st_size, path ))
+
+        return sorted( entries )
+
+    def evict( self ):
+        """ Deletes the least recently used tables until the cache is under its
+        size limit. """
+
+        # RETURN int number of tables deleted
+
+        entries = self.entries( )
+        total = sum( size for ( used, size, path ) in entries )
+        deleted = 0
+
+        for ( used, size, path ) in entries:
+
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove( path )
+            except FileNotFoundError:
+                pass
+
+            total -= size
+            deleted += 1
+
+        return deleted
+
+    def clear( self ):
+        """ Deletes every table in the cache. """
+
+        # RETURN int number of tables deleted
+
+        entries = self.entries( )
+
+        for ( used, size, path ) in entries:
+            try:
+                os.remove( path )
+            except FileNotFoundError:
+                pass
+
+        return len( entries )
+
+def normalize_criteria( criteria, ordered = True ):
+    """ This function puts criteria in one form, so that criteria that select the
+    same lines have the same key: a blank is None and, unless the order matters, 
+    duplicates are dropped and the rest sorted. """
+    # ARGUMENT criteria -> list of criteria, each a str or a tuple of str
+    # ARGUMENT ordered -> bool the order of the criteria changes the table; DEFAULT
+
+    # RETURN list of lists of str or None
+
+    normalized = [ [ part or None
+                    for part in ( criterion if isinstance( criterion, ( tuple, list ))
+                                    else ( criterion, )) ]
+                    for criterion in criteria ]
+
+    if not ordered:
+        unique = { json.dumps( criterion ) : criterion for criterion in normalized }
+        normalized = [ unique[ k ] for k in sorted( unique ) ]
+
+    return normalized
+
+def file_signature( path ):
+    """ This function gives the size and modification time of a file, or of the
+    compressed copy of it that would be read instead. """
+    # ARGUMENT path -> str path of the file
+
+    # RETURN list [ str path read, int size, int mtime in ns ] (or None if there 
+    #   is no file)
+
+    path = find_data_file( path )
+
+    try:
+        stats = os.stat( path )
+    except FileNotFoundError:
+        return None
+
+    return [ path, stats.st_size, stats.st_mtime_ns ]
+
+def code_paths( function ):
+    """ This function lists the files of the code a table depends on: the module of
+    the function that makes it and the modules next to it that it imports, directly
+    or through each other. """
+    # ARGUMENT function -> function that makes the table
+
+    # RETURN list of str paths, sorted
+
+    folder = os.path.dirname( os.path.abspath( inspect.getfile( function )))
+    modules = [ sys.modules[ function.__module__ ] ]
+    paths = set( )
+
+    while modules:
+
+        module = modules.pop( )
+        path = getattr( module, '__file__', None )
+
+        # only the modules of this package, each once
+        if ( not path or os.path.dirname( os.path.abspath( path )) != folder
+            or path in paths ):
+            continue
+
+        paths.add( path )
+
+        # a name imported from a module leads back to that module
+        for value in vars( module ).values( ):
+
+            other = inspect.getmodule( value )
+
+            if other is not None:
+                modules.append( other )
+
+    return sorted( paths )
@@ -0,0 +1,360 @@
+# rollup_cube
+""" This module rolls the NY Times counties table up into the cases, deaths and
+populations of each date at five levels: county, state, Census division, Census
+region and the whole USA, so that a question about a state or a region reads a
+few hundred lines instead of adding up millions of county lines each time.
+
+The cube is a directory next to the table (e.g. covid_data/nyt_us_counties.rollup/)
+with one tab-delimited table per level (county.txt, state.txt, division.txt,
+region.txt and usa.txt) and the date index of each (see date_index.py). Every
+level has the same columns:
+
+    date  region  division  state  county  code  cases  deaths  population
+
+where code is the FIPS code of a county or state or the Census code of a division
+or region, and the columns below the level of a line are blank. The county lines
+are the NY Times lines with their place and population, joined with the Census on
+the FIPS code of the line (or on the name of a county without one); the lines of
+the other levels are ordered by date and then by name (states) or code (divisions
+and regions). The populations of the higher levels are those of the Census lines of
+their states, not sums of the counties that have a NY Times line.
+
+The cube is built in one pass over the NY Times table: the county lines are
+written as they are read, and the other levels are summed in memory, which only
+holds a line per date and area. A blank count is left out of the sums. The states
+and territories that aren't in the Census (e.g. Puerto Rico) have no division or
+region, so they are only counted in the USA.
+
+Like the columnar cache, the cube records the size and modification time of the
+NY Times and Census tables it was built from and is ignored once either changes. """
+import json
+import os
+
+from columnar_cache import ( MISSING, format_count, format_field, parse_count,
+                                source_signature )
+from compressed_files import find_data_file, open_data_file, strip_compression
+from date_index import in_date_range, load_date_index, write_date_index
+from geography import ( DIVISION_NAMES, REGION_NAMES, STATE_FIPS, fips_code,
+                        load_geography )
+
+CUBE_VERSION = 2    # int bumped whenever the layout of the cube changes
+
+# levels of the cube, from the smallest areas up
+ROLLUP_LEVELS = [ 'county', 'state', 'division', 'region', 'usa' ]
+
+# columns of the table of each level
+ROLLUP_FIELDS = [ 'date', 'region', 'division', 'state', 'county', 'code', 'cases',
+                    'deaths', 'population' ]
+
+class Rollup_Cube( ):
+    """ This object reads the tables of the levels of a cube. """
+
+    def __init__( self, cubePath, meta ):
+        """ Initializes the object. """
+        # ARGUMENT cubePath -> str path of the cube directory
+        # ARGUMENT meta -> dict of the metadata of the cube
+
+        self.path = cubePath
+        self.meta = meta
+
+        return
+
+    def level_path( self, level ):
+        """ Gives the path of the table of a level. """
+        # ARGUMENT level -> str level (see ROLLUP_LEVELS)
+
+        # RETURN str path
+
+        return f'{self.path}/{level}.txt'
+
+    def lines( self, level, startDate = None, endDate = None ):
+        """ Generates the header line of the table of a level and then the lines of
+        a range of dates, read from the byte ranges of its date index. """
+        # ARGUMENT level -> str level (see ROLLUP_LEVELS)
+        # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+        # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+
+        # YIELD str tab-delimited data, without the line break
+
+        path = self.level_path( level )
+        dateIndex = load_date_index( path )
+
+        if dateIndex:
+            for line in dateIndex.read_lines( startDate, endDate ):
+                yield line.rstrip( '\n' )
+
+            return
+
+        # without its index, the table is read through
+        with open( path ) as fileIn:
+
+            yield next( fileIn, '' ).rstrip( '\n' )
+
+            for line in fileIn:
+                if in_date_range( line[ : line.find( '\t' ) ], startDate, endDate ):
+                    yield line.rstrip( '\n' )
+
+        return
+
+class Rollup( ):
+    """ This object sums NY Times county lines into the higher levels of the cube,
+    one line at a time. """
+
+    def __init__( self, geography ):
+        """ Initializes the object. """
+        # ARGUMENT geography -> geography.Geography( ) object of the Census
+
+        self.geography = geography
+
+        # sums of the higher levels { str level : dict { tuple ( str date, area key ) :
+        #   list [ int cases, int deaths ] }}; an area key is the state name or the
+        #   division or region code (0 for the USA)
+        self.totals = { level : { } for level in ROLLUP_LEVELS[ 1 : ] }
+
+        # place fields of each area { tuple ( str level, area key ) : list of str
+        #   region, division, state, county, code and population }, and of each
+        #   county (see county_area( ))
+        self.areas = { }
+        self.county_areas = { }
+
+        # int populations of the divisions, regions and USA, from their states
+        self.populations = { }
+
+        for fips, county in geography.counties.items( ):
+
+            if fips % 1000 or county[ 'population' ] is None:
+                continue
+
+            for key in ( ( 'division', county[ 'division' ] ),
+                            ( 'region', county[ 'region' ] ), ( 'usa', 0 )):
+                self.populations[ key ] = ( self.populations.get( key, 0 )
+                                            + county[ 'population' ] )
+
+        return
+
+    def add( self, date, state, county, fips, cases, deaths ):
+        """ Adds a NY Times county line to the sums of its state, division, region
+        and the USA, and gives its line of the county level. """
+        # ARGUMENT date -> str date as YYYY-MM-DD
+        # ARGUMENT state -> str State
+        # ARGUMENT county -> str County
+        # ARGUMENT fips -> str FIPS code of the county, or '' for none
+        # ARGUMENT cases -> int cumulative cases, or MISSING
+        # ARGUMENT deaths -> int cumulative deaths, or MISSING
+
+        # RETURN str tab-delimited data of the county level
+
+        if ( state, county, fips ) not in self.county_areas:
+            self.county_areas[ ( state, county, fips ) ] = self.county_area( state, county,
+                                                                            fips )
+
+        area = self.county_areas[ ( state, county, fips ) ]
+        counts = ( 0 if cases == MISSING else cases, 0 if deaths == MISSING else deaths )
+
+        for level, key in area[ 'keys' ]:
+
+            total = self.totals[ level ].get( ( date, key ))
+
+            if total is None:
+                total = self.totals[ level ][ ( date, key ) ] = [ 0, 0 ]
+
+            total[ 0 ] += counts[ 0 ]
+            total[ 1 ] += counts[ 1 ]
+
+        return '\t'.join( [ date, *area[ 'fields' ], format_count( cases ),
+                            format_count( deaths ), area[ 'population' ] ] )
+
+    def county_area( self, state, county, fips ):
+        """ Looks up the place of a county and the areas above it, and notes the
+        place fields of those areas. The county is joined with the Census on its
+        FIPS code, or on its name for a line without one. """
+        # ARGUMENT state -> str State
+        # ARGUMENT county -> str County
+        # ARGUMENT fips -> str FIPS code of the county, or '' for none
+
+        # RETURN dict { 'fields' : list of str place fields, 'population' : str,
+        #   'keys' : list of tuples ( str level, area key ) }
+
+        fips = fips_code( fips )
+        
+        if fips is None:
+            fips = self.geography.county_fips( state, county )
+        record = self.geography.state( state ) or { }
+        region = record.get( 'region' )
+        division = record.get( 'division' )
+
+        regionName = REGION_NAMES.get( region, '' )
+        divisionName = DIVISION_NAMES.get( division, '' )
+        stateCode = f'{STATE_FIPS[ state ]:02d}' if state in STATE_FIPS else ''
+
+        keys = [ ( 'state', state ), ( 'usa', 0 ) ]
+
+        self.areas[ ( 'state', state ) ] = [ regionName, divisionName, state, '',
+                                            stateCode, format_field(
+                                            record.get( 'population' )) ]
+        self.areas[ ( 'usa', 0 ) ] = [ '', '', '', '', '',
+                                        format_field( self.populations.get( ( 'usa', 0 ))) ]
+
+        # a state outside the Census isn't in a division or region
+        if division:
+            keys.append( ( 'division', division ))
+            self.areas[ ( 'division', division ) ] = [ regionName, divisionName, '', '',
+                                            str( division ), format_field(
+                                            self.populations.get( ( 'division', division ))) ]
+
+        if region:
+            keys.append( ( 'region', region ))
+            self.areas[ ( 'region', region ) ] = [ regionName, '', '', '', str( region ),
+                                            format_field(
+                                            self.populations.get( ( 'region', region ))) ]
+
+        return { 'fields' : [ regionName, divisionName, state, county,
+                                '' if fips is None else f'{fips:05d}' ],
+                'population' : format_field( self.geography.population( fips )),
+                'keys' : keys }
+
+    def lines( self, level ):
+        """ Generates the lines of a higher level, ordered by date and area. """
+        # ARGUMENT level -> str level (see ROLLUP_LEVELS), other than 'county'
+
+        # YIELD str tab-delimited data
+
+        for ( date, key ), ( cases, deaths ) in sorted( self.totals[ level ].items( )):
+
+            ( *fields, population ) = self.areas[ ( level, key ) ]
+
+            yield '\t'.join( [ date, *fields, str( cases ), str( deaths ), population ] )
+
+        return
+
+def cube_path_for( path ):
+    """ This function gives the path of the cube directory for a table. """
+    # ARGUMENT path -> str path of the NY Times counties table
+
+    # RETURN str path of the cube directory
+
+    return f'{os.path.splitext( strip_compression( path ))[ 0 ]}.rollup'
+
+def cube_signature( path, censusPath ):
+    """ This function gives the sizes and modification times of the NY Times and
+    Census tables, which are used to tell whether a cube is still current. """
+    # ARGUMENT path -> str path of the NY Times counties table (as found)
+    # ARGUMENT censusPath -> str path of the US Census counties table (as found)
+
+    # RETURN dict { str : dict { str : int }}
+
+    return { 'source' : source_signature( path ),
+                'census' : source_signature( censusPath ) }
+
+def load_rollup_cube( path, censusPath ):
+    """ This function opens the cube of a table if it exists and is newer than the
+    table and the Census table; otherwise, there is no cube to use. """
+    # ARGUMENT path -> str path of the NY Times counties table
+    # ARGUMENT censusPath -> str path of the US Census counties table
+
+    # RETURN Rollup_Cube( ) object or None
+
+    cubePath = cube_path_for( path )
+
+    try:
+        with open( f'{cubePath}/meta.json' ) as fileIn:
+            meta = json.load( fileIn )
+
+        current = cube_signature( find_data_file( path ), find_data_file( censusPath ))
+
+    except ( OSError, ValueError ):
+        return None
+
+    # the cube is stale if either table has changed since it was built
+    if ( meta.get( 'version' ) != CUBE_VERSION
+        or any( meta.get( k ) != v for k, v in current.items( ) )):
+        return None
+
+    return Rollup_Cube( cubePath, meta )
+
+def write_rollup_cube( path, censusPath ):
+    """ This function builds the cube of a NY Times counties table in one pass over
+    the table. """
+    # ARGUMENT path -> str path of the NY Times counties table
+    # ARGUMENT censusPath -> str path of the US Census counties table
+
+    # RETURN str path of the cube directory
+
+    cubePath = cube_path_for( path )
+    path = find_data_file( path )
+    censusPath = find_data_file( censusPath )
+    os.makedirs( cubePath, exist_ok = True )
+
+    # remove the metadata first, so a partly written cube is never used
+    try:
+        os.remove( f'{cubePath}/meta.json' )
+    except FileNotFoundError:
+        pass
+
+    signature = cube_signature( path, censusPath )
+    rollup = Rollup( load_geography( censusPath ))
+    rows = { }  # dict { str level : int lines }
+
+    def write_level( level, lines ):
+        """ This subroutine writes the table of a level under a temporary name,
+        moves it into place and indexes its dates. """
+        # ARGUMENT level -> str level
+        # ARGUMENT lines -> iterable of str tab-delimited data
+
+        # RETURN nothing
+
+        levelPath = f'{cubePath}/{level}.txt'
+        rows[ level ] = 0
+
+        with open( f'{levelPath}.tmp', 'w' ) as fileOut:
+
+            fileOut.write( '\t'.join( ROLLUP_FIELDS ) + '\n' )
+
+            for line in lines:
+                fileOut.write( line + '\n' )
+                rows[ level ] += 1
+
+        os.replace( f'{levelPath}.tmp', levelPath )
+        write_date_index( levelPath )
+
+        return
+
+    def county_lines( ):
+        """ This subroutine reads the NY Times lines into the sums and yields the
+        lines of the county level. """
+
+        # YIELD str tab-delimited data
+
+        with open_data_file( path ) as fileIn:
+
+            next( fileIn, None )    # skip the header line
+
+            # {'date': 0, 'county': 1, 'state': 2, 'fips': 3, 'cases': 4, 'deaths': 5}
+            for line in fileIn:
+
+                line = line.rstrip( '\n' )
+
+                if not line:
+                    continue
+
+                fields = line.split( '\t' )
+
+                yield rollup.add( fields[ 0 ], fields[ 2 ], fields[ 1 ], fields[ 3 ],
+                                    parse_count( fields[ 4 ] ), parse_count( fields[ 5 ] ))
+
+        return
+
+    # the county lines are written as they are read, and then the sums
+    write_level( 'county', county_lines( ))
+
+    for level in ROLLUP_LEVELS[ 1 : ]:
+        write_level( level, rollup.lines( level ))
+
+    meta = { 'version' : CUBE_VERSION, **signature, 'rows' : rows }
+
+    with open( f'{cubePath}/meta.json.tmp', 'w' ) as fileOut:
+        json.dump( meta, fileOut )
+
+    os.replace( f'{cubePath}/meta.json.tmp', f'{cubePath}/meta.json' )
+
+    return cubePath
@@ -0,0 +1,516 @@
+# sqlite_store
+""" This module keeps the tab-delimited tables in a local SQLite database as an
+optional store that the parsing script can query instead of scanning the tables.
+
+Each table is loaded into a table of the same name with typed columns (counts as
+integers, shares as reals and dates as YYYY-MM-DD text, so The Atlantic dates
+match the NY Times ones), a primary key on what identifies a line, e.g. ( state,
+county, date ) for the NY Times counties, and indexes on fips and date. The lines
+are upserted: a new line is inserted and a line whose key is already there is
+updated only if its values changed, so reloading a table that upstream has only
+appended to writes just the new lines. A line whose key is no longer in the table
+(upstream removed it) is deleted in the same transaction. The size and
+modification time of each table are kept in the database, and a table that hasn't
+changed since it was loaded isn't read again.
+
+The query functions take the same ( State, County ) criteria as the parsing
+script and turn them into indexed lookups, so a single county is read from the
+index instead of from a scan of the whole table. They yield the lines in an
+explicit order (ORDER BY), e.g. the NY Times counties by date, state and county
+as in the table, rather than in whatever order the index SQLite picks gives. """
+import os
+import sqlite3
+
+from compressed_files import find_data_file, open_data_file
+from geography import normalize_county_name
+
+# the tables of the database
+# dict { str table name : dict { 'columns' : list of tuples ( str column name,
+#   str type, str field of the tab-delimited table ), 'key' : list of str columns,
+#   'indexes' : list of lists of str columns }}
+# The types are SQLite types, except DATE, which is TEXT as YYYY-MM-DD. A column
+# without a field (None) is computed when the line is loaded (see convert_line( )).
+SCHEMAS = { 'nyt_us_counties' : { 'columns' : [ ( 'date', 'DATE', 'date' ),
+                                            ( 'state', 'TEXT', 'state' ),
+                                            ( 'county', 'TEXT', 'county' ),
+                                            ( 'fips', 'INTEGER', 'fips' ),
+                                            ( 'cases', 'INTEGER', 'cases' ),
+                                            ( 'deaths', 'INTEGER', 'deaths' ) ],
+                                'key' : [ 'state', 'county', 'date' ],
+                                'indexes' : [ [ 'fips' ], [ 'date' ] ] },
+            'nyt_us_states' : { 'columns' : [ ( 'date', 'DATE', 'date' ),
+                                            ( 'state', 'TEXT', 'state' ),
+                                            ( 'fips', 'INTEGER', 'fips' ),
+                                            ( 'cases', 'INTEGER', 'cases' ),
+                                            ( 'deaths', 'INTEGER', 'deaths' ) ],
+                                'key' : [ 'state', 'date' ],
+                                'indexes' : [ [ 'fips' ], [ 'date' ] ] },
+            'nyt_us' : { 'columns' : [ ( 'date', 'DATE', 'date' ),
+                                        ( 'cases', 'INTEGER', 'cases' ),
+                                        ( 'deaths', 'INTEGER', 'deaths' ) ],
+                        'key' : [ 'date' ],
+                        'indexes' : [ ] },
+            'nyt_mask_use' : { 'columns' : [ ( 'fips', 'INTEGER', 'COUNTYFP' ),
+                                            ( 'never', 'REAL', 'NEVER' ),
+                                            ( 'rarely', 'REAL', 'RARELY' ),
+                                            ( 'sometimes', 'REAL', 'SOMETIMES' ),
+                                            ( 'frequently', 'REAL', 'FREQUENTLY' ),
+                                            ( 'always', 'REAL', 'ALWAYS' ) ],
+                                'key' : [ 'fips' ],
+                                'indexes' : [ ] },
+            'nyt_excess_deaths' : { 'columns' : [ ( 'country', 'TEXT', 'country' ),
+                                            ( 'placename', 'TEXT', 'placename' ),
+                                            ( 'frequency', 'TEXT', 'frequency' ),
+                                            ( 'start_date', 'DATE', 'start_date' ),
+                                            ( 'end_date', 'DATE', 'end_date' ),
+                                            ( 'year', 'INTEGER', 'year' ),
+                                            ( 'month', 'INTEGER', 'month' ),
+                                            ( 'week', 'INTEGER', 'week' ),
+                                            ( 'deaths', 'INTEGER', 'deaths' ),
+                                            ( 'expected_deaths', 'INTEGER',
+                                                'expected_deaths' ),
+                                            ( 'excess_deaths', 'INTEGER',
+                                                'excess_deaths' ),
+                                            ( 'baseline_excess_deaths', 'INTEGER',
+                                                'baseline_excess_deaths' ) ],
+                                'key' : [ 'country', 'placename', 'frequency',
+                                            'start_date' ],
+                                'indexes' : [ [ 'start_date' ] ] },
+            'atl_historic_us' : { 'columns' : [ ( 'date', 'DATE', 'date' ),
+                                            ( 'states', 'INTEGER', 'states' ),
+                                            ( 'positive', 'INTEGER', 'positive' ),
+                                            ( 'negative', 'INTEGER', 'negative' ),
+                                            ( 'hospitalized_currently', 'INTEGER',
+                                                'hospitalizedCurrently' ),
+                                            ( 'hospitalized_cumulative', 'INTEGER',
+                                                'hospitalizedCumulative' ),
+                                            ( 'icu_currently', 'INTEGER',
+                                                'inIcuCurrently' ),
+                                            ( 'icu_cumulative', 'INTEGER',
+                                                'inIcuCumulative' ),
+                                            ( 'ventilator_currently', 'INTEGER',
+                                                'onVentilatorCurrently' ),
+                                            ( 'ventilator_cumulative', 'INTEGER',
+                                                'onVentilatorCumulative' ),
+                                            ( 'recovered', 'INTEGER', 'recovered' ),
+                                            ( 'death', 'INTEGER', 'death' ),
+                                            ( 'total_test_results', 'INTEGER',
+                                                'totalTestResults' ),
+                                            ( 'positive_increase', 'INTEGER',
+                                                'positiveIncrease' ),
+                                            ( 'death_increase', 'INTEGER',
+                                                'deathIncrease' ) ],
+                                'key' : [ 'date' ],
+                                'indexes' : [ ] },
+            'atl_historic_states' : { 'columns' : [ ( 'date', 'DATE', 'date' ),
+                                            ( 'state', 'TEXT', 'state' ),
+                                            ( 'fips', 'INTEGER', 'fips' ),
+                                            ( 'positive', 'INTEGER', 'positive' ),
+                                            ( 'negative', 'INTEGER', 'negative' ),
+                                            ( 'hospitalized_currently', 'INTEGER',
+                                                'hospitalizedCurrently' ),
+                                            ( 'hospitalized_cumulative', 'INTEGER',
+                                                'hospitalizedCumulative' ),
+                                            ( 'icu_currently', 'INTEGER',
+                                                'inIcuCurrently' ),
+                                            ( 'icu_cumulative', 'INTEGER',
+                                                'inIcuCumulative' ),
+                                            ( 'ventilator_currently', 'INTEGER',
+                                                'onVentilatorCurrently' ),
+                                            ( 'ventilator_cumulative', 'INTEGER',
+                                                'onVentilatorCumulative' ),
+                                            ( 'recovered', 'INTEGER', 'recovered' ),
+                                            ( 'death', 'INTEGER', 'death' ),
+                                            ( 'total_test_results', 'INTEGER',
+                                                'totalTestResults' ),
+                                            ( 'positive_increase', 'INTEGER',
+                                                'positiveIncrease' ),
+                                            ( 'death_increase', 'INTEGER',
+                                                'deathIncrease' ),
+                                            ( 'data_quality_grade', 'TEXT',
+                                                'dataQualityGrade' ) ],
+                                'key' : [ 'state', 'date' ],
+                                'indexes' : [ [ 'fips' ], [ 'date' ] ] },
+            'usc_counties_2019' : { 'columns' : [ ( 'line', 'INTEGER', None ),
+                                            ( 'sumlev', 'INTEGER', 'SUMLEV' ),
+                                            ( 'region', 'INTEGER', 'REGION' ),
+                                            ( 'division', 'INTEGER', 'DIVISION' ),
+                                            ( 'state_fips', 'INTEGER', 'STATE' ),
+                                            ( 'county_fips', 'INTEGER', 'COUNTY' ),
+                                            ( 'fips', 'INTEGER', None ),
+                                            ( 'state', 'TEXT', 'STNAME' ),
+                                            ( 'county_name', 'TEXT', 'CTYNAME' ),
+                                            ( 'county', 'TEXT', None ),
+                                            ( 'population_2010', 'INTEGER',
+                                                'CENSUS2010POP' ),
+                                            ( 'population', 'INTEGER',
+                                                'POPESTIMATE2019' ) ],
+                                'key' : [ 'state_fips', 'county_fips' ],
+                                'indexes' : [ [ 'state', 'county' ], [ 'fips' ],
+                                                [ 'line' ] ] } }
+
+# int lines upserted by each executemany( )
+BATCH_LINES = 50000
+
+def connect_database( path = 'covid_data/covid.sqlite' ):
+    """ This function opens the database, making its tables and indexes if they
+    don't exist yet. """
+    # ARGUMENT path -> str path of the database file; DEFAULT
+
+    # RETURN sqlite3.Connection( ) object
+
+    connection = sqlite3.connect( path )
+    connection.execute( 'PRAGMA synchronous = NORMAL' )
+
+    with connection:
+
+        connection.execute( 'CREATE TABLE IF NOT EXISTS sources ( name TEXT PRIMARY KEY, '
+                            'path TEXT, size INTEGER, mtime_ns INTEGER, lines INTEGER )' )
+
+        for name, schema in SCHEMAS.items( ):
+
+            columns = ', '.join( f'{column} {"TEXT" if kind == "DATE" else kind}'
+                                for ( column, kind, field ) in schema[ 'columns' ] )
+            connection.execute( f'CREATE TABLE IF NOT EXISTS {name} ( {columns}, '
+                                f'PRIMARY KEY ( {", ".join( schema[ "key" ] )} ))' )
+
+            for columns in schema[ 'indexes' ]:
+                connection.execute( f'CREATE INDEX IF NOT EXISTS '
+                                    f'{name}_{"_".join( columns )} ON {name} '
+                                    f'( {", ".join( columns )} )' )
+
+    return connection
+
+def load_tables( connection, names = None, tablesPath = 'covid_data' ):
+    """ This function loads the tab-delimited tables that have changed since they
+    were last loaded. """
+    # ARGUMENT connection -> sqlite3.Connection( ) object
+    # ARGUMENT names -> list of str table names; DEFAULT all of SCHEMAS
+    # ARGUMENT tablesPath -> str path of the tab-delimited tables; DEFAULT
+
+    # RETURN dict { str table name : int lines loaded, or None if unchanged }; a
+    #   table that doesn't exist is left out
+
+    loaded = { }
+
+    for name in names or SCHEMAS:
+
+        path = find_data_file( f'{tablesPath}/{name}.txt' )
+
+        if name in SCHEMAS and os.path.exists( path ):
+            loaded[ name ] = load_table( connection, name, path )
+
+    # let the query planner know the new sizes of the tables and indexes
+    if any( loaded.values( )):
+        connection.execute( 'ANALYZE' )
+
+    return loaded
+
+def load_table( connection, name, path ):
+    """ This function upserts the lines of a tab-delimited table into its table in
+    the database, unless the file hasn't changed since it was last loaded. """
+    # ARGUMENT connection -> sqlite3.Connection( ) object
+    # ARGUMENT name -> str table name (a key of SCHEMAS)
+    # ARGUMENT path -> str path of the tab-delimited table
+
+    # RETURN int lines read, or None if the file was already loaded
+
+    stats = os.stat( path )
+    signature = ( path, stats.st_size, stats.st_mtime_ns )
+
+    if connection.execute( 'SELECT path, size, mtime_ns FROM sources WHERE name = ?',
+                            ( name, )).fetchone( ) == signature:
+        return None
+
+    schema = SCHEMAS[ name ]
+    columns = [ column for ( column, kind, field ) in schema[ 'columns' ] ]
+    values = [ column for column in columns if column not in schema[ 'key' ] ]
+
+    # a line already there is only written again if one of its values changed
+    statement = ( f'INSERT INTO {name} ( {", ".join( columns )} ) '
+                f'VALUES ( {", ".join( "?" for column in columns )} ) '
+                f'ON CONFLICT ( {", ".join( schema[ "key" ] )} ) DO UPDATE SET '
+                + ', '.join( f'{column} = excluded.{column}' for column in values )
+                + ' WHERE ' + ' OR '.join( f'{column} IS NOT excluded.{column}'
+                                            for column in values ))
+
+    # the keys of the lines read are kept in a temporary table, so that the lines
+    # upstream has removed can be found and deleted
+    keys = ', '.join( schema[ 'key' ] )
+    keyColumns = [ columns.index( column ) for column in schema[ 'key' ] ]
+    keyStatement = ( f'INSERT OR IGNORE INTO temp.loaded_keys ( {keys} ) '
+                    f'VALUES ( {", ".join( "?" for column in keyColumns )} )' )
+
+    connection.execute( 'DROP TABLE IF EXISTS temp.loaded_keys' )
+    connection.execute( f'CREATE TEMP TABLE loaded_keys ( {keys}, '
+                        f'PRIMARY KEY ( {keys} )) WITHOUT ROWID' )
+
+    lines = 0
+
+    with connection, open_data_file( path ) as fileIn:
+
+        header = next( fileIn, '' ).rstrip( '\n' ).split( '\t' )
+        batch = [ ]
+
+        for line in fileIn:
+
+            line = line.rstrip( '\n' )
+
+            if not line:
+                continue
+
+            lines += 1
+            batch.append( convert_line( name, schema, header, line.split( '\t' ), lines ))
+
+            if len( batch ) == BATCH_LINES:
+                load_batch( connection, statement, keyStatement, keyColumns, batch )
+                batch = [ ]
+
+        load_batch( connection, statement, keyStatement, keyColumns, batch )
+
+        # lines whose keys are no longer in the table are gone upstream
+        connection.execute( f'DELETE FROM {name} WHERE NOT EXISTS ( SELECT 1 FROM '
+                            f'temp.loaded_keys AS k WHERE '
+                            + ' AND '.join( f'k.{column} IS {name}.{column}'
+                                            for column in schema[ 'key' ] ) + ' )' )
+        connection.execute( 'INSERT OR REPLACE INTO sources VALUES ( ?, ?, ?, ?, ? )',
+                            ( name, *signature, lines ))
+
+    connection.execute( 'DROP TABLE temp.loaded_keys' )
+
+    return lines
+
+def load_batch( connection, statement, keyStatement, keyColumns, batch ):
+    """ This function upserts a batch of lines and keeps their keys. """
+    # ARGUMENT connection -> sqlite3.Connection( ) object
+    # ARGUMENT statement -> str upsert statement of the table
+    # ARGUMENT keyStatement -> str statement that keeps a key
+    # ARGUMENT keyColumns -> list of int positions of the key columns in a line
+    # ARGUMENT batch -> list of tuples of values in the order of the columns
+
+    # RETURN nothing
+
+    connection.executemany( statement, batch )
+    connection.executemany( keyStatement, ( [ values[ i ] for i in keyColumns ]
+                                            for values in batch ))
+
+    return
+
+def convert_line( name, schema, header, fields, line ):
+    """ This function converts the fields of a line of a table to the typed values
+    of its columns. """
+    # ARGUMENT name -> str table name
+    # ARGUMENT schema -> dict of the table in SCHEMAS
+    # ARGUMENT header -> list of str field names of the table
+    # ARGUMENT fields -> list of str fields of the line
+    # ARGUMENT line -> int number of the line in the table, from 1
+
+    # RETURN tuple of values in the order of the columns
+
+    record = dict( zip( header, fields ))
+    values = [ ]
+
+    for ( column, kind, field ) in schema[ 'columns' ]:
+
+        if field:
+            values.append( convert_value( record.get( field, '' ), kind ))
+
+        elif column == 'line':
+            values.append( line )
+
+        # the census counties are looked up by their normalized name (see 
+        # geography.py) and by their five-digit FIPS code
+        elif column == 'county':
+            values.append( normalize_county_name( record.get( 'CTYNAME', '' )))
+
+        elif column == 'fips':
+            values.append( convert_value( record.get( 'STATE', '' )
+                                        + record.get( 'COUNTY', '' ), kind ))
+
+    return tuple( values )
+
+def convert_value( text, kind ):
+    """ This function converts a field to the type of its column. A blank field is
+    NULL, and a field that doesn't convert is kept as text. """
+    # ARGUMENT text -> str field
+    # ARGUMENT kind -> str column type
+
+    # RETURN int, float, str or None
+
+    if not text:
+        return None
+
+    try:
+        if kind == 'INTEGER':
+            return int( text )
+
+        if kind == 'REAL':
+            return float( text )
+
+    except ValueError:
+        return text
+
+    # a The Atlantic date (e.g. 20200401) gets hyphens (e.g. 2020-04-01)
+    if kind == 'DATE' and len( text ) == 8 and text.isdigit( ):
+        return f'{text[ : 4 ]}-{text[ 4 : 6 ]}-{text[ 6 : ]}'
+
+    return text
+
+def criteria_clause( criteria, stateColumn = 'state', countyColumn = 'county' ):
+    """ This function turns ( State, County ) criteria into a WHERE clause. An
+    entry of None (or '') for either matches everything, as in the parsing
+    script. """
+    # ARGUMENT criteria -> list of tuples ( str State, str County )
+    # ARGUMENT stateColumn -> str column of the state; DEFAULT
+    # ARGUMENT countyColumn -> str column of the county; DEFAULT
+
+    # RETURN tuple ( str condition, list of str parameters )
+
+    conditions = [ ]
+    parameters = [ ]
+
+    for ( state, county ) in criteria:
+
+        if state and county:
+            conditions.append( f'( {stateColumn} = ? AND {countyColumn} = ? )' )
+            parameters += [ state, county ]
+
+        elif state:
+            conditions.append( f'{stateColumn} = ?' )
+            parameters.append( state )
+
+        elif county:
+            conditions.append( f'{countyColumn} = ?' )
+            parameters.append( county )
+
+        # a criterion that matches everything makes the others moot
+        else:
+            return ( '1', [ ] )
+
+    return ( ' OR '.join( conditions ) or '0', parameters )
+
+def date_clause( startDate = None, endDate = None ):
+    """ This function turns a range of dates (both ends included) into a WHERE
+    clause on the date column. """
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT none
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT none
+
+    # RETURN tuple ( str condition, list of str parameters )
+
+    conditions = [ ]
+    parameters = [ ]
+
+    if startDate:
+        conditions.append( 'date >= ?' )
+        parameters.append( startDate )
+
+    if endDate:
+        conditions.append( 'date <= ?' )
+        parameters.append( endDate )
+
+    return ( ' AND '.join( conditions ) or '1', parameters )
+
+def query_nyt_counties( connection, criteria, startDate = None, endDate = None ):
+    """ This generator yields the NY Times county lines that meet any of the
+    criteria, within a range of dates, by date and then state and county. """
+    # ARGUMENT connection -> sqlite3.Connection( ) object
+    # ARGUMENT criteria -> list of tuples ( str State, str County )
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+
+    # YIELD tuple ( str date, str State, str County, int FIPS or None, 
+    #   int cases or None, int deaths or None )
+
+    ( condition, parameters ) = criteria_clause( criteria )
+    ( dates, dateParameters ) = date_clause( startDate, endDate )
+
+    yield from connection.execute( 'SELECT date, state, county, fips, cases, deaths '
+                                    f'FROM nyt_us_counties WHERE ( {condition} ) '
+                                    f'AND {dates} ORDER BY date, state, county', 
+                                    parameters + dateParameters )
+
+    return
+
+def query_census_counties( connection, criteria ):
+    """ This generator yields the US Census lines that meet any of the criteria, in
+    the order of the table. """
+    # ARGUMENT connection -> sqlite3.Connection( ) object
+    # ARGUMENT criteria -> list of tuples ( str State, str County )
+
+    # YIELD tuple ( str State, str County, int population or None )
+
+    ( condition, parameters ) = criteria_clause( criteria )
+
+    yield from connection.execute( 'SELECT state, county, population '
+                                    f'FROM usc_counties_2019 WHERE {condition} '
+                                    'ORDER BY line', parameters )
+
+    return
+
+def query_atlantic_us( connection, startDate = None, endDate = None ):
+    """ This generator yields the The Atlantic USA lines within a range of 
+    dates, by date. """
+    # ARGUMENT connection -> sqlite3.Connection( ) object
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+
+    # YIELD tuple ( str date, positive, hospitalized, icu, ventilator, deaths ); a
+    #   count is an int or None
+
+    ( dates, parameters ) = date_clause( startDate, endDate )
+
+    yield from connection.execute( 'SELECT date, positive, hospitalized_cumulative, '
+                                    'icu_cumulative, ventilator_cumulative, death '
+                                    f'FROM atl_historic_us WHERE {dates} '
+                                    'ORDER BY date', parameters )
+
+    return
+
+def query_atlantic_states( connection, postalCodes = None, startDate = None, 
+                            endDate = None ):
+    """ This generator yields the The Atlantic state lines of some states within a
+    range of dates, by date and then state. """
+    # ARGUMENT connection -> sqlite3.Connection( ) object
+    # ARGUMENT postalCodes -> list of str two-letter state codes; DEFAULT all
+    # ARGUMENT startDate -> str first date as YYYY-MM-DD; DEFAULT the first
+    # ARGUMENT endDate -> str last date as YYYY-MM-DD; DEFAULT the last
+
+    # YIELD tuple ( str date, str postal code, positive, hospitalized, icu,
+    #   ventilator, deaths ); a count is an int or None
+
+    condition = '1'
+
+    if postalCodes is not None:
+        condition = f'state IN ( {", ".join( "?" for code in postalCodes )} )'
+
+    ( dates, parameters ) = date_clause( startDate, endDate )
+
+    yield from connection.execute( 'SELECT date, state, positive, '
+                                    'hospitalized_cumulative, icu_cumulative, '
+                                    'ventilator_cumulative, death '
+                                    f'FROM atl_historic_states WHERE {condition} '
+                                    f'AND {dates} ORDER BY date, state', 
+                                    ( postalCodes or [ ] ) + parameters )
+
+    return
+
+def atlantic_postal_codes( connection ):
+    """ This function lists the state codes in the The Atlantic states table. """
+    # ARGUMENT connection -> sqlite3.Connection( ) object
+
+    # RETURN list of str two-letter state codes
+
+    return [ code for ( code, ) in connection.execute(
+                                'SELECT DISTINCT state FROM atl_historic_states' ) ]
+
+def query_mask_use( connection ):
+    """ This generator yields the NY Times mask-use estimates of every county. """
+    # ARGUMENT connection -> sqlite3.Connection( ) object
+
+    # YIELD tuple ( int FIPS, never, rarely, sometimes, frequently, always ); a
+    #   share is a float or None
+
+    yield from connection.execute( 'SELECT fips, never, rarely, sometimes, frequently, '
+                                    'always FROM nyt_mask_use' )
+
+    return
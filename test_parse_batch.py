@@ -0,0 +1,154 @@
+# test_parse_batch
+""" These tests run the batch mode of the parsing script on a few lines of each
+dataset. Run them with python -m unittest test_parse_batch. """
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from parse_datasets import parse_batch
+from sqlite_store import connect_database, load_tables
+
+# a few lines of each dataset, as the update script writes them
+NYT_LINES = [ 'date\tcounty\tstate\tfips\tcases\tdeaths',
+                '2020-03-01\tAdams\tWisconsin\t55001\t1\t0',
+                '2020-03-01\tDane\tWisconsin\t55025\t5\t1',
+                '2020-03-02\tAdams\tOhio\t39001\t2\t0',
+                '2020-03-02\tAdams\tWisconsin\t55001\t3\t0',
+                '2020-03-02\tDane\tWisconsin\t55025\t7\t1' ]
+
+CENSUS_HEADER = [ 'SUMLEV', 'REGION', 'DIVISION', 'STATE', 'COUNTY', 'STNAME',
+                    'CTYNAME', 'CENSUS2010POP', 'ESTIMATESBASE2010',
+                    *( f'POPESTIMATE{year}' for year in range( 2010, 2020 )) ]
+
+CENSUS_ROWS = [ [ '040', '2', '3', '55', '000', 'Wisconsin', 'Wisconsin', '5822434' ],
+                [ '050', '2', '3', '55', '001', 'Wisconsin', 'Adams County', '20220' ],
+                [ '050', '2', '3', '55', '025', 'Wisconsin', 'Dane County', '546695' ],
+                [ '040', '2', '3', '39', '000', 'Ohio', 'Ohio', '11689100' ],
+                [ '050', '2', '3', '39', '001', 'Ohio', 'Adams County', '27698' ]]
+
+US_LINES = [ 'date\tstates\tpositive\tnegative\tpending\thospitalizedCurrently\t'
+                'hospitalizedCumulative\tinIcuCurrently\tinIcuCumulative\t'
+                'onVentilatorCurrently\tonVentilatorCumulative\trecovered\t'
+                'dateChecked\tdeath',
+                '20200302\t56\t100\t\t\t\t3\t\t\t\t\t\t\t1',
+                '20200301\t56\t50\t\t\t\t2\t\t\t\t\t\t\t0' ]
+
+STATES_HEADER = [ 'date', 'state', 'positive', 'negative', 'pending',
+                    'hospitalizedCurrently', 'hospitalizedCumulative',
+                    'inIcuCurrently', 'inIcuCumulative', 'onVentilatorCurrently',
+                    'onVentilatorCumulative', 'recovered', 'dataQualityGrade',
+                    'lastUpdateEt', 'dateModified', 'checkTimeEt', 'death' ]
+
+STATES_ROWS = [ [ '20200302', 'WI', '10', *( [ '' ] * 13 ), '1' ],
+                [ '20200302', 'OH', '4', *( [ '' ] * 13 ), '0' ],
+                [ '20200301', 'WI', '6', *( [ '' ] * 13 ), '0' ]]
+
+class Test_Parse_Batch( unittest.TestCase ):
+    """ Tests of parse_batch( ). """
+
+    def setUp( self ):
+        """ Writes the datasets to a temporary directory. """
+
+        self.directory = tempfile.TemporaryDirectory( )
+        self.path = self.directory.name
+
+        census = [ CENSUS_HEADER ] + [ row + [ row[ -1 ] ] * 11 for row in CENSUS_ROWS ]
+
+        for name, lines in ( ( 'nyt_us_counties', NYT_LINES ),
+                            ( 'usc_counties_2019', [ '\t'.join( row )
+                                                    for row in census ] ),
+                            ( 'atl_historic_us', US_LINES ),
+                            ( 'atl_historic_states', [ '\t'.join( row ) for row
+                                            in [ STATES_HEADER ] + STATES_ROWS ] )):
+            with open( f'{self.path}/{name}.txt', 'w' ) as fileOut:
+                fileOut.write( '\n'.join( lines ) + '\n' )
+
+        return
+
+    def tearDown( self ):
+        """ Deletes the temporary directory. """
+
+        self.directory.cleanup( )
+
+        return
+
+    def run_batch( self, groups, databasePath = None ):
+        """ Runs the batch mode on the datasets and gives the tables of each group. """
+        # ARGUMENT groups -> dict { str group name : list of tuples ( str State,
+        #   str County ) }
+        # ARGUMENT databasePath -> str path of the SQLite database to query instead
+        #   of the tables; DEFAULT
+
+        # RETURN dict { str group name : dict { str file name : list of str lines }}
+
+        output = f'{self.path}/batch'
+
+        with contextlib.redirect_stdout( io.StringIO( )):
+            names = parse_batch( groups, outputPath = output,
+                                nytPath = f'{self.path}/nyt_us_counties.txt',
+                                censusPath = f'{self.path}/usc_counties_2019.txt',
+                                usPath = f'{self.path}/atl_historic_us.txt',
+                                statesPath = f'{self.path}/atl_historic_states.txt',
+                                useCache = False, databasePath = databasePath )
+
+        tables = { }
+
+        for name in names:
+            for fileName in os.listdir( f'{output}/{name}' ):
+                with open( f'{output}/{name}/{fileName}' ) as fileIn:
+                    tables.setdefault( name, { } )[ fileName ] = fileIn.read( ).splitlines( )
+
+        return tables
+
+    def test_county_only_group( self ):
+        """ A group of a county in every state has the counties of that name and a
+        state table of the USA only, and doesn't get the states of other groups. """
+
+        tables = self.run_batch( { 'adams' : [ ( None, 'Adams' ) ],
+                                    'dane' : [ ( 'Wisconsin', 'Dane' ) ] } )
+
+        counties = tables[ 'adams' ][ 'county_cases_and_deaths.txt' ]
+        self.assertEqual( counties[ 0 ].split( '\t' ), [ 'CASES', 'Ohio', 'Wisconsin' ] )
+        self.assertEqual( counties[ 3 ].split( '\t' ), [ '2020-03-02', '2', '3' ] )
+
+        states = tables[ 'adams' ][ 'state_cases_and_deaths.txt' ]
+        self.assertEqual( states[ 0 ].split( '\t' ), [ '' ] + [ 'USA' ] * 5 + [ '' ] )
+        self.assertNotIn( 'Wisconsin', '\n'.join( states ))
+        self.assertNotIn( 'Ohio', '\n'.join( states ))
+
+        states = tables[ 'dane' ][ 'state_cases_and_deaths.txt' ]
+        self.assertIn( 'Wisconsin', states[ 0 ] )
+        self.assertNotIn( 'Ohio', states[ 0 ] )
+
+        return
+
+    def test_database_after_removed_line( self ):
+        """ A line removed upstream is removed from the database too, which then
+        gives the same tables as the tab-delimited tables. """
+
+        databasePath = f'{self.path}/covid.sqlite'
+        groups = { 'wisconsin' : [ ( 'Wisconsin', None ) ],
+                    'adams' : [ ( None, 'Adams' ) ] }
+
+        with contextlib.closing( connect_database( databasePath )) as connection:
+            load_tables( connection, tablesPath = self.path )
+
+        with open( f'{self.path}/nyt_us_counties.txt', 'w' ) as fileOut:
+            fileOut.write( '\n'.join( line for line in NYT_LINES
+                                    if not line.startswith( '2020-03-01\tDane' )) + '\n' )
+
+        with contextlib.closing( connect_database( databasePath )) as connection:
+            load_tables( connection, tablesPath = self.path )
+
+        tables = self.run_batch( groups )
+
+        counties = tables[ 'wisconsin' ][ 'county_cases_and_deaths.txt' ]
+        self.assertNotIn( '5', counties[ 2 ] )
+        self.assertEqual( self.run_batch( groups, databasePath ), tables )
+
+        return
+
+if __name__ == '__main__':
+    unittest.main( )
@@ -0,0 +1,161 @@
+# test_update_csv_file
+""" These tests bring a CSV file up to date from a local web server that honours
+conditional and range requests, the way the data sources do. Run them with
+python -m unittest test_update_csv_file. """
+import http.server
+import tempfile
+import threading
+import unittest
+
+from update_covid_data import Covid_Data, Retry_Policy, drop_connection, update_csv_file
+
+# lines of an append-only dataset, long enough that the overlap is only its tail
+CSV_LINES = [ 'date,county,state,fips,cases,deaths' ] + [
+                f'2020-03-{day:02},"Adams, {n}",Wisconsin,55001,{day * n},{n}'
+                for day in range( 1, 31 ) for n in range( 10 ) ]
+
+class Csv_Handler( http.server.BaseHTTPRequestHandler ):
+    """ This object answers a GET with the server's body, a 304 Not Modified for a
+    current ETag and a 206 Partial Content for a range. """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET( self ):
+        """ Sends the body, or its tail, or nothing. """
+
+        body = self.server.body
+        etag = f'"{len( body )}-{hash( body )}"'
+        self.server.requests.append( ( self.headers.get( 'If-None-Match' ),
+                                        self.headers.get( 'Range' )))
+
+        if self.headers.get( 'If-None-Match' ) == etag:
+            self.send_response( 304 )
+            self.send_header( 'ETag', etag )
+            self.end_headers( )
+
+            return
+
+        start = 0
+
+        if self.headers.get( 'Range', '' ).startswith( 'bytes=' ):
+            start = int( self.headers[ 'Range' ][ 6 : ].rstrip( '-' ))
+
+        self.send_response( 206 if start else 200 )
+        self.send_header( 'ETag', etag )
+        self.send_header( 'Content-Length', str( len( body ) - start ))
+
+        if start:
+            self.send_header( 'Content-Range',
+                                f'bytes {start}-{len( body ) - 1}/{len( body )}' )
+
+        self.end_headers( )
+        self.wfile.write( body[ start : ] )
+
+        return
+
+    def log_message( self, *args ):
+        """ Keeps the requests out of the test output. """
+
+        return
+
+class Test_Update_Csv_File( unittest.TestCase ):
+    """ Tests of update_csv_file( ). """
+
+    def setUp( self ):
+        """ Starts the web server in a thread. """
+
+        self.directory = tempfile.TemporaryDirectory( )
+        self.path = self.directory.name
+
+        self.server = http.server.ThreadingHTTPServer( ( '127.0.0.1', 0 ), Csv_Handler )
+        self.server.body = b''
+        self.server.requests = [ ]
+        self.host = f'127.0.0.1:{self.server.server_port}'
+        self.url = f'http://{self.host}/us-counties.csv'
+
+        threading.Thread( target = self.server.serve_forever, daemon = True ).start( )
+
+        return
+
+    def tearDown( self ):
+        """ Stops the web server and deletes the temporary directory. """
+
+        drop_connection( 'http', self.host )
+        self.server.shutdown( )
+        self.server.server_close( )
+        self.directory.cleanup( )
+
+        return
+
+    def serve( self, lines ):
+        """ Makes the server give a new version of the file. """
+        # ARGUMENT lines -> list of str CSV lines
+
+        self.server.body = ( '\n'.join( lines ) + '\n' ).encode( 'utf-8' )
+        self.server.requests = [ ]
+
+        return
+
+    def update( self, name = 'nyt_us_counties' ):
+        """ Updates a CSV file and its table from the server. """
+        # ARGUMENT name -> str name of the files; DEFAULT
+
+        # RETURN tuple ( str status of the update, bytes CSV, bytes table )
+
+        ff = Covid_Data( name, 'us-counties.csv', appendOnly = True )
+        status = update_csv_file( ff, self.url, f'{self.path}/{name}.csv',
+                                    Retry_Policy( maxAttempts = 1 ),
+                                    f'{self.path}/{name}.txt' )
+
+        files = [ ]
+
+        for extension in ( 'csv', 'txt' ):
+            with open( f'{self.path}/{name}.{extension}', 'rb' ) as fileIn:
+                files.append( fileIn.read( ))
+
+        return ( status, *files )
+
+    def test_conditional_and_range_requests( self ):
+        """ A file is downloaded, then found unchanged, then appended to, which gives
+        the same CSV and table as a full download. """
+
+        self.serve( CSV_LINES[ : 200 ] )
+        ( status, csv, table ) = self.update( )
+
+        self.assertEqual( status, 'downloaded' )
+        self.assertEqual( csv, self.server.body )
+        self.assertEqual( table.splitlines( )[ 1 ],
+                        b'2020-03-01\tAdams, 0\tWisconsin\t55001\t0\t0' )
+
+        self.assertEqual( self.update( )[ 0 ], 'unchanged' )
+
+        self.serve( CSV_LINES )
+        ( status, csv, table ) = self.update( )
+
+        self.assertEqual( status, 'appended' )
+        self.assertEqual( len( self.server.requests ), 1 )
+        self.assertTrue( self.server.requests[ 0 ][ 1 ] )
+        self.assertEqual( self.update( 'full' ), ( 'downloaded', csv, table ))
+
+        return
+
+    def test_changed_overlap( self ):
+        """ A file whose tail was rewritten upstream is downloaded in full. """
+
+        self.serve( CSV_LINES[ : 200 ] )
+        self.update( )
+
+        self.serve( CSV_LINES[ : 199 ] + [ CSV_LINES[ 199 ].replace( 'Adams', 'Dane' ) ]
+                    + CSV_LINES[ 200 : ] )
+        ( status, csv, table ) = self.update( )
+
+        self.assertEqual( status, 'downloaded' )
+        self.assertEqual( [ request[ 1 ] is None for request in self.server.requests ],
+                            [ False, True ] )
+        self.assertEqual( csv, self.server.body )
+        self.assertEqual( self.update( 'full' ), ( 'downloaded', csv, table ))
+
+        return
+
+if __name__ == '__main__':
+    unittest.main( )
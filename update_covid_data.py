@@ -4,21 +4,109 @@
 web sites and converts the CSVs to tab-delimited tables.
 
 The CSV data are written to the directory /csv_data/, and tab-delimited text files 
-are written to /covid_data/. """
-import urllib.request
+are written to /covid_data/. Tables flagged as columnar also get a binary columnar
+cache (see columnar_cache.py) that the parsing script reads instead of the text,
+and tables ordered by date get a date index (see date_index.py) that lets it read
+only a range of dates.
+
+Each CSV file has a small metadata file next to it (e.g. csv_data/us.csv.meta) with
+the ETag and Last-Modified headers of the download, so later updates only request
+files that have changed upstream and, for append-only sources, only the new bytes 
+at the end of the file.
+
+The files are fetched concurrently by a small pool of threads. Each thread keeps
+one connection open per host, and failed requests are retried with exponential
+backoff and jitter until the update's deadline.
+
+Downloads are streamed: the response is written to the CSV file and converted to
+the tab-delimited table by the csv module as it arrives, so memory use doesn't
+grow with the size of a file. Each file is written under a temporary name and
+renamed into place only once it is complete. 
+
+The CSV files and tables can be stored compressed with gzip or zstd (see
+compressed_files.py) by setting compression in main( ); they are compressed as they
+are written, and the parsing script finds them by their plain paths. 
+
+Each fetch and conversion is measured (time, rows, bytes, attempts and memory; see
+instrumentation.py) and can be appended to a JSON-lines log by setting metricsLog
+in main( ), so a slow update can be traced to the network or to the conversion.
+Any stage can also be profiled with cProfile or tracemalloc. 
+
+The tables can also be loaded into a SQLite database (see sqlite_store.py) by
+setting databasePath in main( ); the parsing script can then query it instead of
+scanning the tables. 
+
+The NY Times counties can also be rolled up by state, Census division, Census 
+region and for the USA into a cube next to their table (see rollup_cube.py) by 
+setting rollUp in main( ); the cube is then rebuilt whenever the counties or the
+Census table change. """
+import concurrent.futures
+import csv
+import http.client
+import io
+import json
+import os
+import random
+import shutil
 import ssl
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from columnar_cache import load_columnar_cache, write_columnar_cache
+from date_index import load_date_index, write_date_index
+from rollup_cube import load_rollup_cube, write_rollup_cube
+from compressed_files import ( compression_of, find_data_file, open_data_file,
+                                read_size_and_tail )
+from instrumentation import RECORDER, current_stage, file_size, stage
+from sqlite_store import connect_database, load_tables
+
+# base URLs for API/Git pages keyed by the prefix of the file names
+BASE_URLS = { 'nyt' : 'https://raw.githubusercontent.com/nytimes/covid-19-data/master',
+                'atl' : 'https://covidtracking.com/api',
+                'usc' : 'http://www2.census.gov/programs-surveys/popest/datasets/2010-2019/counties/totals' }
+                
+# number of bytes already on disk that are requested again with a range request
+# to check that the upstream file was only appended to
+RANGE_OVERLAP = 4096
+
+# int bytes read from a response at a time
+CHUNK_SIZE = 1 << 20
+
+# int data lines kept in Covid_Data.data as a preview of a streamed file
+PREVIEW_LINES = 5
+
+# HTTP statuses that are worth another attempt
+RETRY_STATUSES = { 408, 429, 500, 502, 503, 504 }
+
+# table of the US Census counties, which is placed in /covid_data/ by hand
+CENSUS_TABLE = 'usc_counties_2019'
+
+# connections kept open by each thread { tuple ( str scheme, str host ) : connection }
+CONNECTIONS = threading.local( )
 
 class Covid_Data( ):
     """ This object stores the basic information about the CSV files from data
     sources. """
 
-    def __init__( self, fileName, csvFileName ):
+    def __init__( self, fileName, csvFileName, columnar = False, appendOnly = False,
+                    dateIndexed = False ):
         """ Initializes the object. """
     
         self.file_name = fileName
         self.csv = csvFileName
+        self.columnar = columnar    # bool also write a columnar cache of the table
+        self.date_indexed = dateIndexed # bool also write a date index of the table
+        self.append_only = appendOnly   # bool upstream only appends to the file
+        self.status = None  # str 'downloaded', 'appended' or 'unchanged' after update
         self.fields = [ ]
-        self.data = [ ]
+        self.data = [ ]     # list of the first few data lines of a streamed file
+        
+        # fetch report
+        self.attempts = 0       # int HTTP requests made
+        self.bytes_received = 0 # int bytes of response bodies
+        self.duration = 0.0     # float seconds spent fetching
         
         return
         
@@ -34,144 +122,796 @@ class Covid_Data( ):
         print( )
         
         return
+        
+    def fetch_report( self ):
+        """ Creates a one-line report of the last fetch of a data set. """
+        
+        return ( f'{self.file_name:<22}{self.status or "FAILED":<12}'
+                f'{self.bytes_received:>14,} bytes{self.duration:>9.2f} s'
+                f'{self.attempts:>4} attempt(s)' )
+                
+class Retry_Policy( ):
+    """ This object stores how hard to try to fetch the files: the number of 
+    attempts per request, the exponential backoff between attempts and the total 
+    time allowed for the update. """
+    
+    def __init__( self, maxAttempts = 8, baseDelay = 0.5, maxDelay = 30.0,
+                    deadline = 600.0, timeout = 60.0 ):
+        """ Initializes the object. """
+        
+        self.max_attempts = maxAttempts # int requests before giving up
+        self.base_delay = baseDelay     # float seconds before the first retry
+        self.max_delay = maxDelay       # float seconds cap on the backoff
+        self.deadline = deadline        # float seconds allowed for the update
+        self.timeout = timeout          # float seconds socket timeout
+        self.expires = None             # float time.monotonic( ) of the deadline
+        
+        return
+        
+    def start( self ):
+        """ Starts the clock on the deadline. """
+        
+        self.expires = time.monotonic( ) + self.deadline
+        
+        return
+        
+    def remaining( self ):
+        """ Gives the seconds left before the deadline. """
+    
+        if self.expires is None:
+            self.start( )
+            
+        return self.expires - time.monotonic( )
+        
+    def backoff( self, attempt ):
+        """ Gives a random delay ("full jitter") before the next attempt. """
+        # ARGUMENT attempt -> int attempts made so far
+        
+        return random.uniform( 0, min( self.max_delay,
+                                        self.base_delay * 2 ** ( attempt - 1 )))
 
 def main( ):
 
     # list of COVID data
-    filesFields = [ Covid_Data( 'nyt_us_counties', 'us-counties.csv' ),
-                    Covid_Data( 'nyt_us_states', 'us-states.csv' ),
-                    Covid_Data( 'nyt_us', 'us.csv' ),
+    filesFields = [ Covid_Data( 'nyt_us_counties', 'us-counties.csv', columnar = True,
+                                appendOnly = True, dateIndexed = True ),
+                    Covid_Data( 'nyt_us_states', 'us-states.csv', appendOnly = True,
+                                dateIndexed = True ),
+                    Covid_Data( 'nyt_us', 'us.csv', appendOnly = True, 
+                                dateIndexed = True ),
                     Covid_Data( 'nyt_mask_use', 'mask-use/mask-use-by-county.csv' ),
                     Covid_Data( 'nyt_excess_deaths', 'excess-deaths/deaths.csv' ),
                     
-                    Covid_Data( 'atl_historic_us', 'v1/us/daily.csv' ),
-                    Covid_Data( 'atl_historic_states', 'v1/states/daily.csv' ) ] 
+                    Covid_Data( 'atl_historic_us', 'v1/us/daily.csv', dateIndexed = True ),
+                    Covid_Data( 'atl_historic_states', 'v1/states/daily.csv', 
+                                dateIndexed = True ) ] 
+                    
+    # extension of the compression to store the files with: '' (none), '.gz' or
+    # '.zst' (which needs the zstandard package)
+    compression = ''
+    
+    # the measurements of each fetch, conversion and columnar cache can be appended
+    # to a JSON-lines file, e.g. 'covid_data/update_metrics.jsonl' (None for none)
+    metricsLog = None
+    
+    # stages to profile ('fetch', 'convert', 'columnar_cache', 'date_index', 'rollup'
+    # or 'all'), and the profiler: 'cprofile' or 'tracemalloc'; the dumps are written
+    # to /profiles/
+    profileStages = [ ]
+    profileMode = 'cprofile'
+    
+    RECORDER.configure( metricsLog, profileStages, profileMode )
+    
+    # path of the SQLite database to load the tables into as well, e.g. 
+    # 'covid_data/covid.sqlite' (None for none)
+    databasePath = None
+    
+    # roll the NY Times counties up by state, division, region and USA into a cube
+    # for the parsing script (True), which takes another pass over the counties
+    # table whenever it changes (False for no cube)
+    rollUp = False
 
-    import_all_data_from_urls( filesFields )
-    make_tab_delimited_tables( filesFields )
+    import_all_data_from_urls( filesFields, compression = compression )
+    make_tab_delimited_tables( filesFields, compression = compression )
+    
+    if rollUp:
+        update_rollup_cube( )
+    
+    if databasePath:
+        load_database( filesFields, databasePath )
     
     exit( )
     
-def make_tab_delimited_tables( filesFields, outputPath = 'covid_data' ):
-    """ This function uses the CSV-formatted files to make tab-delimited tables. """
+def make_tab_delimited_tables( filesFields, outputPath = 'covid_data', csvPath = 'csv_data',
+                                compression = '' ):
+    """ This function uses the CSV-formatted files to make tab-delimited tables and
+    the columnar caches and date indexes of the tables that have them. A table that
+    is already newer than its CSV file (e.g. it was converted as it was downloaded)
+    is left as it is, but its cache and index are rebuilt if it has changed. """
     # ARGUMENT filesFields -> ref to list of Covid_Date( ) objects
     # ARGUMENT outputPath -> str file path to write; DEFAULT
+    # ARGUMENT csvPath -> str path to CSV-formatted files; DEFAULT
+    # ARGUMENT compression -> str extension of the compression of the tables, '', 
+    #   '.gz' or '.zst'; DEFAULT none
     
     # RETURN nothing (filesFields is mutable)
 
-    def get_csv_data( ff, path = 'csv_data' ):
-        """ This subroutine gets the CSV-formatted data from a file if it hasn't
-        already been stored in a Covid_Data( ) object. """
-        # ARGUMENT ff -> ref to Covid_Data( ) object
-        # ARGUMENT path -> str path to CSV-formatted files
+    # traverse the list of Covid_Data( ) objects
+    for ff in filesFields:
+    
+        # the newest CSV file, however it is compressed
+        csvFile = find_data_file( f'{csvPath}/{ff.file_name}.csv' )
+        tablePath = f'{outputPath}/{ff.file_name}.txt{compression}'
+    
+        # write the data as a tab-delimited table if the CSV file has changed
+        if not is_newer( tablePath, csvFile ):
         
-        # RETURN nothing (ff is mutable)
+            with stage( 'convert', dataset = ff.file_name ) as s:
+            
+                with open_data_file( csvFile, 'rb' ) as fileIn:
+                    with Atomic_Output( tablePath, 'w' ) as tableOut:
+                        write_tab_delimited_rows( ff, read_csv_rows( fileIn ), tableOut )
+                        
+                s.bytes_read = file_size( csvFile )
+                s.bytes_written = file_size( tablePath )
+                
+        # rebuild the columnar cache if the table has changed
+        if ff.columnar and not load_columnar_cache( tablePath ):
         
-        # read the data from the file
-        with open( f'{path}/{ff.file_name}.csv' ) as fileIn:
-            lines = fileIn.read( ).split( '\n' )
+            with stage( 'columnar_cache', dataset = ff.file_name ):
+                write_columnar_cache( tablePath )
+                
+        # rebuild the date index if the table has changed (a compressed table can't
+        # be sought into, so it has none)
+        if ff.date_indexed and not compression and not load_date_index( tablePath ):
         
-        # update the Covid_Data( ) object
-        ff.fields = lines[ 0 ].split( ',' )
-        ff.data = [ line.split( ',' ) for line in lines[ 1 : ]
-                        if line ]
+            with stage( 'date_index', dataset = ff.file_name ):
+                write_date_index( tablePath )
+    
+    return
+    
+def update_rollup_cube( tablesPath = 'covid_data' ):
+    """ This function rebuilds the rollup cube of the NY Times counties table if it
+    or the US Census table has changed. """
+    # ARGUMENT tablesPath -> str path to the tab-delimited tables; DEFAULT
+    
+    # RETURN str path of the cube directory, or None if it was current or there is
+    #   no Census table
+    
+    path = f'{tablesPath}/nyt_us_counties.txt'
+    censusPath = f'{tablesPath}/{CENSUS_TABLE}.txt'
+    
+    if load_rollup_cube( path, censusPath ):
+        return None
         
-        return
-
-    # traverse the list of Covid_Data( ) objects
-    for ff in filesFields:
+    if not os.path.exists( find_data_file( censusPath )):
+        print( f'No rollup cube without the Census table {censusPath}' )
+        return None
+        
+    print( 'Rolling up the county data...', end = ' ' )
+    
+    with stage( 'rollup', dataset = 'nyt_us_counties' ) as s:
     
-        # if the data aren't available from being recently downloaded, then
-        # retreive them from a file
-        if not ff.data or not ff.fields:
-            get_csv_data( ff )
+        cubePath = write_rollup_cube( path, censusPath )
+        s.rows_out = sum( load_rollup_cube( path, censusPath ).meta[ 'rows' ].values( ))
         
-        # write the data as a tab-delimited table    
-        with open( f'{outputPath}/{ff.file_name}.txt', 'w' ) as fileOut:
+    print( 'YES' )
+    
+    return cubePath
+    
+def load_database( filesFields, databasePath = 'covid_data/covid.sqlite', 
+                    tablesPath = 'covid_data' ):
+    """ This function upserts the tab-delimited tables (and the US Census table) that
+    have changed into the SQLite database. """
+    # ARGUMENT filesFields -> ref to list of Covid_Date( ) objects
+    # ARGUMENT databasePath -> str path of the database file; DEFAULT
+    # ARGUMENT tablesPath -> str path to the tab-delimited tables; DEFAULT
+    
+    # RETURN dict returned by sqlite_store.load_tables( )
+    
+    print( 'Loading the tables into the database...', end = ' ' )
+    
+    names = [ ff.file_name for ff in filesFields ] + [ CENSUS_TABLE ]
+    
+    with stage( 'database', path = databasePath ) as s:
+    
+        connection = connect_database( databasePath )
         
-            print( '\t'.join( ff.fields ), file = fileOut )
+        try:
+            loaded = load_tables( connection, names, tablesPath )
+        finally:
+            connection.close( )
             
-            for line in ff.data:
-                print( '\t'.join( line ), file = fileOut )
+        s.rows_in = sum( lines or 0 for lines in loaded.values( ))
     
-    return
+    print( 'YES' )
+    
+    return loaded
     
-def import_all_data_from_urls( filesFields, outputPath = 'csv_data' ):
-    """ This is the function that retrieves the data for each file. """
+def import_all_data_from_urls( filesFields, outputPath = 'csv_data', baseUrlsDct = None,
+                                maxWorkers = 4, policy = None, tablesPath = 'covid_data',
+                                compression = '' ):
+    """ This is the function that retrieves the data for each file. The files are
+    fetched concurrently and reported as they finish, and each one is converted to
+    a tab-delimited table as it is downloaded. """
     # ARGUMENT filesFields -> ref to list of Covid_Date( ) objects
     # ARGUMENT outputPath -> str path to output folder; DEFAULT
+    # ARGUMENT baseUrlsDct -> dict { str file name prefix : str base URL } to use
+    #   instead of BASE_URLS (e.g. a local stand-in server); DEFAULT
+    # ARGUMENT maxWorkers -> int files fetched at once; DEFAULT
+    # ARGUMENT policy -> Retry_Policy( ) object; DEFAULT
+    # ARGUMENT tablesPath -> str path to the tab-delimited tables, or None to leave 
+    #   the conversion to make_tab_delimited_tables( ); DEFAULT
+    # ARGUMENT compression -> str extension of the compression of the CSV files and
+    #   tables, '', '.gz' or '.zst'; DEFAULT none
     
     # RETURN nothing (filesFields is mutable)
 
     print( 'UPDATE THE COVID DATA CSV FILES' )
     
     # base URLs for API/Git pages
-    baseUrlsDct = { 'nyt' : 'https://raw.githubusercontent.com/nytimes/covid-19-data/master',
-                    'atl' : 'https://covidtracking.com/api',
-                    'usc' : 'http://www2.census.gov/programs-surveys/popest/datasets/2010-2019/counties/totals' }
-    
-    # get data from each file
-    for ff in filesFields:
+    if not baseUrlsDct:
+        baseUrlsDct = BASE_URLS
+        
+    if not policy:
+        policy = Retry_Policy( )
+        
+    policy.start( )
     
-        print( f'Requesting data for {ff.file_name}...', end = ' ' )
+    def fetch( ff ):
+        """ This subroutine fetches one file and times it. """
+        # ARGUMENT ff -> ref to Covid_Data( ) object
         
+        # RETURN ff
+    
         # get path to data
         filePrefix = ff.file_name[ : 3 ]
         baseUrl = baseUrlsDct[ filePrefix ]
         path = ff.csv
         url = f'{baseUrl}/{path}'
+        
+        ff.attempts = 0
+        ff.bytes_received = 0
+        start = time.perf_counter( )
+        
+        with stage( 'fetch', dataset = ff.file_name, url = url ) as s:
                 
-        # get data from the internet
-        lines = import_from_url( url )
+            # get data from the internet
+            ff.status = update_csv_file( ff, url, 
+                                        f'{outputPath}/{ff.file_name}.csv{compression}', 
+                                        policy, tablesPath and 
+                                        f'{tablesPath}/{ff.file_name}.txt{compression}' )
+            
+            # the threads run at once, so the bytes are counted for this file 
+            # rather than for the process
+            s.attempts = ff.attempts
+            s.bytes_read = ff.bytes_received
+            s.bytes_written = ( file_size( f'{outputPath}/{ff.file_name}.csv{compression}' )
+                                if ff.status in ( 'downloaded', 'appended' ) else 0 )
+            s.labels[ 'result' ] = ff.status or 'failed'
+            
+        ff.duration = time.perf_counter( ) - start
         
-        # if there is data then write it to the text file
-        if lines:
+        return ff
+    
+    # get data from each file
+    with concurrent.futures.ThreadPoolExecutor( max_workers = maxWorkers ) as pool:
+    
+        for ff in concurrent.futures.as_completed( [ pool.submit( fetch, ff ) 
+                                                        for ff in filesFields ] ):
+            print( ff.result( ).fetch_report( ))
             
-            with open( f'{outputPath}/{ff.file_name}.csv', 'w' ) as fileOut:
-                for line in lines:
-                    print( line, file = fileOut )
+    print( )
+    print( f'{sum( ff.status is not None for ff in filesFields )} of '
+            f'{len( filesFields )} files updated, '
+            f'{sum( ff.bytes_received for ff in filesFields ):,} bytes received' )
+    
+    print( ); print( )
+    
+    return
+    
+def update_csv_file( ff, url, path, policy = None, tablePath = None ):
+    """ This function brings a CSV file (and its tab-delimited table) up to date 
+    with its upstream copy. The request is conditional on the ETag and 
+    Last-Modified of the last download, and an append-only file requests only the
+    bytes past the end of the local copy. """
+    # ARGUMENT ff -> ref to Covid_Data( ) object
+    # ARGUMENT url -> str internet address of the data
+    # ARGUMENT path -> str path of the CSV file (compressed if it ends with .gz or 
+    #   .zst)
+    # ARGUMENT policy -> Retry_Policy( ) object; DEFAULT
+    # ARGUMENT tablePath -> str path of the tab-delimited table to write as the
+    #   data arrive; DEFAULT
+    
+    # RETURN str 'downloaded', 'appended' or 'unchanged', or None if no data were
+    #   obtained (ff is mutable)
+    
+    meta = read_fetch_metadata( path )
+    headers = { }   # dict { str header : str value } of the request
+    size = 0        # int bytes of the local copy (uncompressed)
+    overlap = 0     # int bytes of the local copy requested again
+    tail = b''      # bytes of the local copy requested again
+    
+    if meta and os.path.exists( path ):
+    
+        if meta.get( 'etag' ):
+            headers[ 'If-None-Match' ] = meta[ 'etag' ]
+        if meta.get( 'last_modified' ):
+            headers[ 'If-Modified-Since' ] = meta[ 'last_modified' ]
+            
+        # ask for the tail of an append-only file, starting a little before the
+        # end of the local copy so that the overlap can be checked
+        if ff.append_only:
+        
+            ( size, tail ) = read_size_and_tail( path, RANGE_OVERLAP )
+            overlap = len( tail )
+            headers[ 'Range' ] = f'bytes={size - overlap}-'
+                
+    def consume( response ):
+        """ This subroutine streams a full or partial response to disk. """
+        # ARGUMENT response -> http.client.HTTPResponse( ) object
+        
+        # RETURN str status of the update, or None if the response can't be used
+        
+        if response.status == 200:
+        
+            stream_csv_response( ff, response, path, tablePath )
+            
+            return 'downloaded'
+            
+        if response.status != 206:
+            response.read( )
+            
+            return None
+        
+        # the new bytes are only appended if the response starts where it was
+        # asked to, the overlap matches the local copy and that copy ends with a
+        # whole line
+        contentRange = response.getheader( 'Content-Range', '' )
+        start = f'bytes {size - overlap}-'
+        
+        if not contentRange.startswith( start ) or not tail.endswith( b'\n' ):
+            return None
+            
+        ff.bytes_received += overlap
+        
+        if read_exactly( response, overlap ) != tail:
+            return None
+            
+        if not response.peek( 1 ):
+            return 'unchanged'
+            
+        # a table that isn't current is rebuilt in full by make_tab_delimited_tables( )
+        stream_csv_response( ff, response, path, 
+                            tablePath if is_newer( tablePath, path ) else None,
+                            append = True )
+            
+        return 'appended'
+    
+    response = request_url( url, headers, policy, ff, consume )
+    
+    # fall back to a full download if the partial response can't be used
+    if headers and response and response[ 0 ] != 304 and not response[ 2 ]:
+        response = request_url( url, policy = policy, ff = ff, consume = consume )
+    
+    if not response:
+        return None
+        
+    ( status, responseHeaders, result ) = response
+    
+    if status == 304:
+        return 'unchanged'
+        
+    if result:
+        write_fetch_metadata( path, url, responseHeaders )
                     
-            # get fields and parsed data
-            ff.fields = lines[ 0 ].split( ',' )
-            ff.data = [ line.split( ',' ) for line in lines[ 1 : ]
-                                if line ]
+    return result
+    
+def stream_csv_response( ff, response, path, tablePath = None, append = False ):
+    """ This function copies a response to a CSV file while the csv module parses
+    the same bytes into a tab-delimited table. Both files are replaced only once 
+    the whole response has been read. """
+    # ARGUMENT ff -> ref to Covid_Data( ) object
+    # ARGUMENT response -> file-like object of bytes
+    # ARGUMENT path -> str path of the CSV file
+    # ARGUMENT tablePath -> str path of the tab-delimited table; DEFAULT
+    # ARGUMENT append -> bool the response continues the existing files; DEFAULT
+    
+    # RETURN nothing (ff is mutable)
+    
+    with Atomic_Output( tablePath, 'w', append ) as tableOut:
+        with Atomic_Output( path, 'wb', append ) as csvOut:
+        
+            source = Tee_Reader( response, csvOut, ff )
+            
+            # without a table the bytes only need to be copied
+            if not tableOut:
+                while source.read( CHUNK_SIZE ):
+                    pass
                     
-            print( 'YES' )  # report success!!
+                return
+            
+            rows = read_csv_rows( source )
+            
+            # a continuation has no header line
+            if append:
+            
+                count = 0
+                
+                for count, row in enumerate( rows, 1 ):
+                    tableOut.write( format_tab_delimited_row( row ))
+                    
+                current_stage( ).count( rows_in = count, rows_out = count )
+                
+            else:
+                write_tab_delimited_rows( ff, rows, tableOut )
+                
+    return
+    
+def read_csv_rows( fileIn ):
+    """ This function parses a stream of UTF-8 CSV bytes into rows, a chunk at a 
+    time. Quoted fields may hold commas, quotes and line breaks. """
+    # ARGUMENT fileIn -> binary file-like object
+    
+    # RETURN iterator of lists of str fields
+    
+    text = io.TextIOWrapper( io.BufferedReader( fileIn, CHUNK_SIZE ), 
+                            encoding = 'utf-8', errors = 'replace', newline = '' )
+                            
+    return csv.reader( text )
+    
+def write_tab_delimited_rows( ff, rows, fileOut ):
+    """ This function writes a header line and rows of CSV data as a tab-delimited
+    table, keeping the header and the first few rows in a Covid_Data( ) object. """
+    # ARGUMENT ff -> ref to Covid_Data( ) object
+    # ARGUMENT rows -> iterator of lists of str fields
+    # ARGUMENT fileOut -> text file to write
+    
+    # RETURN nothing (ff is mutable)
+    
+    ff.fields = next( rows, [ ] )
+    ff.data = [ ]
+    
+    fileOut.write( format_tab_delimited_row( ff.fields ))
+    
+    count = 0   # int rows written, counted for the stage that writes them
+    
+    for count, row in enumerate( rows, 1 ):
+    
+        if len( ff.data ) < PREVIEW_LINES and row:
+            ff.data.append( row )
+            
+        fileOut.write( format_tab_delimited_row( row ))
+        
+    current_stage( ).count( rows_in = count, rows_out = count )
+        
+    return
+    
+def format_tab_delimited_row( row ):
+    """ This function formats a row of fields as a line of a tab-delimited table. 
+    Tabs and line breaks inside a field are replaced by spaces so that the line 
+    can still be split on tabs. Empty rows are dropped. """
+    # ARGUMENT row -> list of str fields
+    
+    # RETURN str line with its line break, or '' for an empty row
+    
+    if not row:
+        return ''
+        
+    line = '\t'.join( row )
+    
+    if line.count( '\t' ) != len( row ) - 1 or '\n' in line or '\r' in line:
+        line = '\t'.join( field.replace( '\t', ' ' ).replace( '\r', ' ' )
+                            .replace( '\n', ' ' ) for field in row )
+    
+    return f'{line}\n'
+    
+def read_exactly( fileIn, size ):
+    """ This function reads a number of bytes from a stream, which may take more
+    than one read. """
+    # ARGUMENT fileIn -> binary file-like object
+    # ARGUMENT size -> int bytes to read
+    
+    # RETURN bytes (fewer only at the end of the stream)
+    
+    chunks = [ ]
+    
+    while size > 0:
+    
+        chunk = fileIn.read( size )
+        
+        if not chunk:
+            break
+            
+        chunks.append( chunk )
+        size -= len( chunk )
+        
+    return b''.join( chunks )
+    
+class Tee_Reader( io.RawIOBase ):
+    """ This object reads from a stream while copying every byte to a file and 
+    counting the bytes against a Covid_Data( ) object. """
+    
+    def __init__( self, source, copy, ff = None ):
+        """ Initializes the object. """
+        
+        self.source = source    # binary file-like object to read
+        self.copy = copy        # binary file to write
+        self.ff = ff            # Covid_Data( ) object or None
+        
+        return
+        
+    def readable( self ):
+        """ The object can be read. """
+        
+        return True
+        
+    def readinto( self, buffer ):
+        """ Reads into a buffer and copies what was read. """
+        
+        size = self.source.readinto( buffer )
+        
+        self.copy.write( memoryview( buffer )[ : size ] )
+        
+        if self.ff:
+            self.ff.bytes_received += size
+            
+        return size
+    
+class Atomic_Output( ):
+    """ This context manager writes a file under a temporary name in the same
+    directory and renames it into place only if the block finishes; otherwise, 
+    the temporary file is removed and the original file is untouched. A path 
+    ending with .gz or .zst is compressed as it is written. With no path it does
+    nothing and gives None. """
+    
+    def __init__( self, path, mode = 'w', append = False ):
+        """ Initializes the object. """
+        # ARGUMENT path -> str path of the file, or None
+        # ARGUMENT mode -> str 'w' or 'wb'; DEFAULT
+        # ARGUMENT append -> bool start from a copy of the existing file; DEFAULT
+        
+        self.path = path
+        self.mode = mode
+        self.append = append
+        self.file = None
+        
+        return
+        
+    def __enter__( self ):
+    
+        if not self.path:
+            return None
+            
+        directory = os.path.dirname( self.path ) or '.'
+        handle, self.temp_path = tempfile.mkstemp( dir = directory, 
+                                    prefix = f'.{os.path.basename( self.path )}.',
+                                    suffix = compression_of( self.path ))
+        os.close( handle )
+        
+        # keep the permissions of the file being replaced rather than the private 
+        # ones of a temporary file
+        try:
+            os.chmod( self.temp_path, os.stat( self.path ).st_mode & 0o7777 )
+        except FileNotFoundError:
+            os.chmod( self.temp_path, 0o644 )
+        
+        if self.append:
+            shutil.copyfile( self.path, self.temp_path )
+            
+        self.file = open_data_file( self.temp_path, self.mode.replace( 'w', 'a' ),
+                            **( { } if 'b' in self.mode else { 'newline' : '' } ))
+        
+        return self.file
+        
+    def __exit__( self, excType, excValue, traceback ):
+    
+        if not self.file:
+            return False
+            
+        self.file.close( )
+        
+        if excType:
+            os.remove( self.temp_path )
             
         else:
-            print( 'NO' )   # report no update obtained
+            os.replace( self.temp_path, self.path )
+            
+        return False
     
-    print( ); print( )
+def read_fetch_metadata( path ):
+    """ This function reads the metadata saved with a CSV file when it was last
+    downloaded. """
+    # ARGUMENT path -> str path of the CSV file
     
+    # RETURN dict { str : str } or None if there is no metadata
+    
+    try:
+        with open( f'{path}.meta' ) as fileIn:
+            return json.load( fileIn )
+            
+    except ( OSError, ValueError ):
+        return None
+        
+def write_fetch_metadata( path, url, responseHeaders ):
+    """ This function saves the validators of a download next to the CSV file. """
+    # ARGUMENT path -> str path of the CSV file
+    # ARGUMENT url -> str internet address of the data
+    # ARGUMENT responseHeaders -> headers of the HTTP response
+    
+    # RETURN nothing
+    
+    meta = { 'url' : url, 'etag' : responseHeaders.get( 'ETag' ),
+            'last_modified' : responseHeaders.get( 'Last-Modified' ),
+            'size' : os.path.getsize( path ) }
+            
+    with open( f'{path}.meta', 'w' ) as fileOut:
+        json.dump( meta, fileOut )
+        
     return
+    
+def is_newer( path, otherPath ):
+    """ This function tells whether a file exists and is at least as new as 
+    another. """
+    # ARGUMENT path -> str path of the file
+    # ARGUMENT otherPath -> str path of the file to compare against
+    
+    # RETURN bool
+    
+    try:
+        return os.path.getmtime( path ) >= os.path.getmtime( otherPath )
+        
+    except OSError:
+        return False
         
 def import_from_url( url, sinkShelf = 0):
     """ Get text from a web page with all line breaks removed. """
     # ARGUMENT url -> str internet address of the data
-    # ARGUMENT sinkShelf -> int counter for attempts; DEFAULT
+    # ARGUMENT sinkShelf -> int counter for attempts already made; DEFAULT
     
     # RETURN
     lines = [ ] # list str HTML formated web page file lines
     
-    # ignore SSL certificate errors
-    ctx = ssl.create_default_context()
-    ctx.check_hostname = False
-    ctx.verify_mode = ssl.CERT_NONE    
+    policy = Retry_Policy( )
+    policy.max_attempts = max( 1, policy.max_attempts - sinkShelf )
+    
+    response = request_url( url, policy = policy )
+    
+    if response and response[ 0 ] == 200:
+        lines = response[ 2 ].decode( 'utf-8' ).split( '\n' )
+        
+        return lines
+            
+    return None
+    
+def request_url( url, headers = None, policy = None, ff = None, consume = None ):
+    """ Make an HTTP GET request over a kept-alive connection, following redirects.
+    Connection errors and server errors are retried with exponential backoff and 
+    jitter until the policy runs out of attempts or time. Any other status (e.g. 
+    304 Not Modified or 416 Range Not Satisfiable) is a response like any other. """
+    # ARGUMENT url -> str internet address of the data
+    # ARGUMENT headers -> dict { str header : str value } of the request; DEFAULT
+    # ARGUMENT policy -> Retry_Policy( ) object; DEFAULT
+    # ARGUMENT ff -> ref to Covid_Data( ) object whose attempts and bytes are 
+    #   counted; DEFAULT
+    # ARGUMENT consume -> function that takes the response in place of reading the
+    #   whole body, e.g. to stream it to disk; DEFAULT
+    
+    # RETURN tuple ( int status, response headers, bytes body or result of consume )
+    #   or None
+    
+    if not policy:
+        policy = Retry_Policy( )
+    
+    attempt = 0     # int attempts made for this request
+    redirects = 0   # int redirects followed
+    
+    while attempt < policy.max_attempts and policy.remaining( ) > 0:
+    
+        attempt += 1
+        if ff:
+            ff.attempts += 1
+            
+        parts = urllib.parse.urlsplit( url )
+        target = parts.path + ( f'?{parts.query}' if parts.query else '' )
+        connection = get_connection( parts.scheme, parts.netloc, 
+                                        min( policy.timeout, policy.remaining( )))
     
-    # make at least ten requests for data before giving up
-    while sinkShelf < 100:
-
         try:
-            f = urllib.request.urlopen( url, context = ctx )
-            data = f.read( )
-            lines = data.decode( 'utf-8').split( '\n' )
+            connection.request( 'GET', target, headers = headers or { } )
+            response = connection.getresponse( )
+            location = response.getheader( 'Location' )
+            
+            # a body that is needed is read in full or handed over to consume;
+            # anything else is drained so that the connection can be reused
+            if ( consume and response.status not in RETRY_STATUSES 
+                and not ( response.status in ( 301, 302, 303, 307, 308 ) and location )):
+                body = consume( response )
                 
-            return lines
+            else:
+                body = response.read( )
+                
+                if ff:
+                    ff.bytes_received += len( body )
             
-        except:
-            sinkShelf += 1
+        except ( OSError, http.client.HTTPException ):
+            drop_connection( parts.scheme, parts.netloc )
+            response = None
+            
+        if response:
+        
+            # a connection can only be reused once its response has been read
+            if response.will_close or not response.isclosed( ):
+                drop_connection( parts.scheme, parts.netloc )
+                
+            # follow a redirect without counting it as a failed attempt
+            if response.status in ( 301, 302, 303, 307, 308 ) and location and redirects < 5:
+                url = urllib.parse.urljoin( url, location )
+                redirects += 1
+                attempt -= 1
+                continue
+                
+            if response.status not in RETRY_STATUSES:
+                return ( response.status, response.headers, body )
+                
+        # wait before trying again, unless that would pass the deadline
+        delay = policy.backoff( attempt )
+        
+        if attempt >= policy.max_attempts or delay >= policy.remaining( ):
+            break
+            
+        time.sleep( delay )
             
     return None
     
+def get_connection( scheme, host, timeout ):
+    """ This function gives the calling thread's open connection to a host, making
+    one if there isn't one yet. """
+    # ARGUMENT scheme -> str 'http' or 'https'
+    # ARGUMENT host -> str host and optional port
+    # ARGUMENT timeout -> float seconds socket timeout
+    
+    # RETURN http.client.HTTPConnection( ) object
+    
+    if not hasattr( CONNECTIONS, 'pool' ):
+        CONNECTIONS.pool = { }
+        
+    connection = CONNECTIONS.pool.get( ( scheme, host ))
+    
+    if not connection:
+    
+        if scheme == 'https':
+        
+            # ignore SSL certificate errors
+            ctx = ssl.create_default_context()
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE    
+            
+            connection = http.client.HTTPSConnection( host, timeout = timeout, 
+                                                        context = ctx )
+        else:
+            connection = http.client.HTTPConnection( host, timeout = timeout )
+            
+        CONNECTIONS.pool[ ( scheme, host ) ] = connection
+        
+    connection.timeout = timeout
+    
+    return connection
+    
+def drop_connection( scheme, host ):
+    """ This function closes the calling thread's connection to a host after an 
+    error or when the server won't keep it open. """
+    # ARGUMENT scheme -> str 'http' or 'https'
+    # ARGUMENT host -> str host and optional port
+    
+    # RETURN nothing
+    
+    connection = getattr( CONNECTIONS, 'pool', { } ).pop( ( scheme, host ), None )
+    
+    if connection:
+        connection.close( )
+        
+    return
+    
 if __name__ == '__main__':
     main( )
\ No newline at end of file